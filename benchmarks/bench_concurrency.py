@@ -0,0 +1,117 @@
+"""Benchmark read throughput of a shared InMemoryDatabase as reader threads are added.
+
+Compares the reader-writer lock against a single exclusive lock, with and
+without a concurrent writer, then measures the longest write stall while
+full listings run. Run from the repository root:
+
+    python -m benchmarks.bench_concurrency --threads 1 2 4 8
+"""
+import argparse
+import threading
+import time
+from types import SimpleNamespace
+
+from database import InMemoryDatabase
+from models import ProductCreate, ProductUpdate
+
+
+def product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}",
+        description="Synthetic benchmark product",
+        price=float(i % 1000),
+        category=f"Category {i % 50}",
+        tags=[f"tag{i % 20}"],
+    )
+
+
+def build_db(size: int, exclusive: bool) -> InMemoryDatabase:
+    db = InMemoryDatabase()
+    db.clear()
+    db.bulk_products([("create", None, product(i)) for i in range(size)])
+    if exclusive:
+        lock = threading.Lock()
+        db._lock = SimpleNamespace(read=lock, write=lock)
+    return db
+
+
+def reads_per_second(db: InMemoryDatabase, threads: int, seconds: float, writer: bool) -> float:
+    """Return filtered queries per second summed over ``threads`` readers."""
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def read(slot: int):
+        n = 0
+        while not stop.is_set():
+            db.query_products(category=f"Category {n % 50}", limit=20)
+            n += 1
+        counts[slot] = n
+
+    def write():
+        n = 0
+        while not stop.is_set():
+            db.update_product(n % len(db.products) + 1, ProductUpdate(price=float(n % 1000)))
+            n += 1
+
+    workers = [threading.Thread(target=read, args=(slot,)) for slot in range(threads)]
+    if writer:
+        workers.append(threading.Thread(target=write))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def write_stalls(db: InMemoryDatabase, seconds: float, listing: bool) -> tuple:
+    """Return writes per second and the slowest write, optionally while listings loop."""
+    stop = threading.Event()
+
+    def list_all():
+        while not stop.is_set():
+            db.get_all_products()
+
+    reader = threading.Thread(target=list_all)
+    if listing:
+        reader.start()
+    writes, slowest, n = 0, 0.0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        db.update_product(n % len(db.products) + 1, ProductUpdate(price=float(n % 1000)))
+        slowest = max(slowest, time.perf_counter() - start)
+        writes += 1
+        n += 1
+    stop.set()
+    if listing:
+        reader.join()
+    return writes / seconds, slowest
+
+
+def main():
+    """Print reads/s per thread count for each lock and writer combination, then write stalls."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'lock':>9} {'writer':>6} " + " ".join(f"{n:>5} thr" for n in args.threads))
+    for exclusive in (False, True):
+        db = build_db(args.size, exclusive)
+        for writer in (False, True):
+            rates = [reads_per_second(db, n, args.seconds, writer) for n in args.threads]
+            name = "exclusive" if exclusive else "rw"
+            print(f"{name:>9} {'yes' if writer else 'no':>6} " + " ".join(f"{rate:>9.0f}" for rate in rates))
+
+    db = build_db(args.size, exclusive=False)
+    for listing in (False, True):
+        rate, slowest = write_stalls(db, args.seconds, listing)
+        label = "with full listings looping" if listing else "alone"
+        print(f"updates {label}: {rate:.0f}/s, slowest {slowest * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
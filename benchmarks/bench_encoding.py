@@ -0,0 +1,85 @@
+"""Compare encode time and bytes on the wire for JSON, MessagePack and compressed variants.
+
+Encodes one listing of products the way GET /products does without the
+response cache, then compresses it at several gzip and zstd levels.
+Descriptions are drawn from a small vocabulary, so they compress about as
+well as real text rather than as well as identical strings. Run from the
+repository root:
+
+    python -m benchmarks.bench_encoding --size 10000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import fast_json
+import fast_msgpack
+from compression import ENCODINGS, Compressor
+from models import Product
+
+WORDS = (
+    "wireless compact durable premium steel cotton adjustable portable smart classic organic "
+    "waterproof lightweight ergonomic rechargeable stainless bamboo leather ceramic modular"
+).split()
+
+LEVELS = [("gzip", 1), ("gzip", 3), ("gzip", 6), ("gzip", 9), ("zstd", 1), ("zstd", 3), ("zstd", 6), ("zstd", 12)]
+
+
+def products(size: int) -> List[Product]:
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    return [
+        Product(
+            id=i,
+            name=f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}",
+            description=" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))),
+            price=round(rng.uniform(1, 500), 2),
+            category=f"Category {rng.randint(1, 50)}",
+            tags=rng.sample(WORDS, rng.randint(0, 4)),
+            in_stock=rng.random() < 0.8,
+            created_at=start + timedelta(seconds=rng.randint(0, 10 ** 8), microseconds=rng.randint(0, 999_999)),
+        )
+        for i in range(1, size + 1)
+    ]
+
+
+def best_time(function: Callable, repeat: int) -> float:
+    """Fastest of ``repeat`` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Print encode and compress time and size for each format."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000, help="products in the listing")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    listing = products(args.size)
+
+    print(f"{'format':<16} {'encode ms':>10} {'total ms':>9} {'bytes':>10} {'vs json':>8}")
+    json_size = None
+    for name, dumps in (("json", fast_json.dumps), ("msgpack", fast_msgpack.dumps)):
+        body = dumps(listing)
+        encode = best_time(lambda: dumps(listing), args.repeat)
+        json_size = json_size or len(body)
+        print(f"{name:<16} {encode * 1e3:>10.2f} {encode * 1e3:>9.2f} {len(body):>10} {len(body) / json_size:>8.2f}")
+        for encoding, level in LEVELS:
+            if encoding not in ENCODINGS:
+                continue
+            compressed = Compressor(encoding, level).compress(body)
+            compress = best_time(lambda: Compressor(encoding, level).compress(body), args.repeat)
+            print(
+                f"{f'{name}+{encoding}-{level}':<16} {encode * 1e3:>10.2f} {(encode + compress) * 1e3:>9.2f}"
+                f" {len(compressed):>10} {len(compressed) / json_size:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
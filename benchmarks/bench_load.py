@@ -0,0 +1,110 @@
+"""Load-test the API with async endpoints against the same endpoints declared sync.
+
+Requests go straight to the ASGI app, without a network, so the numbers
+isolate the framework and handler costs. Run from the repository root:
+
+    python -m benchmarks.bench_load --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+import main as api
+from database import InMemoryDatabase
+from models import Product, ProductCreate
+
+
+def new_product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}",
+        description="Synthetic benchmark product",
+        price=float(i % 1000),
+        category=f"Category {i % 50}",
+        tags=[f"tag{i % 20}"],
+    )
+
+
+def sync_app(db: InMemoryDatabase) -> FastAPI:
+    """The benchmarked endpoints as plain functions, which FastAPI runs in its threadpool."""
+    app = FastAPI()
+
+    @app.get("/products/{product_id}", response_model=Product)
+    def get_product(product_id: int):
+        product = db.get_product(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product
+
+    @app.get("/products", response_model=List[Product])
+    def get_products(limit: int = 20):
+        return db.query_products(limit=limit)[0]
+
+    @app.post("/products", response_model=Product)
+    def create_product(product: ProductCreate):
+        return db.create_product(product)
+
+    return app
+
+
+async def worker(client: httpx.AsyncClient, requests: int, size: int, seed: int, latencies: List[float]):
+    """Issue a read-heavy mix: 80% get by id, 15% first page, 5% create."""
+    rng = random.Random(seed)
+    for i in range(requests):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.80:
+            response = await client.get(f"/products/{rng.randint(1, size)}")
+        elif roll < 0.95:
+            response = await client.get("/products", params={"limit": 20})
+        else:
+            response = await client.post("/products", json=new_product(i).model_dump())
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def run(app: FastAPI, concurrency: int, requests: int, size: int) -> dict:
+    """Return throughput and latency percentiles for ``requests`` spread over ``concurrency`` clients."""
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, requests // concurrency, size, seed, latencies) for seed in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1e3,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1e3,
+    }
+
+
+def main():
+    """Print requests/s and p50/p99 latency for sync and async endpoints."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=8_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    args = parser.parse_args()
+
+    db = InMemoryDatabase()
+    db.clear()
+    db.bulk_products([("create", None, new_product(i)) for i in range(args.size)])
+    api.db = db
+    apps = {"sync": sync_app(db), "async": api.app}
+
+    print(f"{'concurrency':>11} {'endpoints':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.concurrency:
+        for name, app in apps.items():
+            result = asyncio.run(run(app, concurrency, args.requests, args.size))
+            print(f"{concurrency:>11} {name:>9} {result['rps']:>8.0f} {result['p50']:>8.2f} {result['p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark memory per product for Product objects against compact columns.
+
+Measures the product table alone and a whole InMemoryDatabase, indexes
+included, with tracemalloc. Run from the repository root:
+
+    python -m benchmarks.bench_memory --size 200000
+"""
+import argparse
+import gc
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable
+
+from compact import CompactProducts
+from database import InMemoryDatabase
+from models import Product, ProductCreate
+
+
+def product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}",
+        description=f"Synthetic product number {i}",
+        price=float(i % 1000),
+        category=f"Category {i % 50}",
+        tags=[f"tag{i % 20}", f"tag{i % 7}"],
+    )
+
+
+def allocated(build: Callable[[], object]) -> int:
+    """Bytes still allocated by ``build()``'s result once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def fill_table(table, size: int):
+    start = datetime(2024, 1, 1)
+    for i in range(1, size + 1):
+        table[i] = Product(id=i, **product(i).model_dump(), created_at=start + timedelta(seconds=i))
+    return table
+
+
+def fill_database(size: int, compact: bool) -> InMemoryDatabase:
+    db = InMemoryDatabase(compact=compact)
+    db.clear()
+    batch = 10_000
+    for start in range(0, size, batch):
+        db.bulk_products([("create", None, product(i)) for i in range(start, min(size, start + batch))])
+    return db
+
+
+def main():
+    """Print bytes per product for each representation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200_000)
+    args = parser.parse_args()
+    size = args.size
+
+    objects = allocated(lambda: fill_table({}, size)) / size
+    columns = allocated(lambda: fill_table(CompactProducts(), size)) / size
+    print(f"product table: {objects:>6.0f} B/product as Product objects, {columns:>5.0f} B/product compact "
+          f"({objects / columns:.1f}x smaller)")
+    objects = allocated(lambda: fill_database(size, compact=False)) / size
+    columns = allocated(lambda: fill_database(size, compact=True)) / size
+    print(f"whole database: {objects:>5.0f} B/product as Product objects, {columns:>5.0f} B/product compact "
+          f"({objects / columns:.1f}x smaller, indexes included)")
+
+
+if __name__ == "__main__":
+    main()
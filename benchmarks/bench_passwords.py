@@ -0,0 +1,105 @@
+"""Measure sign-up throughput and read latency while passwords are hashed.
+
+Sign-ups and product reads run at the same time against the ASGI app,
+with hashing inline on the event loop (workers 0) and on pools of worker
+processes. Run from the repository root:
+
+    python -m benchmarks.bench_passwords --workers 0 1 2 4
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+import httpx
+
+import main as api
+from benchmarks.bench_load import new_product
+from database import InMemoryDatabase
+from passwords import PasswordHasher
+
+
+async def sign_ups(client: httpx.AsyncClient, seconds: float, seed: int, counts: List[int]):
+    """Create users back to back until ``seconds`` have passed."""
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0)  # see reads
+        response = await client.post(
+            "/users", json={"name": f"User {seed}-{n}", "email": f"user{seed}-{n}@example.com", "password": "hunter22"}
+        )
+        if response.status_code == 200:
+            counts[0] += 1
+        else:
+            counts[1] += 1
+        n += 1
+
+
+async def reads(client: httpx.AsyncClient, seconds: float, size: int, latencies: List[float]):
+    """Get products by id back to back until ``seconds`` have passed."""
+    rng = random.Random(0)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        # In-process requests never wait on a socket; yield as a real one would,
+        # so the time counts any hash holding the loop when the request arrives
+        await asyncio.sleep(0)
+        response = await client.get(f"/products/{rng.randint(1, size)}")
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def run(signups: int, readers: int, seconds: float, size: int) -> dict:
+    counts = [0, 0]  # created, turned away
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(sign_ups(client, seconds, seed, counts) for seed in range(signups)),
+            *(reads(client, seconds, size, latencies) for _ in range(readers)),
+        )
+        # Inline hashes can hold the loop well past the deadline
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "signups": counts[0] / elapsed,
+        "busy": counts[1],
+        "reads": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1e3,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1e3,
+    }
+
+
+def main():
+    """Print sign-ups/s, reads/s and read latency per hashing pool size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--cost", type=int, default=14, help="scrypt cost, log2 of its iterations")
+    parser.add_argument("--signups", type=int, default=16, help="concurrent sign-up clients")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent read clients")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    db = InMemoryDatabase()
+    db.clear()
+    db.bulk_products([("create", None, new_product(i)) for i in range(args.size)])
+    api.db = db
+
+    print(f"{'workers':>7} {'sign-ups/s':>10} {'busy':>6} {'reads/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        api.password_hasher = PasswordHasher(workers=workers, cost=args.cost)
+        try:
+            result = asyncio.run(run(args.signups, args.readers, args.seconds, args.size))
+        finally:
+            api.password_hasher.close()
+        print(
+            f"{workers:>7} {result['signups']:>10.1f} {result['busy']:>6} {result['reads']:>8.0f}"
+            f" {result['p50']:>8.2f} {result['p99']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
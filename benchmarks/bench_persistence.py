@@ -0,0 +1,105 @@
+"""Benchmark WAL write throughput, recovery time and cold-start memory.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_persistence --size 1000000
+"""
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from typing import Tuple
+
+from database import InMemoryDatabase
+from models import ProductCreate
+from persistence import Persistence
+
+
+def product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}",
+        description=f"Synthetic product number {i}",
+        price=float(i % 1000),
+        category=f"Category {i % 50}",
+        tags=[f"tag{i % 20}"],
+    )
+
+
+def write_throughput(commit_interval: float, writes: int) -> float:
+    """Return single-product creates per second at a group commit interval."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        db = InMemoryDatabase(persistence=Persistence(data_dir, commit_interval=commit_interval))
+        start = time.perf_counter()
+        for i in range(writes):
+            db.create_product(product(i))
+        elapsed = time.perf_counter() - start
+        db.close()
+    return writes / elapsed
+
+
+def build_store(data_dir: str, size: int, tail: int):
+    """Fill ``data_dir`` with a snapshot of ``size`` products and ``tail`` WAL records."""
+    db = InMemoryDatabase(persistence=Persistence(data_dir, snapshot_every=size * 2))
+    db.clear()
+    batch = 10_000
+    for start in range(0, size, batch):
+        db.bulk_products([("create", None, product(i)) for i in range(start, min(size, start + batch))])
+    db.checkpoint(wait=True)
+    for i in range(tail):
+        db.create_product(product(i))
+    db.close()
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux only)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def cold_start(data_dir: str) -> Tuple[float, float, float, float, float]:
+    """Open ``data_dir`` and time the first reads; runs in a fresh process.
+
+    Returns seconds to open, RSS growth after opening, seconds for a first
+    point read, seconds for a first filtered query and RSS growth after it.
+    """
+    baseline = rss_mb()
+    start = time.perf_counter()
+    db = InMemoryDatabase(persistence=Persistence(data_dir))
+    opened = time.perf_counter() - start
+    rss_open = rss_mb() - baseline
+
+    start = time.perf_counter()
+    db.get_product(len(db.products) // 2)
+    point_read = time.perf_counter() - start
+
+    start = time.perf_counter()
+    db.query_products(category="Category 7", limit=100)
+    first_query = time.perf_counter() - start
+    rss_query = rss_mb() - baseline
+    db.close()
+    return opened, rss_open, point_read, first_query, rss_query
+
+
+def main():
+    """Print write throughput per commit interval and cold-start cost."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=10_000)
+    parser.add_argument("--writes", type=int, default=5_000)
+    args = parser.parse_args()
+
+    for interval in (0, 0.01, 0.05, 0.2):
+        print(f"commit interval {interval:>5}s: {write_throughput(interval, args.writes):>9.0f} creates/s")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        build_store(data_dir, args.size, args.tail)
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            opened, rss_open, point_read, first_query, rss_query = pool.apply(cold_start, (data_dir,))
+    print(f"opened {args.size} products + {args.tail} WAL records in {opened:.2f}s, +{rss_open:.0f} MB RSS")
+    print(f"first point read {point_read * 1e6:.0f}us; first filtered query {first_query:.2f}s "
+          f"(builds the indexes), +{rss_query:.0f} MB RSS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark primary-key lookup, update and delete as the catalog grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_primary_key --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+
+from database import InMemoryDatabase
+from models import ProductCreate, ProductUpdate
+
+
+def build_database(size: int) -> InMemoryDatabase:
+    """Create a database holding ``size`` synthetic products."""
+    db = InMemoryDatabase()
+    db.clear()
+    for i in range(size):
+        db.create_product(ProductCreate(
+            name=f"Product {i}",
+            description="Synthetic benchmark product",
+            price=float(i % 1000),
+            category=f"Category {i % 50}",
+        ))
+    return db
+
+
+def time_per_op(fn, ids) -> float:
+    """Return the mean time in microseconds of ``fn`` applied to each id."""
+    start = time.perf_counter()
+    for product_id in ids:
+        fn(product_id)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def run(size: int, ops: int) -> dict:
+    """Measure get/update/delete latency for a catalog of ``size`` rows."""
+    db = build_database(size)
+    rng = random.Random(size)
+    ids = rng.sample(range(1, size + 1), min(ops, size))
+    update = ProductUpdate(price=1.0)
+    return {
+        "get": time_per_op(db.get_product, ids),
+        "update": time_per_op(lambda product_id: db.update_product(product_id, update), ids),
+        "delete": time_per_op(db.delete_product, ids),
+    }
+
+
+def main():
+    """Print a latency table for each requested catalog size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--ops", type=int, default=1_000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'get us':>10} {'update us':>10} {'delete us':>10}")
+    for size in args.sizes:
+        result = run(size, args.ops)
+        print(f"{size:>10} {result['get']:>10.2f} {result['update']:>10.2f} {result['delete']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
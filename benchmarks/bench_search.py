@@ -0,0 +1,70 @@
+"""Benchmark BM25 product search on a synthetic catalog.
+
+Words are drawn from a Zipf-like vocabulary so that postings lists have a
+realistic spread of lengths. Run from the repository root:
+
+    python -m benchmarks.bench_search --size 1000000
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from database import InMemoryDatabase
+from models import ProductCreate
+
+
+def build_database(size: int, vocabulary: list, cum_weights: list, rng: random.Random) -> InMemoryDatabase:
+    """Create a database holding ``size`` products with random text."""
+    db = InMemoryDatabase()
+    db.clear()
+    for _ in range(size):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=15)
+        db.create_product(ProductCreate(
+            name=" ".join(words[:3]),
+            description=" ".join(words[3:]),
+            price=1.0,
+            category="Synthetic",
+        ))
+    return db
+
+
+def main():
+    """Print search latency percentiles for queries of varying selectivity."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = [f"word{rank}" for rank in range(args.vocabulary)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(args.vocabulary)))
+
+    start = time.perf_counter()
+    db = build_database(args.size, vocabulary, cum_weights, rng)
+    print(f"indexed {args.size} products in {time.perf_counter() - start:.1f}s")
+
+    # Word ranks by frequency: lower ranks have longer postings lists
+    mixes = {
+        "common + common": [(100, 1_000), (100, 1_000)],
+        "rare + common": [(5_000, args.vocabulary), (0, 100)],
+        "mid + mid": [(1_000, 5_000), (1_000, 5_000)],
+        "rare + rare": [(5_000, args.vocabulary), (5_000, args.vocabulary)],
+    }
+    for label, ranges in mixes.items():
+        latencies = []
+        for _ in range(args.queries):
+            query = " ".join(rng.choice(vocabulary[low:high]) for low, high in ranges)
+            started = time.perf_counter()
+            db.search_products(query, args.limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{label:>16}: median {statistics.median(latencies):.2f} ms, p99 {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
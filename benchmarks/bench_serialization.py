@@ -0,0 +1,79 @@
+"""Benchmark list-endpoint throughput with response_model validation against the fast path.
+
+``validated`` is GET /products returning models through ``response_model``,
+as the endpoints used to; ``fast`` is the API's endpoint with the response
+cache disabled, so every request encodes every item with orjson; ``cached``
+is the API as configured. Run from the repository root:
+
+    python -m benchmarks.bench_serialization --sizes 10000 100000
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+
+import main as api
+from database import InMemoryDatabase
+from models import Product, ProductCreate
+from response_cache import ResponseCache
+
+
+def new_product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}",
+        description="Synthetic benchmark product",
+        price=float(i % 1000),
+        category=f"Category {i % 50}",
+        tags=[f"tag{i % 20}", "benchmark"],
+    )
+
+
+def validated_app(db: InMemoryDatabase) -> FastAPI:
+    """GET /products serialized by FastAPI from the response model."""
+    app = FastAPI()
+
+    @app.get("/products", response_model=List[Product])
+    async def get_products():
+        return db.get_all_products()
+
+    return app
+
+
+async def requests_per_second(app: FastAPI, seconds: float) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        (await client.get("/products")).raise_for_status()
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            (await client.get("/products")).raise_for_status()
+            count += 1
+        return count / (time.perf_counter() - start)
+
+
+def main():
+    """Print full-list requests/s for each serialization path and catalog size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    cache = api.response_cache
+    print(f"{'products':>9} {'validated':>10} {'fast':>10} {'cached':>10}  (requests/s)")
+    for size in args.sizes:
+        db = InMemoryDatabase()
+        db.clear()
+        db.bulk_products([("create", None, new_product(i)) for i in range(size)])
+        api.db = db
+        validated = asyncio.run(requests_per_second(validated_app(db), args.seconds))
+        api.response_cache = ResponseCache(0)
+        fast = asyncio.run(requests_per_second(api.app, args.seconds))
+        api.response_cache = cache
+        cached = asyncio.run(requests_per_second(api.app, args.seconds))
+        print(f"{size:>9} {validated:>10.1f} {fast:>10.1f} {cached:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark write throughput of the sharded store as writer threads are added.
+
+Each writer mixes creates and updates. With the GIL only one thread runs
+Python at a time, so shards pay off on a free-threaded build, where
+writers to different shards no longer queue on one lock. Run from the
+repository root:
+
+    python -m benchmarks.bench_sharding --threads 1 2 4 8 --shards 1 4 16
+"""
+import argparse
+import threading
+import time
+
+from database import InMemoryDatabase, ShardedDatabase
+from models import ProductCreate, ProductUpdate
+from storage import Storage
+
+
+def product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}",
+        description="Synthetic benchmark product",
+        price=float(i % 1000),
+        category=f"Category {i % 50}",
+        tags=[f"tag{i % 20}"],
+    )
+
+
+def build_db(shards: int, size: int) -> Storage:
+    db = InMemoryDatabase() if shards == 1 else ShardedDatabase(shards)
+    db.clear()
+    db.bulk_products([("create", None, product(i)) for i in range(size)])
+    return db
+
+
+def writes_per_second(db: Storage, threads: int, seconds: float, size: int) -> float:
+    """Return writes per second summed over ``threads`` writers: 1 create per 4 updates."""
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def write(slot: int):
+        n = slot
+        while not stop.is_set():
+            if n % 5:
+                db.update_product(n % size + 1, ProductUpdate(price=float(n % 1000)))
+            else:
+                db.create_product(product(n))
+            n += threads
+        counts[slot] = (n - slot) // threads
+
+    workers = [threading.Thread(target=write, args=(slot,)) for slot in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def main():
+    """Print writes/s per writer thread count for each shard count."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    print(f"{'shards':>6} " + " ".join(f"{n:>5} thr" for n in args.threads))
+    for shards in args.shards:
+        db = build_db(shards, args.size)
+        rates = [writes_per_second(db, n, args.seconds, args.size) for n in args.threads]
+        print(f"{shards:>6} " + " ".join(f"{rate:>9.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Load-test the API over HTTP with one or more uvicorn worker processes.
+
+Each run starts the server as ``main.serve`` would, with the in-memory
+database owned by the parent and served to the workers over a socket,
+then drives it from several client processes. Run from the repository
+root:
+
+    python -m benchmarks.bench_workers --workers 1 2 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import httpx
+
+from benchmarks.bench_load import new_product
+
+SERVER = """
+import main
+main.serve(host="127.0.0.1", port={port}, workers={workers})
+"""
+
+
+async def client(base_url: str, seconds: float, concurrency: int, size: int, seed: int) -> List[float]:
+    """Issue bench_load's read-heavy mix for ``seconds``; returns request latencies."""
+    latencies: List[float] = []
+
+    async def loop(rng: random.Random):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            start = time.perf_counter()
+            if roll < 0.80:
+                response = await http.get(f"/products/{rng.randint(1, size)}")
+            elif roll < 0.95:
+                response = await http.get("/products", params={"limit": 20})
+            else:
+                response = await http.post("/products", json=new_product(rng.randint(0, size)).model_dump())
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        await asyncio.gather(*(loop(random.Random(seed * 1000 + i)) for i in range(concurrency)))
+    return latencies
+
+
+def run_client(args: Tuple[str, float, int, int, int]) -> List[float]:
+    return asyncio.run(client(*args))
+
+
+def wait_until_up(base_url: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(base_url + "/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def seed_products(base_url: str, size: int):
+    """Fill the catalog through the bulk endpoint."""
+    with httpx.Client(base_url=base_url, timeout=60) as http:
+        for start in range(0, size, 1000):
+            creates = [new_product(i).model_dump() for i in range(start, min(start + 1000, size))]
+            http.post("/products/bulk", json={"creates": creates}).raise_for_status()
+
+
+def main():
+    """Print requests/s and p50/p99 latency per worker count."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 1, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="connections per client process")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, "-c", SERVER.format(port=args.port, workers=workers)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up(base_url)
+            seed_products(base_url, args.size)
+            jobs = [(base_url, args.seconds, args.concurrency, args.size, seed) for seed in range(args.clients)]
+            start = time.perf_counter()
+            with multiprocessing.Pool(args.clients) as pool:
+                latencies = sorted(latency for result in pool.map(run_client, jobs) for latency in result)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f"{workers:>7} {len(latencies) / elapsed:>8.0f} {latencies[len(latencies) // 2] * 1e3:>8.2f}"
+            f" {latencies[int(len(latencies) * 0.99)] * 1e3:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Helpers for streamed (NDJSON) bulk requests."""
+from typing import AsyncIterator, List
+
+from pydantic import TypeAdapter, ValidationError
+
+from storage import ProductOperation
+from models import BulkOperation, BulkUpdateOperation, BulkCreateOperation
+
+BULK_MEDIA_TYPE = "application/x-ndjson"
+
+# Operations applied per database call while a streamed body is still arriving
+STREAM_BATCH_SIZE = 1000
+
+_operation_adapter = TypeAdapter(BulkOperation)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into non-empty lines without buffering the whole body."""
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def parse_operation(line: bytes) -> ProductOperation:
+    """Decode one NDJSON line into a database operation.
+
+    Raises ValueError with a readable message if the line is not a valid
+    operation.
+    """
+    try:
+        operation = _operation_adapter.validate_json(line)
+    except ValidationError as exc:
+        errors = exc.errors(include_url=False)
+        raise ValueError("; ".join(
+            f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in errors
+        )) from exc
+    if isinstance(operation, BulkCreateOperation):
+        return "create", None, operation.data
+    if isinstance(operation, BulkUpdateOperation):
+        return "update", operation.id, operation.data
+    return "delete", operation.id, None
+
+
+def request_operations(creates: List, updates: List, deletes: List[int]) -> List[ProductOperation]:
+    """Turn the arrays of a JSON bulk request into ordered database operations."""
+    operations: List[ProductOperation] = [("create", None, product) for product in creates]
+    for update in updates:
+        operations.append(("update", update.id, update))
+    operations.extend(("delete", product_id, None) for product_id in deletes)
+    return operations
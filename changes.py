@@ -0,0 +1,135 @@
+"""Bounded log of committed writes, read by change feeds."""
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Change(NamedTuple):
+    """One committed write.
+
+    ``op`` is "create", "update" or "delete" of ``table[id]``, or "reset"
+    (no table or id) when any record may have changed, as after ``clear``.
+    ``record`` is the record as written, None for deletes and resets.
+    """
+
+    seq: int
+    op: str
+    table: Optional[str] = None
+    id: Optional[int] = None
+    record: Any = None
+
+
+class ChangeLog:
+    """The last ``capacity`` changes to a storage, numbered from 1 in commit order.
+
+    Writers append while holding their write lock, so numbers follow
+    commit order. Readers ask for the changes after the last number they
+    saw, or block in ``wait`` until there are some; a number older than
+    the oldest change kept, or from another log, gets None, and the reader
+    must reload everything instead. Thread-safe.
+
+    Alongside, the log is kept compacted for delta sync: per table, only
+    the number of the last change to each record, for up to
+    ``compacted_capacity`` records. That covers a much longer history in
+    little memory, and ``changed_since`` answers in time proportional to
+    the records changed rather than to the table.
+    """
+
+    def __init__(self, capacity: int = 10_000, compacted_capacity: int = 100_000):
+        self._changed = threading.Condition()
+        self._changes: Deque[Change] = deque(maxlen=capacity)
+        self._listeners: Tuple[Callable[[], None], ...] = ()
+        self.last_seq = 0
+        # {table: {id: number of its last change}}, least recently changed first
+        self._latest: Dict[str, "OrderedDict[int, int]"] = {}
+        self._compacted_capacity = compacted_capacity
+        # Changes up to the floor are no longer known, for one table or all
+        self._floors: Dict[str, int] = {}
+        self._floor = 0
+
+    def subscribe(self, listener: Callable[[], None]):
+        """Call ``listener`` after every change, on the writing thread; it must not block."""
+        with self._changed:
+            self._listeners += (listener,)
+
+    def unsubscribe(self, listener: Callable[[], None]):
+        with self._changed:
+            self._listeners = tuple(known for known in self._listeners if known != listener)
+
+    def _compact(self, change: Change):
+        if change.table is None:
+            # Every record may have changed
+            self._latest.clear()
+            self._floors.clear()
+            self._floor = change.seq
+            return
+        latest = self._latest.setdefault(change.table, OrderedDict())
+        latest[change.id] = change.seq
+        latest.move_to_end(change.id)
+        if len(latest) > self._compacted_capacity:
+            _, self._floors[change.table] = latest.popitem(last=False)
+
+    def _notify(self):
+        self._changed.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def append(self, op: str, table: Optional[str] = None, record_id: Optional[int] = None, record: Any = None):
+        """Number and add one change, waking every waiting reader."""
+        with self._changed:
+            self.last_seq += 1
+            change = Change(self.last_seq, op, table, record_id, record)
+            self._changes.append(change)
+            self._compact(change)
+            self._notify()
+
+    def extend(self, changes: Iterable[Change]):
+        """Add changes numbered elsewhere, continuing from ``last_seq``; for logs mirroring another."""
+        with self._changed:
+            for change in changes:
+                self._changes.append(change)
+                self._compact(change)
+                self.last_seq = change.seq
+            self._notify()
+
+    def restart(self, seq: int):
+        """Drop every change and continue numbering after ``seq``."""
+        with self._changed:
+            self._changes.clear()
+            self._compact(Change(seq, "reset"))
+            self.last_seq = seq
+            self._notify()
+
+    def since(self, seq: int) -> Optional[List[Change]]:
+        """The changes after number ``seq``, or None if some of them are no longer kept."""
+        with self._changed:
+            if seq == self.last_seq:
+                return []
+            first = self._changes[0].seq if self._changes else self.last_seq + 1
+            if not first - 1 <= seq < self.last_seq:
+                return None
+            return list(islice(self._changes, seq - first + 1, None))
+
+    def wait(self, seq: int, timeout: Optional[float] = None) -> Optional[List[Change]]:
+        """Block until there are changes after ``seq`` or ``timeout`` seconds pass, then return ``since(seq)``."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.last_seq != seq, timeout)
+            return self.since(seq)
+
+    def changed_since(self, table: str, seq: int) -> Optional[Tuple[int, List[int]]]:
+        """Ids of ``table`` records changed after number ``seq``, each once, and ``last_seq``.
+
+        None if changes after ``seq`` were compacted away, or ``seq`` is not
+        from this log.
+        """
+        with self._changed:
+            if not max(self._floor, self._floors.get(table, 0)) <= seq <= self.last_seq:
+                return None
+            ids = []
+            for record_id, changed in reversed(self._latest.get(table, {}).items()):
+                if changed <= seq:
+                    break
+                ids.append(record_id)
+            ids.reverse()
+            return self.last_seq, ids
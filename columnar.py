@@ -0,0 +1,419 @@
+"""Column-oriented product snapshots served straight from ``mmap``.
+
+A snapshot file holds one array per product field, with rows sorted by id:
+
+- ``ids`` (int64), ``prices`` (float64) and ``in_stock`` (uint8)
+- ``created_at`` (int64 microseconds since 1970-01-01, naive like the
+  ``datetime.now()`` values the database stores) and ``created_ts``
+  (float64 POSIX timestamps, the database's creation-time sort key)
+- ``categories`` (uint32 codes into the category dictionary)
+- ``tag_offsets`` (uint64, row count + 1) slicing ``tag_codes`` (uint32
+  codes into the tag dictionary)
+- ``text_offsets`` (uint64, 2 * row count + 1) slicing ``text``, a UTF-8
+  heap holding each row's name followed by its description
+- ``price_order`` and ``created_order`` (uint32 row numbers sorted by
+  ``(price, id)`` and ``(created_ts, id)``) and, for categories, stock
+  status and tags, postings (int64 ids grouped by value, sliced by uint64
+  offsets), so indexes can be loaded without sorting or grouping rows
+
+A fixed prefix points at a pickled header describing the columns and
+carrying the dictionaries plus any extra data the writer attached. Opening
+a snapshot maps the file and reads only the header, so it takes the same
+time for any catalog size; pages are faulted in as rows are read and
+``Product`` models are built one row at a time.
+"""
+import mmap
+import pickle
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import AbstractSet, Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from compact import CompactProducts
+from models import Product
+from rows import product_from_row, product_row
+
+MAGIC = b"PCOL"
+VERSION = 1
+
+# Magic, format version, header offset, header length
+_PREFIX = struct.Struct("<4sIQQ")
+_ALIGN = 8
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def write_snapshot(f: BinaryIO, rows: Iterable[tuple], extra: Optional[Dict[str, Any]] = None):
+    """Write product rows (in ``PRODUCT_FIELDS`` order) to ``f`` column by column.
+
+    ``extra`` is pickled into the header and returned as
+    ``ColumnarProducts.extra`` when the snapshot is opened.
+    """
+    ids, prices, in_stock = array("q"), array("d"), array("B")
+    created_at, created_ts = array("q"), array("d")
+    categories, tag_offsets, tag_codes = array("I"), array("Q", [0]), array("I")
+    text_offsets, text = array("Q", [0]), bytearray()
+    category_codes: Dict[str, int] = {}
+    tag_dictionary: Dict[str, int] = {}
+    by_category: List[List[int]] = []
+    by_in_stock: List[List[int]] = [[], []]
+    by_tag: List[List[int]] = []
+
+    for product_id, name, description, price, category, tags, stocked, created in sorted(rows, key=itemgetter(0)):
+        ids.append(product_id)
+        prices.append(price)
+        in_stock.append(stocked)
+        by_in_stock[stocked].append(product_id)
+        created_at.append((created - _EPOCH) // _MICROSECOND)
+        created_ts.append(created.timestamp())
+        code = category_codes.setdefault(category, len(category_codes))
+        if code == len(by_category):
+            by_category.append([])
+        by_category[code].append(product_id)
+        categories.append(code)
+        for tag in dict.fromkeys(tags):
+            code = tag_dictionary.setdefault(tag, len(tag_dictionary))
+            if code == len(by_tag):
+                by_tag.append([])
+            by_tag[code].append(product_id)
+        for tag in tags:
+            tag_codes.append(tag_dictionary[tag])
+        tag_offsets.append(len(tag_codes))
+        text += name.encode()
+        text_offsets.append(len(text))
+        text += description.encode()
+        text_offsets.append(len(text))
+
+    positions = range(len(ids))
+    price_order = array("I", sorted(positions, key=list(zip(prices, ids)).__getitem__))
+    created_order = array("I", sorted(positions, key=list(zip(created_ts, ids)).__getitem__))
+
+    postings = {}
+    for name, groups in (("category", by_category), ("in_stock", by_in_stock), ("tag", by_tag)):
+        postings[name + "_postings"], postings[name + "_posting_offsets"] = _postings(groups)
+
+    f.write(_PREFIX.pack(MAGIC, VERSION, 0, 0))
+    columns = {}
+    for column, data in (
+        ("ids", ids), ("prices", prices), ("in_stock", in_stock), ("created_at", created_at),
+        ("created_ts", created_ts), ("categories", categories), ("tag_offsets", tag_offsets),
+        ("tag_codes", tag_codes), ("text_offsets", text_offsets), ("text", text),
+        ("price_order", price_order), ("created_order", created_order), *postings.items(),
+    ):
+        f.write(b"\0" * (-f.tell() % _ALIGN))
+        typecode = data.typecode if isinstance(data, array) else "B"
+        columns[column] = (f.tell(), typecode, len(data))
+        f.write(data)
+
+    header = pickle.dumps({
+        "columns": columns,
+        "categories": list(category_codes),
+        "tags": list(tag_dictionary),
+        "extra": extra or {},
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+    header_offset = f.tell()
+    f.write(header)
+    f.seek(0)
+    f.write(_PREFIX.pack(MAGIC, VERSION, header_offset, len(header)))
+    f.seek(0, 2)
+
+
+def _postings(groups: List[List[int]]) -> Tuple[array, array]:
+    """Concatenate id groups into one array plus the offsets delimiting them."""
+    ids, offsets = array("q"), array("Q", [0])
+    for group in groups:
+        ids.extend(group)
+        offsets.append(len(ids))
+    return ids, offsets
+
+
+class ColumnarProducts(Mapping):
+    """Read-only ``{id: Product}`` mapping over a memory-mapped snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_offset, header_length = _PREFIX.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} columnar snapshot")
+        header = pickle.loads(self._mmap[header_offset:header_offset + header_length])
+        self.extra: Dict[str, Any] = header["extra"]
+        self._category_names = header["categories"]
+        self._tag_names = header["tags"]
+
+        view = memoryview(self._mmap)
+        columns = {}
+        for column, (start, typecode, length) in header["columns"].items():
+            size = length * struct.calcsize(typecode)
+            columns[column] = view[start:start + size].cast(typecode)
+        self.ids = columns["ids"]
+        self.prices = columns["prices"]
+        self.in_stock = columns["in_stock"]
+        self._created_at = columns["created_at"]
+        self._created_ts = columns["created_ts"]
+        self._categories = columns["categories"]
+        self._tag_offsets = columns["tag_offsets"]
+        self._tag_codes = columns["tag_codes"]
+        self._text_offsets = columns["text_offsets"]
+        self._text = columns["text"]
+        self._price_order = columns["price_order"]
+        self._created_order = columns["created_order"]
+        self._postings = {
+            name: (columns[name + "_postings"], columns[name + "_posting_offsets"])
+            for name in ("category", "in_stock", "tag")
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __contains__(self, product_id: object) -> bool:
+        return self.position(product_id) is not None
+
+    def __getitem__(self, product_id: int) -> Product:
+        position = self.position(product_id)
+        if position is None:
+            raise KeyError(product_id)
+        return product_from_row(self.row(position))
+
+    def position(self, product_id: object) -> Optional[int]:
+        """Return the row number holding ``product_id``, or None."""
+        ids = self.ids
+        if not isinstance(product_id, int):
+            return None
+        position = bisect_left(ids, product_id)
+        if position < len(ids) and ids[position] == product_id:
+            return position
+        return None
+
+    def row(self, position: int) -> tuple:
+        """Decode one row into a tuple of field values."""
+        text, text_offsets = self._text, self._text_offsets
+        name_start, description_start, end = text_offsets[2 * position:2 * position + 3]
+        return (
+            self.ids[position],
+            str(text[name_start:description_start], "utf-8"),
+            str(text[description_start:end], "utf-8"),
+            self.prices[position],
+            self.category(position),
+            self.tags(position),
+            bool(self.in_stock[position]),
+            self.created_at(position),
+        )
+
+    # Bulk reads for building indexes; ``skip`` leaves out rows by id
+
+    def live_ids(self, skip: AbstractSet[int] = frozenset()) -> List[int]:
+        """Ids in ascending order."""
+        if not skip:
+            return self.ids.tolist()
+        return [product_id for product_id in self.ids if product_id not in skip]
+
+    def price_keys(self, skip: AbstractSet[int] = frozenset()) -> List[Tuple[float, int]]:
+        """``(price, id)`` keys in ascending order."""
+        return self._ordered_keys(self._price_order, self.prices, skip)
+
+    def created_keys(self, skip: AbstractSet[int] = frozenset()) -> List[Tuple[float, int]]:
+        """``(created_at.timestamp(), id)`` keys in ascending order."""
+        return self._ordered_keys(self._created_order, self._created_ts, skip)
+
+    def _ordered_keys(self, order, values, skip: AbstractSet[int]) -> List[Tuple[float, int]]:
+        order = order.tolist()
+        keys = list(zip(map(values.tolist().__getitem__, order), map(self.ids.tolist().__getitem__, order)))
+        if skip:
+            keys = [key for key in keys if key[1] not in skip]
+        return keys
+
+    def ids_by_category(self, skip: AbstractSet[int] = frozenset()) -> Dict[str, Set[int]]:
+        """Ids grouped by category."""
+        return self._groups("category", self._category_names, skip)
+
+    def ids_by_in_stock(self, skip: AbstractSet[int] = frozenset()) -> Dict[bool, Set[int]]:
+        """Ids grouped by stock status."""
+        return self._groups("in_stock", [False, True], skip)
+
+    def ids_by_tag(self, skip: AbstractSet[int] = frozenset()) -> Dict[str, Set[int]]:
+        """Ids grouped by each of their tags."""
+        return self._groups("tag", self._tag_names, skip)
+
+    def _groups(self, name: str, values: list, skip: AbstractSet[int]) -> Dict[Any, Set[int]]:
+        ids, offsets = self._postings[name]
+        groups = {}
+        for value, start, end in zip(values, offsets, offsets[1:]):
+            group = set(ids[start:end])
+            if skip:
+                group -= skip
+            if group:
+                groups[value] = group
+        return groups
+
+    def category(self, position: int) -> str:
+        """Category of one row, without decoding the rest of it."""
+        return self._category_names[self._categories[position]]
+
+    def tags(self, position: int) -> list:
+        """Tags of one row, without decoding the rest of it."""
+        tag_names, offsets = self._tag_names, self._tag_offsets
+        return [tag_names[code] for code in self._tag_codes[offsets[position]:offsets[position + 1]]]
+
+    def created_at(self, position: int) -> datetime:
+        """Creation time of one row, without decoding the rest of it."""
+        return _EPOCH + timedelta(microseconds=self._created_at[position])
+
+
+class ProductTable(MutableMapping):
+    """``{id: Product}`` mapping layering in-memory writes over a columnar snapshot.
+
+    Reads fall through to the snapshot for rows that were not written since
+    it was taken; writes never touch it. Iteration is in id order, like the
+    plain dict it replaces, and ``values`` only builds models for snapshot
+    rows as they are reached. Writes update the layers in an order that
+    lets ``get`` run concurrently with a single writer. With ``compact``,
+    the written rows are kept in ``CompactProducts`` columns instead of as
+    ``Product`` objects, found by ``id // id_stride``.
+    """
+
+    def __init__(self, base: Optional[ColumnarProducts] = None, compact: bool = False, id_stride: int = 1):
+        self._base = base
+        self._id_stride = id_stride
+        # Snapshot rows replaced since it was taken, and rows it never had
+        self._changed: MutableMapping[int, Product] = CompactProducts(id_stride) if compact else {}
+        self._added: MutableMapping[int, Product] = CompactProducts(id_stride) if compact else {}
+        self._deleted: Set[int] = set()
+
+    @property
+    def base(self) -> Optional[ColumnarProducts]:
+        """The snapshot underneath, if any."""
+        return self._base
+
+    def __len__(self) -> int:
+        base_length = len(self._base) - len(self._deleted) if self._base is not None else 0
+        return base_length + len(self._added)
+
+    def __contains__(self, product_id: object) -> bool:
+        if product_id in self._added:
+            return True
+        base = self._base
+        return base is not None and product_id not in self._deleted and product_id in base
+
+    def __getitem__(self, product_id: int) -> Product:
+        product = self.get(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        return product
+
+    def get(self, product_id: int, default: Optional[Product] = None) -> Optional[Product]:
+        product = self._added.get(product_id)
+        if product is not None:
+            return product
+        base = self._base
+        if base is None or product_id in self._deleted:
+            return default
+        product = self._changed.get(product_id)
+        if product is not None:
+            return product
+        position = base.position(product_id)
+        if position is None:
+            return default
+        return product_from_row(base.row(position))
+
+    def __setitem__(self, product_id: int, product: Product):
+        base = self._base
+        if base is not None and product_id not in self._added and base.position(product_id) is not None:
+            self._changed[product_id] = product
+            self._deleted.discard(product_id)
+        else:
+            self._added[product_id] = product
+
+    def __delitem__(self, product_id: int):
+        if self._added.pop(product_id, None) is not None:
+            return
+        if product_id not in self:
+            raise KeyError(product_id)
+        self._deleted.add(product_id)
+        self._changed.pop(product_id, None)
+
+    def __iter__(self) -> Iterator[int]:
+        base = self._base
+        if base is not None:
+            deleted = self._deleted
+            for product_id in base:
+                if product_id not in deleted:
+                    yield product_id
+        for product_id, _ in self._added_rows():
+            yield product_id
+
+    def values(self) -> Iterator[Product]:
+        """Iterate products in id order, building snapshot rows as they are reached."""
+        base = self._base
+        if base is not None:
+            changed, deleted, row = self._changed, self._deleted, base.row
+            for position, product_id in enumerate(base.ids):
+                if product_id in deleted:
+                    continue
+                product = changed.get(product_id)
+                yield product if product is not None else product_from_row(row(position))
+        for _, product in self._added_rows():
+            yield product
+
+    def rows(self) -> Iterator[tuple]:
+        """Iterate ``product_row`` tuples in id order, decoding snapshot rows directly."""
+        base = self._base
+        if base is not None:
+            changed, deleted, row = self._changed, self._deleted, base.row
+            for position, product_id in enumerate(base.ids):
+                if product_id in deleted:
+                    continue
+                product = changed.get(product_id)
+                yield product_row(product) if product is not None else row(position)
+        for _, product in self._added_rows():
+            yield product_row(product)
+
+    def _added_rows(self) -> List[Tuple[int, Product]]:
+        """``(id, product)`` of the rows the snapshot never had, in id order.
+
+        Ids are allocated in order but can be inserted out of it, by
+        concurrent creates on a shard or a rolled back delete; sorting
+        nearly sorted ids takes linear time. CompactProducts is always in
+        id order.
+        """
+        added = self._added
+        if isinstance(added, dict):
+            return sorted(added.items())
+        return [(product.id, product) for product in added.values()]
+
+    def shadowed(self) -> Set[int]:
+        """Ids of snapshot rows that were replaced or deleted since it was taken."""
+        return self._deleted.union(self._changed)
+
+    def in_memory(self) -> List[Product]:
+        """Products held in memory rather than read from the snapshot."""
+        return list(self._changed.values()) + list(self._added.values())
+
+    def copy(self) -> "ProductTable":
+        """Return a table sharing the snapshot, with its own copy of the writes."""
+        table = ProductTable(self._base, id_stride=self._id_stride)
+        table._changed = self._changed.copy()
+        table._added = self._added.copy()
+        table._deleted = set(self._deleted)
+        return table
+
+    def compacted(self, id_stride: int = 1) -> "ProductTable":
+        """Return a table sharing the snapshot, with the writes moved to compact columns."""
+        table = ProductTable(self._base, compact=True, id_stride=id_stride)
+        table._changed.update(self._changed)
+        table._added.update(self._added)
+        table._deleted = set(self._deleted)
+        return table
+
+    def clear(self):
+        """Remove every product, detaching the snapshot."""
+        self._base = None
+        self._changed.clear()
+        self._added.clear()
+        self._deleted.clear()
@@ -0,0 +1,269 @@
+"""Struct-of-arrays storage for products held in memory."""
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from models import Product
+from rows import product_from_row
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Compact once at least this many dead rows outnumber the live ones
+_MIN_GARBAGE = 1024
+# Slots a write moves to the new columns while compacting, bounding its pause
+_COMPACT_STEP = 64
+
+
+class _Columns:
+    """One generation of product columns, indexed by slot.
+
+    Rows are only ever appended, so a slot, once published in ``slots``,
+    never changes; updates append a new slot and repoint the id.
+    """
+
+    __slots__ = (
+        "slots", "ids", "prices", "in_stock", "created_at", "categories",
+        "tag_starts", "tag_counts", "tag_codes", "text_starts", "name_lengths", "description_lengths", "text",
+    )
+
+    def __init__(self):
+        # Slot of each id // id_stride, or -1; ids are allocated densely, so
+        # a flat array costs 8 bytes per id where a dict would cost about 100
+        self.slots = array("q")
+        self.ids = array("q")
+        self.prices = array("d")
+        self.in_stock = bytearray()  # one bit per slot
+        self.created_at = array("q")  # microseconds since 1970-01-01, naive
+        self.categories = array("i")  # codes into the string table
+        self.tag_starts = array("Q")
+        self.tag_counts = array("H")
+        self.tag_codes = array("i")
+        # Each row's UTF-8 name followed by its description
+        self.text_starts = array("Q")
+        self.name_lengths = array("I")
+        self.description_lengths = array("I")
+        self.text = bytearray()
+
+    def copy(self) -> "_Columns":
+        columns = _Columns.__new__(_Columns)
+        for name in _Columns.__slots__:
+            setattr(columns, name, getattr(self, name)[:])
+        return columns
+
+
+class CompactProducts(MutableMapping):
+    """``{id: Product}`` mapping storing each field in a typed array.
+
+    Prices, creation times, stock flags and interned category and tag codes
+    take a few dozen bytes per product, against a couple of kilobytes for a
+    ``Product`` with its dict, list and datetime; ``Product`` models are only
+    built when a row is read. Reads take no lock and may run while a single
+    writer appends: every row is written before its id is pointed at it, and
+    compaction swaps in a whole new generation of columns at once.
+
+    Rows are found by ``id // id_stride``, so a shard holding every n-th id
+    passes n and keeps a slot array as long as its own share of the ids.
+    Every id stored must then leave the same remainder.
+    """
+
+    def __init__(self, id_stride: int = 1):
+        self._id_stride = id_stride
+        self._columns = _Columns()
+        self._live = 0
+        # Interned category and tag values, shared with copies (append-only)
+        self._strings: List[str] = []
+        self._codes: Dict[str, int] = {}
+        # While compacting, the generation being filled and the next slot
+        # index to move to it; see _compact_if_needed
+        self._fresh: Optional[_Columns] = None
+        self._cursor = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, product_id: object) -> bool:
+        return isinstance(product_id, int) and self._slot(self._columns, product_id) >= 0
+
+    def __getitem__(self, product_id: int) -> Product:
+        product = self.get(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        return product
+
+    def get(self, product_id: int, default: Optional[Product] = None) -> Optional[Product]:
+        columns = self._columns
+        slot = self._slot(columns, product_id)
+        return default if slot < 0 else self._product(columns, slot)
+
+    def _slot(self, columns: _Columns, product_id: int) -> int:
+        """The slot of ``product_id`` in ``columns``, or -1."""
+        index = product_id // self._id_stride
+        if product_id < 0 or index >= len(columns.slots):
+            return -1
+        slot = columns.slots[index]
+        # An id of another shard can share the index
+        return slot if slot >= 0 and columns.ids[slot] == product_id else -1
+
+    def __setitem__(self, product_id: int, product: Product):
+        columns = self._columns
+        slot = self._append(columns, product)
+        index = product_id // self._id_stride
+        if self._point(columns, index, slot):
+            self._live += 1
+        fresh = self._fresh
+        if fresh is not None and index < self._cursor:
+            # Already moved; the new generation needs the new row too
+            self._point(fresh, index, self._copy_row(columns, slot, fresh))
+        self._compact_if_needed()
+
+    def __delitem__(self, product_id: int):
+        if product_id not in self:
+            raise KeyError(product_id)
+        index = product_id // self._id_stride
+        self._columns.slots[index] = -1
+        self._live -= 1
+        fresh = self._fresh
+        if fresh is not None and index < self._cursor:
+            fresh.slots[index] = -1
+        self._compact_if_needed()
+
+    @staticmethod
+    def _point(columns: _Columns, index: int, slot: int) -> bool:
+        """Point slot index ``index`` of ``columns`` at ``slot``; returns whether it was empty."""
+        slots = columns.slots
+        if index >= len(slots):
+            slots.extend([-1] * (index + 1 - len(slots)))
+        empty = slots[index] < 0
+        slots[index] = slot
+        return empty
+
+    def __iter__(self) -> Iterator[int]:
+        columns = self._columns
+        ids = columns.ids
+        for slot in columns.slots:
+            if slot >= 0:
+                yield ids[slot]
+
+    def values(self) -> Iterator[Product]:
+        """Iterate products in id order."""
+        columns = self._columns
+        for slot in columns.slots:
+            if slot >= 0:
+                yield self._product(columns, slot)
+
+    def copy(self) -> "CompactProducts":
+        """Return an independent copy; the string table is shared, as it is only appended to."""
+        products = CompactProducts.__new__(CompactProducts)
+        products._id_stride = self._id_stride
+        products._columns = self._columns.copy()
+        products._live = self._live
+        products._strings = self._strings
+        products._codes = self._codes
+        products._fresh = None
+        products._cursor = 0
+        return products
+
+    def clear(self):
+        self._columns = _Columns()
+        self._live = 0
+        self._fresh = None
+
+    def _code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._strings)
+            self._strings.append(value)
+        return code
+
+    def _append(self, columns: _Columns, product: Product) -> int:
+        """Write ``product`` to a new slot of ``columns`` and return the slot."""
+        slot = len(columns.ids)
+        name, description = product.name.encode(), product.description.encode()
+        columns.text_starts.append(len(columns.text))
+        columns.name_lengths.append(len(name))
+        columns.description_lengths.append(len(description))
+        columns.text += name
+        columns.text += description
+        columns.tag_starts.append(len(columns.tag_codes))
+        columns.tag_counts.append(len(product.tags))
+        columns.tag_codes.extend([self._code(tag) for tag in product.tags])
+        columns.categories.append(self._code(product.category))
+        columns.created_at.append((product.created_at - _EPOCH) // _MICROSECOND)
+        columns.prices.append(product.price)
+        if slot % 8 == 0:
+            columns.in_stock.append(0)
+        if product.in_stock:
+            columns.in_stock[slot >> 3] |= 1 << (slot & 7)
+        columns.ids.append(product.id)
+        return slot
+
+    @staticmethod
+    def _copy_row(source: _Columns, slot: int, target: _Columns) -> int:
+        """Append row ``slot`` of ``source`` to ``target`` as stored, and return its new slot."""
+        new = len(target.ids)
+        start = source.text_starts[slot]
+        name_length, description_length = source.name_lengths[slot], source.description_lengths[slot]
+        target.text_starts.append(len(target.text))
+        target.name_lengths.append(name_length)
+        target.description_lengths.append(description_length)
+        target.text += source.text[start:start + name_length + description_length]
+        tag_start, tag_count = source.tag_starts[slot], source.tag_counts[slot]
+        target.tag_starts.append(len(target.tag_codes))
+        target.tag_counts.append(tag_count)
+        target.tag_codes.extend(source.tag_codes[tag_start:tag_start + tag_count])
+        target.categories.append(source.categories[slot])
+        target.created_at.append(source.created_at[slot])
+        target.prices.append(source.prices[slot])
+        if new % 8 == 0:
+            target.in_stock.append(0)
+        if source.in_stock[slot >> 3] >> (slot & 7) & 1:
+            target.in_stock[new >> 3] |= 1 << (new & 7)
+        target.ids.append(source.ids[slot])
+        return new
+
+    def _product(self, columns: _Columns, slot: int) -> Product:
+        strings, text = self._strings, columns.text
+        start = columns.text_starts[slot]
+        middle = start + columns.name_lengths[slot]
+        end = middle + columns.description_lengths[slot]
+        tag_start = columns.tag_starts[slot]
+        return product_from_row((
+            columns.ids[slot],
+            str(text[start:middle], "utf-8"),
+            str(text[middle:end], "utf-8"),
+            columns.prices[slot],
+            strings[columns.categories[slot]],
+            [strings[code] for code in columns.tag_codes[tag_start:tag_start + columns.tag_counts[slot]]],
+            bool(columns.in_stock[slot >> 3] >> (slot & 7) & 1),
+            _EPOCH + timedelta(microseconds=columns.created_at[slot]),
+        ))
+
+    def _compact_if_needed(self):
+        """Move the live rows into fresh columns once replaced rows dominate, a few per write.
+
+        Each write moves the rows of the next _COMPACT_STEP slot indexes,
+        copying their columns as stored, and writes to indexes already
+        moved go to both generations; the fresh columns replace the old
+        ones once every index is moved. A write is never held up for
+        longer than a step, and the old columns serve reads until then.
+        """
+        columns = self._columns
+        fresh = self._fresh
+        if fresh is None:
+            garbage = len(columns.ids) - self._live
+            if garbage < _MIN_GARBAGE or garbage <= self._live:
+                return
+            fresh = self._fresh = _Columns()
+            self._cursor = 0
+        slots = columns.slots
+        end = min(self._cursor + _COMPACT_STEP, len(slots))
+        for index in range(self._cursor, end):
+            slot = slots[index]
+            if slot >= 0:
+                self._point(fresh, index, self._copy_row(columns, slot, fresh))
+        self._cursor = end
+        if end == len(slots):
+            self._columns = fresh
+            self._fresh = None
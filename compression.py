@@ -0,0 +1,61 @@
+"""zstd and gzip compression of response bodies."""
+import zlib
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # optional: without it responses are only gzipped
+    zstandard = None
+
+# Preferred first when a client accepts several
+ENCODINGS = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The best of ENCODINGS that an ``Accept-Encoding`` header allows, or None."""
+    if not accept_encoding:
+        return None
+    allowed = set()
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            allowed.add(coding.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in allowed:
+            return encoding
+    return None
+
+
+class Compressor:
+    """Compresses one response body, whole or as a stream of chunks.
+
+    ``level`` trades CPU for size: bodies are compressed on every request
+    unless cached, so the defaults sit well below each format's maximum
+    (see benchmarks/bench_encoding.py).
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        self.level = level
+        self._stream = None
+
+    def compress(self, body: bytes) -> bytes:
+        """Compress a whole body."""
+        if self.encoding == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(body)
+        return self.chunk(body, final=True)
+
+    def chunk(self, data: bytes, final: bool = False) -> bytes:
+        """Compress the next chunk of a stream, flushed so the client can decode it at once."""
+        if self._stream is None:
+            if self.encoding == "zstd":
+                self._stream = zstandard.ZstdCompressor(level=self.level).compressobj()
+            else:
+                # wbits 31: a gzip header and trailer around the deflate stream
+                self._stream = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        out = self._stream.compress(data)
+        if final:
+            return out + self._stream.flush()
+        if self.encoding == "zstd":
+            return out + self._stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return out + self._stream.flush(zlib.Z_SYNC_FLUSH)
@@ -0,0 +1,89 @@
+"""Application settings read from environment variables."""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+ENV_PREFIX = "PRODUCT_API_"
+
+
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a prefixed environment variable, treating empty values as unset."""
+    return os.environ.get(ENV_PREFIX + name) or default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime configuration; every field maps to a PRODUCT_API_* variable."""
+
+    # Storage backend: "memory" (InMemoryDatabase) or "sqlite" (SQLiteDatabase)
+    backend: str = "memory"
+    # SQLite database file, and connections kept for FastAPI's 40 worker threads
+    sqlite_path: str = "products.db"
+    sqlite_pool_size: int = 40
+    # In-memory backend only: partitions of products and users, each with its
+    # own lock and indexes, and its own data_dir subdirectory; 1 disables sharding
+    shards: int = 1
+    # In-memory backend only: keep products in typed columns ("1") rather than
+    # as Product objects, for a fraction of the memory at some cost per read
+    compact_products: bool = False
+    # Uvicorn worker processes started by ``python main.py``; above 1, with the
+    # memory backend, that process owns the database and serves it to them
+    workers: int = 1
+    # Unix socket of the process owning the database, which main.py sets for its
+    # workers; when set, the database is used through it and the other storage
+    # settings are ignored
+    storage_socket: Optional[str] = None
+    # In-memory backend only: recent changes kept for change feed clients
+    # resuming with Last-Event-ID; older ones must reload instead
+    change_log_size: int = 10_000
+    # In-memory backend only: records per table whose last change is kept for
+    # delta sync clients; a token from before the oldest gets a full resync
+    sync_log_size: int = 100_000
+    # Directory for the write-ahead log and snapshots; unset keeps data in memory only
+    data_dir: Optional[str] = None
+    # Seconds between WAL fsyncs (group commit); 0 syncs every write
+    wal_commit_interval: float = 0.05
+    # Logged writes after which a new snapshot is taken and old WAL segments dropped
+    snapshot_every: int = 100_000
+    # Bytes of encoded GET responses and record JSON kept by the API; 0 disables
+    response_cache_bytes: int = 64 * 2 ** 20
+    # Responses of at least this many bytes are compressed for clients accepting
+    # zstd or gzip; 0 disables compression. Levels are low because uncached
+    # responses are compressed per request (see benchmarks/bench_encoding.py)
+    compress_min_bytes: int = 1024
+    zstd_level: int = 3
+    gzip_level: int = 1
+    # Processes hashing passwords (unset: one per CPU), scrypt cost as log2 of
+    # its iteration count, and hashes that may wait for a process before
+    # sign-ups are turned away with 503
+    password_hash_workers: Optional[int] = None
+    password_hash_cost: int = 14
+    password_hash_queue: int = 64
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Build settings from the environment, falling back to the defaults."""
+        return cls(
+            backend=_env("BACKEND", cls.backend),
+            sqlite_path=_env("SQLITE_PATH", cls.sqlite_path),
+            sqlite_pool_size=int(_env("SQLITE_POOL_SIZE", str(cls.sqlite_pool_size))),
+            shards=int(_env("SHARDS", str(cls.shards))),
+            compact_products=_env("COMPACT_PRODUCTS", "0") == "1",
+            workers=int(_env("WORKERS", str(cls.workers))),
+            storage_socket=_env("STORAGE_SOCKET"),
+            change_log_size=int(_env("CHANGE_LOG_SIZE", str(cls.change_log_size))),
+            sync_log_size=int(_env("SYNC_LOG_SIZE", str(cls.sync_log_size))),
+            data_dir=_env("DATA_DIR"),
+            wal_commit_interval=float(_env("WAL_COMMIT_INTERVAL", str(cls.wal_commit_interval))),
+            snapshot_every=int(_env("SNAPSHOT_EVERY", str(cls.snapshot_every))),
+            response_cache_bytes=int(_env("RESPONSE_CACHE_BYTES", str(cls.response_cache_bytes))),
+            compress_min_bytes=int(_env("COMPRESS_MIN_BYTES", str(cls.compress_min_bytes))),
+            zstd_level=int(_env("ZSTD_LEVEL", str(cls.zstd_level))),
+            gzip_level=int(_env("GZIP_LEVEL", str(cls.gzip_level))),
+            password_hash_workers=int(_env("PASSWORD_HASH_WORKERS")) if _env("PASSWORD_HASH_WORKERS") else None,
+            password_hash_cost=int(_env("PASSWORD_HASH_COST", str(cls.password_hash_cost))),
+            password_hash_queue=int(_env("PASSWORD_HASH_QUEUE", str(cls.password_hash_queue))),
+        )
+
+
+settings = Settings.from_env()
@@ -1,133 +1,1149 @@
 """Database module for in-memory product storage."""
-from typing import List, Optional
+import heapq
+import math
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from typing import AbstractSet, Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 from datetime import datetime
 
-from models import Product, ProductCreate, ProductUpdate, User, UserCreate, UserUpdate
+from changes import ChangeLog
+from config import Settings, settings
+from indexes import HashIndex, SortedIndex
+from locks import RWLock, hold, refuse_if_non_blocking, wait_for
+from columnar import ColumnarProducts, ProductTable
+from persistence import Persistence, StoreState, paused_gc
+from remote import RemoteDatabase
+from rows import product_row, user_row
+from search import TextIndex
+from sqlite_database import SQLiteDatabase
+from versions import VersionLog
+from storage import (
+    PRODUCT_SORT_KEYS, DuplicateEmail, ProductOperation, Storage, email_key, record_id, resume_key
+)
+from models import (
+    BulkItemResult, Product, ProductCreate, ProductSort, ProductUpdate, User, UserCreate, UserUpdate
+)
 
+# Records a full listing reads before undoing the writes made meanwhile
+SCAN_CHUNK = 1000
 
-class InMemoryDatabase:
-    """In-memory database for storing and managing products."""
+
+class _ProductIndexes:
+    """The id, hash and sorted product indexes, built apart from the live ones.
+
+    Attributes are named like InMemoryDatabase's, so the functions that
+    fill indexes take either.
+    """
+
+    __slots__ = ("_product_ids", "_by_category", "_by_in_stock", "_by_tag", "_by_price", "_by_created_at")
 
     def __init__(self):
-        self.products: List[Product] = []
-        self.users: List[User] = []
+        self._product_ids = SortedIndex()
+        self._by_category = HashIndex()
+        self._by_in_stock = HashIndex()
+        self._by_tag = HashIndex()
+        self._by_price = SortedIndex()
+        self._by_created_at = SortedIndex()
+
+
+def _add_snapshot_to_indexes(indexes, base: ColumnarProducts, skip: AbstractSet[int]):
+    """Index the snapshot rows whose ids are not in ``skip``, reading its columns in bulk."""
+    indexes._product_ids.update(base.live_ids(skip))
+    indexes._by_price.update(base.price_keys(skip))
+    indexes._by_created_at.update(base.created_keys(skip))
+    for index, groups in (
+        (indexes._by_category, base.ids_by_category(skip)),
+        (indexes._by_in_stock, base.ids_by_in_stock(skip)),
+        (indexes._by_tag, base.ids_by_tag(skip)),
+    ):
+        for value, ids in groups.items():
+            index.update(value, ids)
+
+
+def _add_to_indexes(indexes, products: List[Product]):
+    """Add many products to the id, hash and sorted indexes."""
+    indexes._product_ids.update(product.id for product in products)
+    indexes._by_price.update((product.price, product.id) for product in products)
+    indexes._by_created_at.update((product.created_at.timestamp(), product.id) for product in products)
+    for product in products:
+        product_id = product.id
+        indexes._by_category.add(product.category, product_id)
+        indexes._by_in_stock.add(product.in_stock, product_id)
+        for tag in product.tags:
+            indexes._by_tag.add(tag, product_id)
+
+
+class InMemoryDatabase(Storage):
+    """In-memory database for storing and managing products.
+
+    Safe for concurrent use: writes, including id allocation, hold a
+    reader-writer lock exclusively, and index queries and search share it.
+    ``get_product`` and ``get_user`` take no lock at all, since records are
+    replaced rather than mutated and a dict lookup is atomic. Full listings
+    take no lock either: each write is a version in a ``VersionLog``, and
+    they read the tables as of the version current when they start.
+    Every committed write is also appended to ``changes``, which shards of
+    one ShardedDatabase share.
+    """
+
+    def __init__(
+        self,
+        persistence: Optional[Persistence] = None,
+        sample_data: bool = True,
+        compact: bool = False,
+        changes: Optional[ChangeLog] = None,
+        id_stride: int = 1,
+    ):
+        self._lock = RWLock()
+        self._versions = VersionLog()
+        # Keyed by id and iterated in id order, so listings stay stable;
+        # after recovery most products are read from the mmapped snapshot,
+        # and with ``compact`` written ones are kept as columns too, found by
+        # id // id_stride, as a shard holds only every id_stride-th id
+        self._compact = compact
+        self._id_stride = id_stride
+        self.products: ProductTable = ProductTable(compact=compact, id_stride=id_stride)
+        self.users: Dict[int, User] = {}
+        # Ordered id indexes backing keyset pagination
+        self._product_ids = SortedIndex()
+        self._user_ids = SortedIndex()
+        # Unique index of users by email_key(email)
+        self._by_email: Dict[str, int] = {}
+        # Secondary product indexes, kept in step with every product write
+        self._by_category = HashIndex()
+        self._by_in_stock = HashIndex()
+        self._by_tag = HashIndex()
+        # (value, id) keys, so equal prices still have a stable order
+        self._by_price = SortedIndex()
+        self._by_created_at = SortedIndex()
+        # False/None while _build_indexes fills them after recovery; until
+        # then writes leave them alone
+        self._indexed = True
+        self._text: Optional[TextIndex] = TextIndex()
+        # Raised to make a build in progress give up; set on a failed build
+        self._index_generation = 0
+        self._index_error: Optional[BaseException] = None
+        # Notified as each index build finishes or fails
+        self._indexes_changed = threading.Condition()
         self.next_id = 1
         self.next_user_id = 1
-        self._init_sample_data()
-
-    def _init_sample_data(self):
-        """Initialize the database with sample product data."""
-        sample_products = [
-            ProductCreate(
-                name="Wireless Headphones",
-                description="High-quality wireless headphones with noise cancellation",
-                price=199.99,
-                category="Electronics",
-                tags=["audio", "wireless", "premium"]
-            ),
-            ProductCreate(
-                name="Coffee Maker",
-                description="Programmable coffee maker with built-in grinder",
-                price=89.99,
-                category="Appliances",
-                tags=["kitchen", "coffee", "automatic"]
-            ),
-            ProductCreate(
-                name="Laptop Stand",
-                description="Adjustable aluminum laptop stand for ergonomic work",
-                price=45.99,
-                category="Accessories",
-                tags=["ergonomic", "aluminum", "adjustable"]
-            )
-        ]
+        # Version of the last write to each table and to each record written
+        # since startup; records not written since have version 0
+        self._collection_versions = {"products": 0, "users": 0}
+        self._record_versions: Dict[str, Dict[int, int]] = {"products": {}, "users": {}}
+        # (table, id, created) of each record written under the write lock
+        self._written: List[Tuple[str, int, bool]] = []
+        # Whether the current write reached _log, its last step, with every
+        # table and index change made
+        self._applied = False
+        self.changes = ChangeLog() if changes is None else changes
+        self._persistence = persistence
 
-        for product_data in sample_products:
-            self.create_product(product_data)
+        state = None
+        if persistence is not None:
+            with paused_gc():
+                state = persistence.recover()
+                if state is not None:
+                    self._load_state(state)
+        self._recovered = state is not None
+        if state is None and sample_data:
+            self._init_sample_data()
 
-    def create_product(self, product_data: ProductCreate) -> Product:
-        """Create a new product in the database."""
-        product = Product(
-            id=self.next_id,
-            **product_data.model_dump(),
-            created_at=datetime.now()
-        )
-        self.products.append(product)
-        self.next_id += 1
-        return product
+    @property
+    def blocking_writes(self) -> bool:
+        """Writes wait for an fsync when the WAL syncs every write."""
+        return self._persistence is not None and self._persistence.commit_interval <= 0
+
+    def _load_state(self, state: StoreState):
+        """Replace the contents of the database with recovered state."""
+        self.products = state.products.compacted(self._id_stride) if self._compact else state.products
+        self.users = state.users
+        self.next_id = state.next_id
+        self.next_user_id = state.next_user_id
+        self._user_ids.update(self.users)
+        self._by_email = self._email_index(self.users)
+        # Recovery maps the snapshot without reading it; the product indexes
+        # are filled in the background rather than delay startup
+        self._start_index_build()
+
+    @staticmethod
+    def _email_index(users: Mapping[int, User]) -> Dict[str, int]:
+        """Index ``users`` by email; of users sharing one, the first by id keeps it."""
+        index: Dict[str, int] = {}
+        for user_id in sorted(users):
+            index.setdefault(email_key(users[user_id].email), user_id)
+        return index
+
+    def _capture_state(self) -> StoreState:
+        """Copy the current contents for a snapshot; stored records are never mutated."""
+        return StoreState(self.products.copy(), dict(self.users), self.next_id, self.next_user_id)
+
+    def _log(self, records: List[tuple]):
+        """Append write records to the WAL, snapshotting when one is due.
+
+        Every write calls this last, once its table and index changes are made.
+        """
+        self._applied = True
+        persistence = self._persistence
+        if persistence is None or not records:
+            return
+        # Rolling the log over and copying the tables would stall the event
+        # loop, so a write that would snapshot is retried off it
+        due = persistence.snapshot_due
+        if due:
+            refuse_if_non_blocking()
+        persistence.append(records)
+        if due:
+            persistence.snapshot(self._capture_state())
+
+    def checkpoint(self, wait: bool = False):
+        """Snapshot the current state now so recovery needs no older WAL segments."""
+        if self._persistence is not None:
+            with self._lock.read:
+                self._persistence.snapshot(self._capture_state())
+            if wait:
+                self._persistence.wait_for_snapshot()
+
+    def close(self):
+        """Flush pending writes to disk; the database must not be written afterwards."""
+        if self._persistence is not None:
+            self._persistence.close()
+
+    def clear(self):
+        """Remove all products and users and reset id allocation."""
+        with self._writing():
+            # New tables rather than clearing in place, so snapshot readers
+            # still scanning the old ones are unaffected
+            self.products = ProductTable(compact=self._compact, id_stride=self._id_stride)
+            self.users = {}
+            self._by_email = {}
+            self._record_versions = {"products": {}, "users": {}}
+            self._collection_versions = dict.fromkeys(self._collection_versions, self._versions.version + 1)
+            self._product_ids.clear()
+            self._user_ids.clear()
+            self._by_category.clear()
+            self._by_in_stock.clear()
+            self._by_tag.clear()
+            self._by_price.clear()
+            self._by_created_at.clear()
+            self._indexed = True
+            self._text = TextIndex()
+            # Any build in progress is of the old tables
+            self._index_generation += 1
+            with self._indexes_changed:
+                self._indexes_changed.notify_all()
+            self.next_id = 1
+            self.next_user_id = 1
+            self._log([("clear",)])
+            self.changes.append("reset")
+
+    def create_product(self, product_data: ProductCreate, product_id: Optional[int] = None) -> Product:
+        """Create a new product in the database.
+
+        It gets the next id unless ``product_id`` is given, as ShardedDatabase
+        does when it allocates ids across shards.
+        """
+        with self._writing():
+            product = Product(
+                id=self.next_id if product_id is None else product_id,
+                **product_data.model_dump(),
+                created_at=datetime.now()
+            )
+            self._record_write("products", product.id, None)
+            self.products[product.id] = product
+            self._index_product(product)
+            self.next_id = max(self.next_id, product.id + 1)
+            self._log([("put_product", product_row(product))])
+            return product
 
     def get_all_products(self) -> List[Product]:
-        """Get all products from the database."""
-        return self.products
+        """Get all products as of one version, without blocking writers."""
+        return list(self._iter_snapshot("products"))
+
+    def iter_all_products(self) -> Iterator[Product]:
+        """Iterate all products as of one version, building snapshot rows a chunk at a time."""
+        return self._iter_snapshot("products")
+
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[ProductSort] = None,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+    ) -> Tuple[List[Product], Optional[Any]]:
+        """Get products matching every given filter, ordered by ``sort`` (id by default).
+
+        Category, stock and tag filters are answered by intersecting the hash
+        indexes, smallest first. Price ranges and price or creation-time
+        ordering are read from the sorted indexes in O(log n + k). ``limit``
+        and ``after`` page through the matches; ``after`` is the sort key
+        returned with the previous page, and a malformed one raises ValueError.
+        """
+        after = resume_key(sort, after)
+        self._ensure_indexed()
+        with self._lock.read:
+            allowed = self._filter_ids(category, in_stock, tags)
+            low = None if min_price is None else (min_price,)
+            high = None if max_price is None else (max_price, math.inf)
+            products = self.products
+
+            if sort is None:
+                if low is not None or high is not None:
+                    in_range = {key[1] for key in self._by_price.irange(low, high)}
+                    allowed = in_range if allowed is None else in_range.intersection(allowed)
+                if allowed is None:
+                    ids = self._product_ids.irange(minimum=after, inclusive=(False, True))
+                else:
+                    ids = iter(sorted(allowed if after is None else (i for i in allowed if i > after)))
+                return self._take(products, ids, limit, record_id)
+
+            sort_key = PRODUCT_SORT_KEYS[sort]
+            if sort == "price" or sort == "-price":
+                index, price_filter = self._by_price, False
+            else:
+                index, price_filter = self._by_created_at, low is not None or high is not None
+                low = high = None
+            reverse = sort.startswith("-")
+
+            if allowed is not None and len(allowed) * 16 < len(products):
+                # A selective filter is cheaper to sort than to scan the index for
+                keys = sorted((sort_key(products[i]) for i in allowed), reverse=reverse)
+                keys = (key for key in keys if self._key_in_range(key, low, high, after, reverse))
+            elif reverse:
+                if after is not None and (high is None or after <= high):
+                    keys = index.irange(low, after, inclusive=(True, False), reverse=True)
+                else:
+                    keys = index.irange(low, high, reverse=True)
+            else:
+                if after is not None and (low is None or after >= low):
+                    keys = index.irange(after, high, inclusive=(False, True))
+                else:
+                    keys = index.irange(low, high)
+
+            ids = (key[1] for key in keys)
+            if allowed is not None:
+                ids = (i for i in ids if i in allowed)
+            if price_filter:
+                ids = (i for i in ids
+                       if (min_price is None or products[i].price >= min_price)
+                       and (max_price is None or products[i].price <= max_price))
+            return self._take(products, ids, limit, sort_key)
 
     def get_product(self, product_id: int) -> Optional[Product]:
         """Get a specific product by ID."""
-        for product in self.products:
-            if product.id == product_id:
-                return product
-        return None
+        return self.products.get(product_id)
 
     def update_product(self, product_id: int, update_data: ProductUpdate) -> Optional[Product]:
         """Update an existing product in the database."""
-        product = self.get_product(product_id)
-        if not product:
+        with self._writing():
+            product = self.get_product(product_id)
+            if not product:
+                return None
+
+            # Validated before the table changes, so a bad value fails the
+            # write before any of it is applied
+            updated = self._updated(product, update_data.model_dump(exclude_unset=True))
+            self._record_write("products", product_id, product)
+            self.products[product_id] = updated
+            self._reindex_product(product, updated)
+            self._log([("put_product", product_row(updated))])
+            return updated
+
+    def delete_product(self, product_id: int) -> bool:
+        """Delete a product from the database."""
+        with self._writing():
+            product = self.products.get(product_id)
+            if product is None:
+                return False
+            self._record_write("products", product_id, product)
+            del self.products[product_id]
+            self._unindex_product(product)
+            self._log([("delete_product", product_id)])
+            return True
+
+    def bulk_products(self, operations: Iterable[ProductOperation]) -> List[BulkItemResult]:
+        """Apply a batch of product writes in one pass.
+
+        Each operation is ``("create", None, ProductCreate)``,
+        ``("update", id, ProductUpdate)`` or ``("delete", id, None)``, applied in
+        order. Indexes are brought up to date once at the end of the batch, so
+        a product touched several times is re-indexed once, and new ids and
+        prices are merged into the sorted indexes in bulk.
+        """
+        with self._writing():
+            products = self.products
+            before: Dict[int, Optional[Product]] = {}
+            results = []
+            for op, product_id, payload in operations:
+                if op == "create":
+                    product = Product(
+                        id=self.next_id if product_id is None else product_id,
+                        **payload.model_dump(), created_at=datetime.now()
+                    )
+                    self.next_id = max(self.next_id, product.id + 1)
+                    self._record_write("products", product.id, None)
+                    products[product.id] = product
+                    before[product.id] = None
+                    results.append(BulkItemResult(op=op, id=product.id, status=200))
+                    continue
+
+                product = products.get(product_id)
+                if product is None:
+                    results.append(BulkItemResult(op=op, id=product_id, status=404, detail="Product not found"))
+                    continue
+                if product_id not in before:
+                    self._record_write("products", product_id, product)
+                    before[product_id] = product
+                if op == "update":
+                    changes = payload.model_dump(exclude_unset=True, exclude={"id"})
+                    products[product_id] = self._updated(product, changes)
+                else:
+                    del products[product_id]
+                results.append(BulkItemResult(op=op, id=product_id, status=200))
+
+            created, records = [], []
+            for product_id, old in before.items():
+                new = products.get(product_id)
+                if new is not None:
+                    records.append(("put_product", product_row(new)))
+                else:
+                    records.append(("delete_product", product_id))
+                if old is None:
+                    if new is not None:
+                        created.append(new)
+                elif new is None:
+                    self._unindex_product(old)
+                else:
+                    self._reindex_product(old, new)
+            self._index_products(created)
+            self._log(records)
+            return results
+
+    def search_products(self, query: str, limit: int) -> List[Product]:
+        """Get up to ``limit`` products best matching ``query``, ranked by BM25."""
+        return [product for product, _ in self.search_products_scored(query, limit)]
+
+    def search_products_scored(self, query: str, limit: int) -> List[Tuple[Product, float]]:
+        """Like ``search_products``, with the BM25 score of each product."""
+        self._ensure_text_index()
+        with self._lock.read:
+            return [(self.products[product_id], score) for product_id, score in self._text.search(query, limit)]
+
+    def _ensure_text_index(self):
+        """Wait for _build_indexes to fill the full-text index after recovery.
+
+        Tokenizing every product is the slowest part of index building, so
+        it is done last. Must be called without holding the lock.
+        """
+        if self._text is None:
+            self._wait_for_indexes(lambda: self._text is not None)
+
+    @staticmethod
+    def _searchable_text(product: Product) -> str:
+        """Text of a product covered by full-text search."""
+        return f"{product.name} {product.description}"
+
+    @staticmethod
+    def _key_in_range(key: tuple, low, high, after, reverse: bool) -> bool:
+        """Check a sort key against range bounds and the resume key."""
+        if (low is not None and key < low) or (high is not None and key > high):
+            return False
+        if after is None:
+            return True
+        return key < after if reverse else key > after
+
+    def _filter_ids(
+        self, category: Optional[str], in_stock: Optional[bool], tags: Optional[Iterable[str]]
+    ) -> Optional[AbstractSet[int]]:
+        """Intersect the hash indexes for the given filters; None means no filter."""
+        candidates = []
+        if category is not None:
+            candidates.append(self._by_category.get(category))
+        if in_stock is not None:
+            candidates.append(self._by_in_stock.get(in_stock))
+        for tag in tags or ():
+            candidates.append(self._by_tag.get(tag))
+        if not candidates:
+            return None
+        candidates.sort(key=len)
+        return candidates[0].intersection(*candidates[1:])
+
+    def _ensure_indexed(self):
+        """Wait for _build_indexes to fill the id, hash and sorted product indexes after recovery.
+
+        Must be called without holding the lock.
+        """
+        if not self._indexed:
+            self._wait_for_indexes(lambda: self._indexed)
+
+    def _wait_for_indexes(self, built: Callable[[], bool]):
+        with self._indexes_changed:
+            wait_for(self._indexes_changed, lambda: built() or self._index_error is not None)
+            if not built():
+                raise RuntimeError("Building the product indexes failed") from self._index_error
+
+    def _start_index_build(self):
+        """Empty the product indexes and fill them on a background thread.
+
+        Call with the write lock held, or before the database is shared.
+        """
+        self._index_generation += 1
+        self._index_error = None
+        self._indexed = False
+        self._text = None
+        threading.Thread(
+            target=self._build_indexes, args=(self._index_generation,), name="index-builder", daemon=True
+        ).start()
+
+    def _build_indexes(self, generation: int):
+        """Fill the product indexes without holding the lock while reading every row.
+
+        Each pass copies the table under the read lock at a pinned version,
+        builds indexes from the copy, reading the snapshot columns in bulk,
+        then takes the write lock to swap them in and replay the writes made
+        meanwhile from the version log. The id, hash and sorted indexes come
+        first, so queries can run while the full-text index is still being
+        filled. A clear, or a newer build, makes it give up.
+        """
+        try:
+            for build, install in (
+                (self._build_product_indexes, self._install_product_indexes),
+                (self._build_text_index, self._install_text_index),
+            ):
+                with ExitStack() as pinned:
+                    with self._lock.read:
+                        if self._index_generation != generation:
+                            return
+                        version = pinned.enter_context(self._versions.pin())
+                        table = self.products
+                        products = table.copy()
+                    built = build(products)
+                    with self._lock.write:
+                        if self._index_generation != generation:
+                            return
+                        install(built, self._versions.changes_since(version, table))
+                with self._indexes_changed:
+                    self._indexes_changed.notify_all()
+        except BaseException as exc:
+            with self._indexes_changed:
+                if self._index_generation == generation:
+                    self._index_error = exc
+                self._indexes_changed.notify_all()
+            raise
+
+    @staticmethod
+    def _build_product_indexes(products: ProductTable) -> _ProductIndexes:
+        indexes = _ProductIndexes()
+        with paused_gc():
+            base = products.base
+            if base is not None:
+                _add_snapshot_to_indexes(indexes, base, products.shadowed())
+            _add_to_indexes(indexes, products.in_memory())
+        return indexes
+
+    def _install_product_indexes(self, indexes: _ProductIndexes, changed: Dict[int, Optional[Product]]):
+        """Swap in indexes built as of a version, then index the writes made since.
+
+        ``changed`` maps the id of each product written since to its value
+        at that version. Call with the write lock held.
+        """
+        for name in _ProductIndexes.__slots__:
+            setattr(self, name, getattr(indexes, name))
+        self._indexed = True
+        for product_id, old in changed.items():
+            self._move_index_entries("products", product_id, old, self.products.get(product_id))
+
+    def _build_text_index(self, products: ProductTable) -> TextIndex:
+        text = TextIndex()
+        for product in products.values():
+            text.add(product.id, self._searchable_text(product))
+        return text
+
+    def _install_text_index(self, text: TextIndex, changed: Dict[int, Optional[Product]]):
+        """Like _install_product_indexes, for the full-text index."""
+        for product_id, old in changed.items():
+            new = self.products.get(product_id)
+            if old is not None:
+                text.remove(product_id, self._searchable_text(old))
+            if new is not None:
+                text.add(product_id, self._searchable_text(new))
+        self._text = text
+
+    def _index_product(self, product: Product):
+        """Add a product to every product index."""
+        product_id = product.id
+        if self._indexed:
+            self._product_ids.add(product_id)
+            self._by_category.add(product.category, product_id)
+            self._by_in_stock.add(product.in_stock, product_id)
+            for tag in product.tags:
+                self._by_tag.add(tag, product_id)
+            self._by_price.add((product.price, product_id))
+            self._by_created_at.add((product.created_at.timestamp(), product_id))
+        if self._text is not None:
+            self._text.add(product_id, self._searchable_text(product))
+
+    def _index_products(self, products: List[Product]):
+        """Add many new products to every index, merging sorted keys in bulk."""
+        if len(products) < 2:
+            for product in products:
+                self._index_product(product)
+            return
+        if self._indexed:
+            _add_to_indexes(self, products)
+        if self._text is not None:
+            for product in products:
+                self._text.add(product.id, self._searchable_text(product))
+
+    def _unindex_product(self, product: Product):
+        """Remove a product from every product index."""
+        product_id = product.id
+        if self._indexed:
+            self._product_ids.discard(product_id)
+            self._by_category.discard(product.category, product_id)
+            self._by_in_stock.discard(product.in_stock, product_id)
+            for tag in product.tags:
+                self._by_tag.discard(tag, product_id)
+            self._by_price.discard((product.price, product_id))
+            self._by_created_at.discard((product.created_at.timestamp(), product_id))
+        if self._text is not None:
+            self._text.remove(product_id, self._searchable_text(product))
+
+    @staticmethod
+    def _updated(record, changes: Dict[str, Any]):
+        """A validated copy of ``record`` with ``changes`` applied; raises ValidationError for bad values."""
+        return type(record).model_validate({**record.__dict__, **changes})
+
+    def _reindex_product(self, old: Product, new: Product):
+        """Move index entries for the fields that changed between two versions.
+
+        Every key is worked out before the first index changes.
+        """
+        product_id = new.id
+        indexed, text = self._indexed, self._text
+        old_tags, new_tags = set(old.tags), set(new.tags)
+        old_price, new_price = (old.price, product_id), (new.price, product_id)
+        old_text, new_text = self._searchable_text(old), self._searchable_text(new)
+        if indexed:
+            if old.category != new.category:
+                self._by_category.discard(old.category, product_id)
+                self._by_category.add(new.category, product_id)
+            if old.in_stock != new.in_stock:
+                self._by_in_stock.discard(old.in_stock, product_id)
+                self._by_in_stock.add(new.in_stock, product_id)
+            for tag in old_tags - new_tags:
+                self._by_tag.discard(tag, product_id)
+            for tag in new_tags - old_tags:
+                self._by_tag.add(tag, product_id)
+            if old_price != new_price:
+                self._by_price.discard(old_price)
+                self._by_price.add(new_price)
+        if text is not None and old_text != new_text:
+            text.remove(product_id, old_text)
+            text.add(product_id, new_text)
+
+    def create_user(self, user_data: UserCreate, user_id: Optional[int] = None) -> User:
+        """Create a new user in the database, with the next id unless ``user_id`` is given.
+
+        Raises DuplicateEmail if another user has the same email, ignoring case.
+        """
+        with self._writing():
+            key = email_key(user_data.email)
+            if key in self._by_email:
+                raise DuplicateEmail(user_data.email)
+            user = User(
+                id=self.next_user_id if user_id is None else user_id,
+                **user_data.model_dump(),
+                created_at=datetime.now()
+            )
+            self._record_write("users", user.id, None)
+            self.users[user.id] = user
+            self._user_ids.add(user.id)
+            self._by_email[key] = user.id
+            self.next_user_id = max(self.next_user_id, user.id + 1)
+            self._log([("put_user", user_row(user))])
+            return user
+
+    def get_all_users(self) -> List[User]:
+        """Get all users as of one version, without blocking writers."""
+        return list(self._iter_snapshot("users"))
+
+    def iter_all_users(self) -> Iterator[User]:
+        return self._iter_snapshot("users")
+
+    def get_users_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[User], Optional[int]]:
+        """Get up to ``limit`` users with ids greater than ``after``.
+
+        Returns the page and the id to resume after, or None on the last page.
+        """
+        with self._lock.read:
+            after = resume_key(None, after)
+            ids = self._user_ids.irange(minimum=after, inclusive=(False, True))
+            return self._take(self.users, ids, limit, record_id)
+
+    def get_user(self, user_id: int) -> Optional[User]:
+        """Get a specific user by ID."""
+        return self.users.get(user_id)
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get the user with ``email``, ignoring case, in O(1) and without a lock."""
+        key = email_key(email)
+        user = self.users.get(self._by_email.get(key))
+        # A concurrent update may have just moved the user to another email
+        if user is None or email_key(user.email) != key:
             return None
+        return user
+
+    def update_user(self, user_id: int, update_data: UserUpdate) -> Optional[User]:
+        """Update an existing user in the database.
+
+        Raises DuplicateEmail if the new email belongs to another user.
+        """
+        with self._writing():
+            user = self.get_user(user_id)
+            if not user:
+                return None
+
+            updated = self._updated(user, update_data.model_dump(exclude_unset=True))
+            old_key, new_key = email_key(user.email), email_key(updated.email)
+            if new_key != old_key and new_key in self._by_email:
+                raise DuplicateEmail(updated.email)
+            self._record_write("users", user_id, user)
+            self.users[user_id] = updated
+            if new_key != old_key:
+                self._by_email[new_key] = user_id
+                if self._by_email.get(old_key) == user_id:
+                    del self._by_email[old_key]
+            self._log([("put_user", user_row(updated))])
+            return updated
+
+    def delete_user(self, user_id: int) -> bool:
+        """Delete a user from the database."""
+        with self._writing():
+            user = self.users.get(user_id)
+            if user is None:
+                return False
+            self._record_write("users", user_id, user)
+            del self.users[user_id]
+            self._user_ids.discard(user_id)
+            key = email_key(user.email)
+            if self._by_email.get(key) == user_id:
+                del self._by_email[key]
+            self._log([("delete_user", user_id)])
+            return True
+
+    def collection_version(self, table: str) -> Optional[int]:
+        return self._collection_versions[table]
+
+    def record_version(self, table: str, record_id: int) -> Optional[int]:
+        if record_id not in getattr(self, table):
+            return None
+        return self._record_versions[table].get(record_id, 0)
+
+    def _record_write(self, table: str, record_id: int, previous: Optional[Any]):
+        """Prepare to write ``table[record_id]``, which holds ``previous`` (None if new).
+
+        Logs the old value for snapshot readers, and queues the record to be
+        stamped with the new version once the write is applied. Call with the
+        write lock held, before changing the table.
+        """
+        self._versions.record(getattr(self, table), record_id, previous)
+        self._written.append((table, record_id, previous is None))
+
+    def _iter_snapshot(self, table_name: str) -> Iterator[Any]:
+        """Iterate a table in id order as of one version, without the lock.
+
+        The version is the one current when iteration starts. Records are
+        read SCAN_CHUNK at a time, and writers record each value they
+        replace in the version log first, so after each chunk whatever it
+        saw of later writes is rolled back to the pinned version, and
+        records deleted before the scan reached them are put back. Only one
+        chunk of snapshot rows is built at a time.
+        """
+        table = getattr(self, table_name)
+        with self._versions.pin() as version:
+            if isinstance(table, ProductTable):
+                records = table.values()
+            else:
+                # Only references are copied; ids may have been inserted out of order
+                records = iter(sorted(table.values(), key=record_id))
+            last = 0
+            while True:
+                chunk = list(islice(records, SCAN_CHUNK))
+                end = chunk[-1].id if chunk else math.inf
+                previous = self._versions.changes_since(version, table)
+                if previous:
+                    merged = {record.id: record for record in chunk}
+                    for key, record in previous.items():
+                        if last < key <= end:
+                            if record is None:
+                                merged.pop(key, None)
+                            else:
+                                merged[key] = record
+                    chunk = sorted(merged.values(), key=record_id)
+                yield from chunk
+                if end == math.inf:
+                    return
+                last = end
+
+    @contextmanager
+    def _writing(self):
+        """Hold the write lock for one write, publishing it as a new version and to ``changes``."""
+        with self._lock.write:
+            self._applied = False
+            next_ids = self.next_id, self.next_user_id
+            try:
+                yield
+            except BaseException:
+                # Nothing of a failed write is published: no new version, and
+                # no ids used up, so a write retried off the event loop gets them
+                self._roll_back()
+                self.next_id, self.next_user_id = next_ids
+                raise
+            else:
+                # Stamped only now, so a reader never pairs a new version with old data
+                version = self._versions.version + 1
+                written: Dict[Tuple[str, int], bool] = {}
+                for table, key, created in self._written:
+                    versions = self._record_versions[table]
+                    if key in getattr(self, table):
+                        versions[key] = version
+                    else:
+                        # Deleted records have no version; keep churn from growing this
+                        versions.pop(key, None)
+                    self._collection_versions[table] = version
+                    written.setdefault((table, key), created)
+                self._written.clear()
+                self._versions.commit()
+                for (table, key), created in written.items():
+                    record = getattr(self, table).get(key)
+                    op = "delete" if record is None else "create" if created else "update"
+                    self.changes.append(op, table, key, record)
+
+    def _roll_back(self):
+        """Undo a write that failed part way through.
+
+        Restores each record it replaced, from the values it recorded for
+        snapshot readers. A write that failed in _log, on I/O or WouldBlock,
+        left the indexes matching its records, so their entries are moved
+        back record by record; one that failed earlier may have left them
+        in any state, so the indexes of the tables it touched are rebuilt.
+        """
+        uncommitted = self._versions.uncommitted()
+        for table, name in ((self.products, "products"), (self.users, "users")):
+            # Newest first, so each key ends up with the value it had before the write
+            original = {key: previous for entry_table, key, previous in uncommitted if entry_table is table}
+            for key, previous in original.items():
+                current = table.get(key)
+                if previous is not None:
+                    table[key] = previous
+                elif current is not None:
+                    del table[key]
+                if self._applied:
+                    self._move_index_entries(name, key, current, previous)
+        tables = {table for table, _, _ in self._written}
+        if not self._applied and "products" in tables:
+            self._start_index_build()
+        if not self._applied and "users" in tables:
+            self._user_ids.clear()
+            self._user_ids.update(self.users)
+            self._by_email = self._email_index(self.users)
+        self._written.clear()
+
+    def _move_index_entries(self, table: str, key: int, old: Optional[Any], new: Optional[Any]):
+        """Move the index entries of ``table[key]`` from record ``old`` to ``new``; None for no record."""
+        if table == "products":
+            if old is not None and new is not None:
+                self._reindex_product(old, new)
+            elif old is not None:
+                self._unindex_product(old)
+            elif new is not None:
+                self._index_product(new)
+            return
+        if old is not None:
+            self._user_ids.discard(key)
+            if self._by_email.get(email_key(old.email)) == key:
+                del self._by_email[email_key(old.email)]
+        if new is not None:
+            self._user_ids.add(key)
+            self._by_email.setdefault(email_key(new.email), key)
+
+    @staticmethod
+    def _take(table: dict, ids: Iterator[int], limit: Optional[int], sort_key: Callable):
+        """Read up to ``limit`` records for ``ids`` and the sort key to resume after."""
+        if limit is None:
+            return [table[key] for key in ids], None
+        page = [table[key] for key in islice(ids, limit + 1)]
+        if len(page) > limit:
+            del page[limit:]
+            return page, sort_key(page[-1])
+        return page, None
+
+
+class ShardedView(Mapping):
+    """Read-only ``{id: record}`` view over the same table of every shard, in id order."""
+
+    def __init__(self, sharded: "ShardedDatabase", table: str):
+        self._sharded = sharded
+        self._table = table
+
+    def __len__(self) -> int:
+        return sum(len(getattr(shard, self._table)) for shard in self._sharded.shards)
+
+    def __getitem__(self, record_id: int):
+        return getattr(self._sharded.shard_for(record_id), self._table)[record_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return heapq.merge(*(list(getattr(shard, self._table)) for shard in self._sharded.shards))
+
+
+class ShardedDatabase(Storage):
+    """Products and users hash-partitioned by id across InMemoryDatabase shards.
+
+    Each shard has its own lock and secondary indexes, so writes to
+    different shards do not contend; ids are allocated here and a record
+    lives on shard ``id % len(shards)``. Lookups and writes by id go to one
+    shard. Listings, filtered queries and search ask every shard for a
+    page and merge them. Each shard's part is consistent, but the shards
+    are not read at a single point in time. Search ranks with per-shard
+    BM25 statistics, which match the global ones closely once shards hold
+    more than a few hundred products each.
+    """
+
+    def __init__(
+        self,
+        shards: int = 4,
+        persistence: Optional[List[Persistence]] = None,
+        compact: bool = False,
+        changes: Optional[ChangeLog] = None,
+    ):
+        if shards < 1:
+            raise ValueError("A sharded database needs at least one shard")
+        if persistence is not None and len(persistence) != shards:
+            raise ValueError("Persistence must be given for every shard or none")
+        # One log for every shard, so changes are numbered across them
+        self.changes = ChangeLog() if changes is None else changes
+        self.shards = [
+            InMemoryDatabase(
+                None if persistence is None else persistence[i], sample_data=False, compact=compact,
+                changes=self.changes, id_stride=shards,
+            )
+            for i in range(shards)
+        ]
+        self.products = ShardedView(self, "products")
+        self.users = ShardedView(self, "users")
+        self._ids_lock = threading.Lock()
+        # Serializes user writes that claim an email, which must be unique
+        # across shards while each shard only checks its own users
+        self._emails_lock = threading.Lock()
+        self.next_id = max(shard.next_id for shard in self.shards)
+        self.next_user_id = max(shard.next_user_id for shard in self.shards)
+        if not any(shard._recovered for shard in self.shards):
+            self._init_sample_data()
+
+    @property
+    def blocking_writes(self) -> bool:
+        return any(shard.blocking_writes for shard in self.shards)
+
+    def shard_for(self, record_id: int) -> InMemoryDatabase:
+        """The shard holding the product or user with ``record_id``."""
+        return self.shards[record_id % len(self.shards)]
 
-        update_dict = update_data.model_dump(exclude_unset=True)
-        for field, value in update_dict.items():
-            setattr(product, field, value)
+    def _allocate(self, field: str, count: int = 1) -> int:
+        """Reserve ``count`` consecutive ids from ``next_id`` or ``next_user_id``; returns the first."""
+        with hold(self._ids_lock):
+            first = getattr(self, field)
+            setattr(self, field, first + count)
+            return first
 
-        return product
+    def collection_version(self, table: str) -> Optional[int]:
+        # Every shard's counter only grows, so their sum does too
+        return sum(shard.collection_version(table) for shard in self.shards)
+
+    def record_version(self, table: str, record_id: int) -> Optional[int]:
+        return self.shard_for(record_id).record_version(table, record_id)
+
+    def checkpoint(self, wait: bool = False):
+        """Snapshot every shard now."""
+        for shard in self.shards:
+            shard.checkpoint(wait=wait)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def clear(self):
+        """Remove all products and users and reset id allocation."""
+        with self._ids_lock:
+            for shard in self.shards:
+                shard.clear()
+            self.next_id = 1
+            self.next_user_id = 1
+
+    def create_product(self, product_data: ProductCreate) -> Product:
+        product_id = self._allocate("next_id")
+        return self.shard_for(product_id).create_product(product_data, product_id)
+
+    def get_all_products(self) -> List[Product]:
+        return list(self.iter_all_products())
+
+    def iter_all_products(self) -> Iterator[Product]:
+        return heapq.merge(*(shard.iter_all_products() for shard in self.shards), key=record_id)
+
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[ProductSort] = None,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+    ) -> Tuple[List[Product], Optional[Any]]:
+        """Get products matching every given filter, ordered by ``sort`` (id by default).
+
+        Every shard returns its first ``limit`` matches after ``after``; the
+        first ``limit`` of their merge are the first ``limit`` overall.
+        """
+        pages = [
+            shard.query_products(category, in_stock, tags, min_price, max_price, sort, limit, after)
+            for shard in self.shards
+        ]
+        sort_key = PRODUCT_SORT_KEYS[sort]
+        return self._merge_pages(pages, limit, sort_key, reverse=sort == "-price")
+
+    @staticmethod
+    def _merge_pages(pages: List[tuple], limit: Optional[int], sort_key: Callable, reverse: bool = False):
+        """Merge per-shard ``(page, next_after)`` results into one page of at most ``limit``."""
+        merged = list(heapq.merge(*(page for page, _ in pages), key=sort_key, reverse=reverse))
+        if limit is None:
+            return merged, None
+        more = len(merged) > limit or any(next_after is not None for _, next_after in pages)
+        del merged[limit:]
+        return merged, sort_key(merged[-1]) if more and merged else None
+
+    def get_product(self, product_id: int) -> Optional[Product]:
+        return self.shard_for(product_id).get_product(product_id)
+
+    def update_product(self, product_id: int, update_data: ProductUpdate) -> Optional[Product]:
+        return self.shard_for(product_id).update_product(product_id, update_data)
 
     def delete_product(self, product_id: int) -> bool:
-        """Delete a product from the database."""
-        for i, product in enumerate(self.products):
-            if product.id == product_id:
-                del self.products[i]
-                return True
-        return False
+        return self.shard_for(product_id).delete_product(product_id)
 
-    def create_user(self, user_data: UserCreate) -> User:
-        """Create a new user in the database."""
-        user = User(
-            id=self.next_user_id,
-            **user_data.model_dump(),
-            created_at=datetime.now()
+    def bulk_products(self, operations: Iterable[ProductOperation]) -> List[BulkItemResult]:
+        """Apply a batch of product writes, one sub-batch per shard.
+
+        Operations keep their order within a shard; results come back in
+        the order of ``operations``.
+        """
+        operations = list(operations)
+        first_id = self._allocate("next_id", sum(op == "create" for op, _, _ in operations))
+        by_shard: Dict[int, List[Tuple[int, ProductOperation]]] = {}
+        for position, (op, product_id, payload) in enumerate(operations):
+            if op == "create":
+                product_id, first_id = first_id, first_id + 1
+            by_shard.setdefault(product_id % len(self.shards), []).append((position, (op, product_id, payload)))
+
+        results: List[Optional[BulkItemResult]] = [None] * len(operations)
+        for index, batch in by_shard.items():
+            shard_results = self.shards[index].bulk_products([operation for _, operation in batch])
+            for (position, _), result in zip(batch, shard_results):
+                results[position] = result
+        return results
+
+    def search_products(self, query: str, limit: int) -> List[Product]:
+        """Get up to ``limit`` products best matching ``query``, ranked by per-shard BM25."""
+        hits = heapq.merge(
+            *(shard.search_products_scored(query, limit) for shard in self.shards),
+            key=lambda hit: (-hit[1], hit[0].id),
         )
-        self.users.append(user)
-        self.next_user_id += 1
-        return user
+        return [product for product, _ in islice(hits, limit)]
+
+    def create_user(self, user_data: UserCreate) -> User:
+        with hold(self._emails_lock):
+            if self.get_user_by_email(user_data.email) is not None:
+                raise DuplicateEmail(user_data.email)
+            user_id = self._allocate("next_user_id")
+            return self.shard_for(user_id).create_user(user_data, user_id)
 
     def get_all_users(self) -> List[User]:
-        """Get all users from the database."""
-        return self.users
+        return list(self.iter_all_users())
+
+    def iter_all_users(self) -> Iterator[User]:
+        return heapq.merge(*(shard.iter_all_users() for shard in self.shards), key=record_id)
+
+    def get_users_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[User], Optional[int]]:
+        pages = [shard.get_users_page(limit, after) for shard in self.shards]
+        return self._merge_pages(pages, limit, record_id)
 
     def get_user(self, user_id: int) -> Optional[User]:
-        """Get a specific user by ID."""
-        for user in self.users:
-            if user.id == user_id:
+        return self.shard_for(user_id).get_user(user_id)
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        """Ask each shard's email index in turn: O(shards), whatever the number of users."""
+        for shard in self.shards:
+            user = shard.get_user_by_email(email)
+            if user is not None:
                 return user
         return None
 
     def update_user(self, user_id: int, update_data: UserUpdate) -> Optional[User]:
-        """Update an existing user in the database."""
-        user = self.get_user(user_id)
-        if not user:
-            return None
+        if update_data.email is None:
+            return self.shard_for(user_id).update_user(user_id, update_data)
+        with hold(self._emails_lock):
+            owner = self.get_user_by_email(update_data.email)
+            if owner is not None and owner.id != user_id:
+                raise DuplicateEmail(update_data.email)
+            return self.shard_for(user_id).update_user(user_id, update_data)
 
-        update_dict = update_data.dict(exclude_unset=True)
-        for field, value in update_dict.items():
-            setattr(user, field, value)
+    def delete_user(self, user_id: int) -> bool:
+        return self.shard_for(user_id).delete_user(user_id)
 
-        return user
 
-    def delete_user(self, user_id: int) -> bool:
-        """Delete a user from the database."""
-        for i, user in enumerate(self.users):
-            if user.id == user_id:
-                del self.users[i]
-                return True
-        return False
+def create_database(config: Settings = settings) -> Storage:
+    """Build the storage backend described by ``config``."""
+    if config.storage_socket:
+        return RemoteDatabase(config.storage_socket, change_log_size=config.change_log_size)
+    if config.backend == "sqlite":
+        return SQLiteDatabase(config.sqlite_path, pool_size=config.sqlite_pool_size)
+    if config.backend != "memory":
+        raise ValueError(f"Unknown storage backend {config.backend!r}")
+
+    def open_persistence(data_dir: str) -> Persistence:
+        return Persistence(
+            data_dir,
+            commit_interval=config.wal_commit_interval,
+            snapshot_every=config.snapshot_every,
+        )
+
+    if config.shards > 1:
+        persistence = None
+        if config.data_dir:
+            persistence = [
+                open_persistence(os.path.join(config.data_dir, f"shard-{i}")) for i in range(config.shards)
+            ]
+        return ShardedDatabase(
+            config.shards, persistence=persistence, compact=config.compact_products,
+            changes=ChangeLog(config.change_log_size, config.sync_log_size),
+        )
+    return InMemoryDatabase(
+        persistence=open_persistence(config.data_dir) if config.data_dir else None,
+        compact=config.compact_products,
+        changes=ChangeLog(config.change_log_size, config.sync_log_size),
+    )
 
 
 # Global database instance
-db = InMemoryDatabase()
+db = create_database()
@@ -0,0 +1,134 @@
+"""Server-sent event streams of committed changes."""
+import asyncio
+import weakref
+from typing import AsyncIterator, Callable, Optional
+
+from changes import Change, ChangeLog
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+# Seconds an idle stream waits before sending a comment, so proxies keep it open
+KEEPALIVE_INTERVAL = 15.0
+KEEPALIVE = b": keepalive\n\n"
+
+
+def event_id(epoch: str, seq: int) -> str:
+    """The id of the event for change ``seq``; like ETags, it names the epoch too."""
+    return f"{epoch}-{seq}"
+
+
+def parse_event_id(last_event_id: Optional[str], epoch: str) -> Optional[int]:
+    """The change number in a ``Last-Event-ID`` from this epoch's feed, or None."""
+    if last_event_id is None:
+        return None
+    prefix, _, seq = last_event_id.strip().rpartition("-")
+    if prefix != epoch or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+def format_event(event: str, id: str, data: bytes) -> bytes:
+    """One SSE message; ``data`` must be a single line, as compact JSON is."""
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (id.encode(), event.encode(), data)
+
+
+class ChangeNotifier:
+    """Wakes the streams of one event loop when a change log grows.
+
+    However many streams sit idle, they all await one asyncio.Event. While
+    any is waiting, the notifier listens to the log and, on the first
+    change since the last wake-up, asks the loop to set the event; a burst
+    of writes from other threads costs the loop one wake-up.
+    """
+
+    def __init__(self, changes: ChangeLog, loop: asyncio.AbstractEventLoop):
+        self.changes = changes
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._waiting = 0
+        self._scheduled = False
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """Wait until the log has changes after ``seq``; False if ``timeout`` seconds pass first."""
+        event = self._event
+        if not self._waiting:
+            self.changes.subscribe(self._changed)
+        self._waiting += 1
+        try:
+            # Checked after subscribing, so no change can slip in unnoticed
+            if self.changes.last_seq != seq:
+                return True
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiting -= 1
+            if not self._waiting:
+                self.changes.unsubscribe(self._changed)
+
+    def _changed(self):
+        # On the writing thread
+        if self._scheduled:
+            return
+        self._scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The loop is closed, with streams still waiting on it
+            self.changes.unsubscribe(self._changed)
+
+    def _wake(self):
+        self._scheduled = False
+        # Waiters hold the old event; later ones get a fresh one
+        self._event.set()
+        self._event = asyncio.Event()
+
+
+_notifiers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ChangeNotifier]" = weakref.WeakKeyDictionary()
+
+
+def notifier_for(changes: ChangeLog) -> ChangeNotifier:
+    """The ChangeNotifier for ``changes`` on the running event loop."""
+    loop = asyncio.get_running_loop()
+    notifier = _notifiers.get(loop)
+    if notifier is None or notifier.changes is not changes:
+        notifier = _notifiers[loop] = ChangeNotifier(changes, loop)
+    return notifier
+
+
+async def iter_events(
+    changes: ChangeLog, epoch: str, table: str, seq: Optional[int], encode: Callable[[Change], bytes]
+) -> AsyncIterator[bytes]:
+    """Stream changes to ``table`` after change ``seq`` as SSE messages, forever.
+
+    Events are named after the change: "create" and "update" carry the
+    record as ``encode`` renders it, "delete" carries ``{"id": ...}``. A
+    "reset" event means changes were missed, because ``seq`` is None or no
+    longer in the log, or the tables were cleared: the client should
+    reload everything. Changes to other tables only advance the position.
+    """
+    notifier = notifier_for(changes)
+    if seq is None:
+        seq = changes.last_seq
+        yield format_event("reset", event_id(epoch, seq), b"{}")
+    while True:
+        batch = changes.since(seq)
+        if batch is None:
+            seq = changes.last_seq
+            yield format_event("reset", event_id(epoch, seq), b"{}")
+            continue
+        if not batch:
+            if not await notifier.wait(seq, KEEPALIVE_INTERVAL):
+                yield KEEPALIVE
+            continue
+        seq = batch[-1].seq
+        messages = []
+        for change in batch:
+            if change.table is None:
+                messages.append(format_event("reset", event_id(epoch, change.seq), b"{}"))
+            elif change.table == table:
+                data = b'{"id":%d}' % change.id if change.op == "delete" else encode(change)
+                messages.append(format_event(change.op, event_id(epoch, change.seq), data))
+        if messages:
+            yield b"".join(messages)
@@ -0,0 +1,59 @@
+"""Streaming encoders for bulk exports."""
+import csv
+import io
+from itertools import islice
+from typing import AbstractSet, Iterable, Iterator, List
+
+from pydantic import BaseModel
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Rows are encoded in batches so each chunk is a reasonable write size
+ROWS_PER_CHUNK = 500
+
+
+def _batches(records: Iterable[BaseModel]) -> Iterator[List[BaseModel]]:
+    """Split records into lists of at most ROWS_PER_CHUNK."""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, ROWS_PER_CHUNK))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_ndjson(records: Iterable[BaseModel], exclude: AbstractSet[str] = frozenset()) -> Iterator[bytes]:
+    """Yield records as newline-delimited JSON, one object per line."""
+    exclude = set(exclude) or None
+    for batch in _batches(records):
+        yield b"".join(record.model_dump_json(exclude=exclude).encode() + b"\n" for record in batch)
+
+
+def iter_csv(
+    records: Iterable[BaseModel], fields: List[str], exclude: AbstractSet[str] = frozenset()
+) -> Iterator[bytes]:
+    """Yield records as CSV with a header row; list values are joined with ``|``."""
+    columns = [field for field in fields if field not in exclude]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(records):
+        for record in batch:
+            writer.writerow([_csv_value(getattr(record, column)) for column in columns])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _csv_value(value):
+    """Flatten a field value into a CSV cell."""
+    if isinstance(value, list):
+        return "|".join(map(str, value))
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
@@ -0,0 +1,57 @@
+"""Encoding of stored models straight to JSON bytes."""
+from typing import AbstractSet, Any
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    # Only called for types orjson does not know, so models in practice
+    try:
+        return obj.__dict__
+    except AttributeError:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable") from None
+
+
+def field_values(model: BaseModel, exclude: AbstractSet[str]) -> dict:
+    """``model``'s field values by name, without the ``exclude`` fields; the model's own dict if none."""
+    if not exclude:
+        return model.__dict__
+    return {name: value for name, value in model.__dict__.items() if name not in exclude}
+
+
+def dumps(content: Any, exclude: AbstractSet[str] = frozenset()) -> bytes:
+    """Encode ``content``, including pydantic models, as compact JSON.
+
+    Models are read through their field values without validation or
+    ``model_dump``, so they must be ones the application built itself
+    (every model in ``models`` is flat and has no custom serializers). The
+    output matches ``model_dump_json`` for them. Fields named in
+    ``exclude`` are left out of ``content`` or, for a list, of each item.
+    """
+    if isinstance(content, list):
+        # Saves a call into _default per item
+        content = [field_values(item, exclude) if isinstance(item, BaseModel) else item for item in content]
+    elif isinstance(content, BaseModel):
+        content = field_values(content, exclude)
+    return orjson.dumps(content, default=_default)
+
+
+class TrustedJSONResponse(Response):
+    """JSON response for content built from already-validated models.
+
+    Returning one from an endpoint bypasses FastAPI's ``response_model``
+    validation and encoding, while the route's ``response_model`` still
+    documents the schema in OpenAPI. ``exclude`` names model fields to
+    leave out, as for ``dumps``.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, content: Any, *args, exclude: AbstractSet[str] = frozenset(), **kwargs):
+        self.exclude = exclude
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content, self.exclude)
@@ -1,6 +1,9 @@
 import { Link } from 'react-router-dom'
 import './ProductCard.css'
 
+// Every product field the card renders; lists fetch only these
+export const PRODUCT_CARD_FIELDS = ['id', 'name', 'description', 'price', 'category', 'tags', 'in_stock']
+
 export default function ProductCard({ product, onDelete }) {
   const handleDelete = () => {
     if (window.confirm(`Are you sure you want to delete "${product.name}"?`)) {
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react'
 import { Link } from 'react-router-dom'
-import { productApi } from '../../services/api'
-import ProductCard from './ProductCard'
+import { productApi, upsertById } from '../../services/api'
+import ProductCard, { PRODUCT_CARD_FIELDS } from './ProductCard'
 import './ProductList.css'
 
 export default function ProductList() {
@@ -9,15 +9,21 @@ export default function ProductList() {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
 
+  // Load once the change feed is open, then apply its changes as they come
   useEffect(() => {
-    fetchProducts()
+    return productApi.subscribe({
+      onReset: fetchProducts,
+      onCreate: (record) => setProducts((current) => upsertById(current, record)),
+      onUpdate: (record) => setProducts((current) => upsertById(current, record)),
+      onDelete: (id) => setProducts((current) => current.filter((p) => p.id !== id)),
+    })
   }, [])
 
   const fetchProducts = async () => {
     setLoading(true)
     setError(null)
     try {
-      const data = await productApi.getAll()
+      const data = await productApi.getAll({ fields: PRODUCT_CARD_FIELDS })
       setProducts(data)
     } catch (err) {
       setError(err.message || 'Failed to fetch products')
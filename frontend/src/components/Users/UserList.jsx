@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import { Link } from 'react-router-dom'
-import { userApi } from '../../services/api'
+import { userApi, upsertById } from '../../services/api'
 import UserCard from './UserCard'
 import './UserList.css'
 
@@ -9,8 +9,14 @@ export default function UserList() {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
 
+  // Load once the change feed is open, then apply its changes as they come
   useEffect(() => {
-    fetchUsers()
+    return userApi.subscribe({
+      onReset: fetchUsers,
+      onCreate: (record) => setUsers((current) => upsertById(current, record)),
+      onUpdate: (record) => setUsers((current) => upsertById(current, record)),
+      onDelete: (id) => setUsers((current) => current.filter((u) => u.id !== id)),
+    })
   }, [])
 
   const fetchUsers = async () => {
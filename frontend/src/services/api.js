@@ -9,19 +9,110 @@ async function handleResponse(response) {
   return response.json();
 }
 
+// Last response per URL with its ETag, reused when the server answers 304
+const etagCache = new Map();
+
+// GET a URL, revalidating with If-None-Match; returns { data, nextCursor }
+async function cachedGet(url) {
+  const cached = etagCache.get(url);
+  const response = await fetch(url, {
+    // This cache does the revalidation, so keep the browser's out of the way
+    cache: 'no-store',
+    headers: cached ? { 'If-None-Match': cached.etag } : {},
+  });
+  if (response.status === 304 && cached) {
+    return cached.result;
+  }
+  const result = {
+    data: await handleResponse(response),
+    nextCursor: response.headers.get('X-Next-Cursor'),
+  };
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    etagCache.set(url, { etag, result });
+  } else {
+    etagCache.delete(url);
+  }
+  return result;
+}
+
+const PAGE_SIZE = 100;
+
+// Fetch one keyset page; nextCursor is null on the last page. With fields,
+// records only carry those fields
+async function fetchPage(path, { limit = PAGE_SIZE, cursor = null, fields = null } = {}) {
+  const params = new URLSearchParams({ limit });
+  if (cursor) {
+    params.set('cursor', cursor);
+  }
+  if (fields) {
+    params.set('fields', fields.join(','));
+  }
+  const { data, nextCursor } = await cachedGet(`${API_BASE_URL}${path}?${params}`);
+  return { items: data, nextCursor };
+}
+
+// Yield pages until the server stops returning a next cursor
+async function* iteratePages(path, options = {}) {
+  let cursor = null;
+  do {
+    const page = await fetchPage(path, { ...options, cursor });
+    yield page.items;
+    cursor = page.nextCursor;
+  } while (cursor);
+}
+
+// Follow a server-sent change feed until the returned function is called.
+// onReset fires on connect and whenever changes were missed: reload then.
+// The browser reconnects by itself, resuming after the last event it saw;
+// if the server has no feed, onReset fires once and the list stays static.
+function subscribe(path, { onReset, onCreate, onUpdate, onDelete }) {
+  const source = new EventSource(`${API_BASE_URL}${path}`);
+  source.addEventListener('reset', () => onReset());
+  source.addEventListener('create', (event) => onCreate(JSON.parse(event.data)));
+  source.addEventListener('update', (event) => onUpdate(JSON.parse(event.data)));
+  source.addEventListener('delete', (event) => onDelete(JSON.parse(event.data).id));
+  source.addEventListener('error', () => {
+    if (source.readyState === EventSource.CLOSED) {
+      onReset();
+    }
+  });
+  return () => source.close();
+}
+
+// Insert or replace a record in a list kept in id order
+export function upsertById(records, record) {
+  const index = records.findIndex((r) => r.id >= record.id);
+  if (index === -1) {
+    return [...records, record];
+  }
+  const next = [...records];
+  next.splice(index, records[index].id === record.id ? 1 : 0, record);
+  return next;
+}
+
 // PRODUCTS API CALLS
 export const productApi = {
-  // Get all products
-  getAll: async () => {
-    const response = await fetch(`${API_BASE_URL}/products`);
-    return handleResponse(response);
+  // Get all products, one page at a time; options.fields limits their fields
+  getAll: async (options) => {
+    const products = [];
+    for await (const page of productApi.iteratePages(options)) {
+      products.push(...page);
+    }
+    return products;
   },
 
+  // Get a single page of products
+  getPage: (options) => fetchPage('/products', options),
+
+  // Iterate over every page of products
+  iteratePages: (options) => iteratePages('/products', options),
+
   // Get a specific product by ID
-  getById: async (id) => {
-    const response = await fetch(`${API_BASE_URL}/products/${id}`);
-    return handleResponse(response);
-  },
+  getById: async (id) => (await cachedGet(`${API_BASE_URL}/products/${id}`)).data,
+
+  // Follow product creates, updates and deletes as they happen
+  subscribe: (handlers) => subscribe('/products/events', handlers),
 
   // Create a new product
   create: async (productData) => {
@@ -59,16 +150,16 @@ export const productApi = {
 // USERS API CALLS
 export const userApi = {
   // Get all users
-  getAll: async () => {
-    const response = await fetch(`${API_BASE_URL}/users`);
-    return handleResponse(response);
-  },
+  getAll: async () => (await cachedGet(`${API_BASE_URL}/users`)).data,
+
+  // Get a single page of users
+  getPage: (options) => fetchPage('/users', options),
 
   // Get a specific user by ID
-  getById: async (id) => {
-    const response = await fetch(`${API_BASE_URL}/users/${id}`);
-    return handleResponse(response);
-  },
+  getById: async (id) => (await cachedGet(`${API_BASE_URL}/users/${id}`)).data,
+
+  // Follow user creates, updates and deletes as they happen
+  subscribe: (handlers) => subscribe('/users/events', handlers),
 
   // Create a new user
   create: async (userData) => {
@@ -0,0 +1,213 @@
+"""Index structures used by the in-memory database."""
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+from operator import lt
+from typing import AbstractSet, Any, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+_EMPTY: AbstractSet[int] = frozenset()
+
+
+class HashIndex:
+    """Maps each field value to the set of record ids holding it.
+
+    Indexing every element of a list field (such as tags) makes this an
+    inverted index.
+    """
+
+    def __init__(self):
+        self._ids: Dict[Hashable, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, value: Hashable, record_id: int):
+        """Record that ``record_id`` holds ``value``."""
+        ids = self._ids.get(value)
+        if ids is None:
+            self._ids[value] = {record_id}
+        else:
+            ids.add(record_id)
+
+    def update(self, value: Hashable, record_ids: AbstractSet[int]):
+        """Record that every id in ``record_ids`` holds ``value``."""
+        ids = self._ids.get(value)
+        if ids is None:
+            self._ids[value] = set(record_ids)
+        else:
+            ids |= record_ids
+
+    def discard(self, value: Hashable, record_id: int):
+        """Forget that ``record_id`` holds ``value``."""
+        ids = self._ids.get(value)
+        if ids is None:
+            return
+        ids.discard(record_id)
+        if not ids:
+            del self._ids[value]
+
+    def get(self, value: Hashable) -> AbstractSet[int]:
+        """Return the ids holding ``value``; callers must not mutate the result."""
+        return self._ids.get(value, _EMPTY)
+
+    def clear(self):
+        """Remove every entry."""
+        self._ids.clear()
+
+
+class SortedIndex:
+    """Sorted set of keys with logarithmic updates and range scans.
+
+    Keys live in a list of small sorted buckets, so an insert or removal only
+    shifts one bucket instead of the whole key list.
+    """
+
+    _LOAD = 1000
+
+    def __init__(self, keys: Iterable[Any] = ()):
+        self._buckets: List[list] = []
+        self._maxes: list = []
+        self._len = 0
+        self.update(keys)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Any]:
+        return chain.from_iterable(self._buckets)
+
+    def __contains__(self, key: Any) -> bool:
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return False
+        bucket = self._buckets[pos]
+        return bucket[bisect_left(bucket, key)] == key
+
+    def add(self, key: Any):
+        """Insert ``key``; adding a key that is already present is a no-op."""
+        maxes = self._maxes
+        if not maxes:
+            self._buckets.append([key])
+            maxes.append(key)
+            self._len = 1
+            return
+
+        pos = bisect_left(maxes, key)
+        if pos == len(maxes):
+            # Larger than every key (the common case for ids): append
+            pos -= 1
+            bucket = self._buckets[pos]
+            bucket.append(key)
+            maxes[pos] = key
+        else:
+            bucket = self._buckets[pos]
+            i = bisect_left(bucket, key)
+            if bucket[i] == key:
+                return
+            bucket.insert(i, key)
+
+        self._len += 1
+        if len(bucket) > 2 * self._LOAD:
+            self._buckets.insert(pos + 1, bucket[self._LOAD:])
+            del bucket[self._LOAD:]
+            maxes.insert(pos + 1, maxes[pos])
+            maxes[pos] = bucket[-1]
+
+    def discard(self, key: Any) -> bool:
+        """Remove ``key`` if present and report whether it was found."""
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return False
+        bucket = self._buckets[pos]
+        i = bisect_left(bucket, key)
+        if bucket[i] != key:
+            return False
+
+        del bucket[i]
+        self._len -= 1
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+        return True
+
+    def update(self, keys: Iterable[Any]):
+        """Insert many keys, rebuilding the buckets when that is cheaper."""
+        keys = list(keys)
+        if not keys:
+            return
+        if len(keys) < len(self) // 8:
+            for key in keys:
+                self.add(key)
+            return
+
+        if not self._len and all(map(lt, keys, islice(keys, 1, None))):
+            # Already sorted and unique, as when loading a snapshot column
+            merged = keys
+        else:
+            merged = sorted(set(chain(self, keys)))
+        load = self._LOAD
+        self._buckets = [merged[i:i + load] for i in range(0, len(merged), load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(merged)
+
+    def clear(self):
+        """Remove every key."""
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def _locate(self, key: Any, right: bool) -> Tuple[int, int]:
+        """Return the (bucket, offset) position where ``key`` would be inserted."""
+        find = bisect_right if right else bisect_left
+        pos = find(self._maxes, key)
+        if pos == len(self._maxes):
+            return pos, 0
+        return pos, find(self._buckets[pos], key)
+
+    def irange(
+        self,
+        minimum: Optional[Any] = None,
+        maximum: Optional[Any] = None,
+        inclusive: Tuple[bool, bool] = (True, True),
+        reverse: bool = False,
+    ) -> Iterator[Any]:
+        """Iterate keys between ``minimum`` and ``maximum`` in sorted order.
+
+        ``None`` leaves that end of the range open. Finding the start costs
+        O(log n); each yielded key is O(1) after that.
+        """
+        if reverse:
+            return self._iter_reverse(minimum, maximum, inclusive)
+        return self._iter_forward(minimum, maximum, inclusive)
+
+    def _iter_forward(self, minimum, maximum, inclusive) -> Iterator[Any]:
+        if minimum is None:
+            pos, offset = 0, 0
+        else:
+            pos, offset = self._locate(minimum, right=not inclusive[0])
+
+        buckets = self._buckets
+        for bucket in buckets[pos:]:
+            for key in bucket[offset:] if offset else bucket:
+                if maximum is not None and (key > maximum or (key == maximum and not inclusive[1])):
+                    return
+                yield key
+            offset = 0
+
+    def _iter_reverse(self, minimum, maximum, inclusive) -> Iterator[Any]:
+        if maximum is None:
+            pos, offset = len(self._buckets) - 1, None
+        else:
+            pos, offset = self._locate(maximum, right=inclusive[1])
+            if offset == 0:
+                pos, offset = pos - 1, None
+
+        buckets = self._buckets
+        while pos >= 0:
+            bucket = buckets[pos]
+            for key in reversed(bucket[:offset] if offset is not None else bucket):
+                if minimum is not None and (key < minimum or (key == minimum and not inclusive[0])):
+                    return
+                yield key
+            pos, offset = pos - 1, None
@@ -0,0 +1,131 @@
+"""Synchronization primitives for the in-memory database."""
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+_local = threading.local()
+
+
+class WouldBlock(Exception):
+    """Raised in place of waiting for a lock inside ``non_blocking()``."""
+
+
+@contextmanager
+def non_blocking():
+    """Make the locks in this module raise WouldBlock in this thread rather than wait.
+
+    For code on the event loop, which must not wait for a lock held by a
+    worker thread; it catches WouldBlock and retries where waiting is fine.
+    """
+    previous = getattr(_local, "non_blocking", False)
+    _local.non_blocking = True
+    try:
+        yield
+    finally:
+        _local.non_blocking = previous
+
+
+def _may_wait() -> bool:
+    return not getattr(_local, "non_blocking", False)
+
+
+def refuse_if_non_blocking():
+    """Raise WouldBlock inside ``non_blocking()``; for work too slow to run on the event loop."""
+    if not _may_wait():
+        raise WouldBlock
+
+
+def wait_for(condition: threading.Condition, predicate: Callable[[], bool]):
+    """``condition.wait_for(predicate)``, raising WouldBlock inside ``non_blocking()`` rather than wait.
+
+    Call with ``condition`` held.
+    """
+    if not predicate():
+        if not _may_wait():
+            raise WouldBlock
+        condition.wait_for(predicate)
+
+
+@contextmanager
+def hold(lock: threading.Lock):
+    """``with lock:``, raising WouldBlock inside ``non_blocking()`` if it is taken."""
+    if not lock.acquire(blocking=_may_wait()):
+        raise WouldBlock
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+class RWLock:
+    """Reader-writer lock: many concurrent readers or one writer.
+
+    Writers are preferred: once a writer is waiting, new readers queue
+    behind it, so a steady stream of reads cannot starve writes. Neither
+    side is reentrant. Use ``with lock.read:`` and ``with lock.write:``.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self.read = _ReadSide(self)
+        self.write = _WriteSide(self)
+
+    def acquire_read(self):
+        """Block until no writer holds or waits for the lock, then join the readers."""
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                if not _may_wait():
+                    raise WouldBlock
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers and self._writers_waiting:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Block until there are no readers or writer, then hold the lock alone."""
+        with self._cond:
+            if (self._writer or self._readers) and not _may_wait():
+                raise WouldBlock
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class _ReadSide:
+    __slots__ = ("_lock",)
+
+    def __init__(self, lock: RWLock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_read()
+
+    def __exit__(self, *exc_info):
+        self._lock.release_read()
+
+
+class _WriteSide:
+    __slots__ = ("_lock",)
+
+    def __init__(self, lock: RWLock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_write()
+
+    def __exit__(self, *exc_info):
+        self._lock.release_write()
@@ -1,17 +1,52 @@
 """FastAPI application for Product CRUD operations."""
-from typing import List
+import os
+from contextlib import asynccontextmanager
+from typing import AbstractSet, Any, Awaitable, Callable, Iterable, List, Literal, Optional
 import uvicorn
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
-from models import Product, ProductCreate, ProductUpdate, User, UserCreate, UserUpdate
+from models import (
+    BulkItemResult, BulkResult, PasswordCheck, PasswordCheckResult, Product, ProductBulkRequest,
+    ProductChanges, ProductCreate, ProductSort, ProductUpdate, User, UserChanges, UserCreate, UserPublic,
+    UserUpdate
+)
+from bulk import BULK_MEDIA_TYPE, STREAM_BATCH_SIZE, iter_lines, parse_operation, request_operations
+from compression import Compressor, choose_encoding
+from config import ENV_PREFIX, settings
 from database import db
+from events import EVENT_STREAM_MEDIA_TYPE, event_id, iter_events, parse_event_id
+from export import EXPORT_MEDIA_TYPES, iter_csv, iter_ndjson
+import fast_json
+from fast_json import TrustedJSONResponse
+from fast_msgpack import JSON_MEDIA_TYPE, preferred_media_type
+from middleware import CompressionMiddleware, MsgpackMiddleware
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+)
+from passwords import HasherBusy, PasswordHasher
+from projection import fields_pattern, projection
+from remote import StorageServer
+from storage import DuplicateEmail
+from response_cache import ResponseCache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Flush persisted writes and stop the password hashers when the server shuts down."""
+    yield
+    password_hasher.close()
+    db.close()
+
 
 app = FastAPI(
     title="Product CRUD API",
     description="A simple CRUD API for managing products",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS to allow requests from the React frontend
@@ -21,95 +56,494 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
+)
+
+# zstd and gzip levels for compressed responses
+COMPRESSION_LEVELS = {"zstd": settings.zstd_level, "gzip": settings.gzip_level}
+
+# MessagePack in and out for clients asking for it, then compression of the
+# responses send_json has not already compressed
+app.add_middleware(MsgpackMiddleware)
+if settings.compress_min_bytes:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.compress_min_bytes, levels=COMPRESSION_LEVELS)
+
+ExportFormat = Literal["ndjson", "csv"]
+
+# Encoded GET responses and record JSON, shared by every request
+response_cache = ResponseCache(settings.response_cache_bytes)
+
+# Hashes passwords off the event loop, on worker processes
+password_hasher = PasswordHasher(
+    settings.password_hash_workers, settings.password_hash_cost, settings.password_hash_queue
 )
 
+# Seconds open requests get to finish when the server stops
+SHUTDOWN_TIMEOUT = 5
+
+# Stored user fields that no response includes
+HIDDEN_USER_FIELDS = frozenset({"password"})
+
+LIMIT_QUERY = Query(
+    None, ge=1, le=MAX_PAGE_SIZE,
+    description=f"Page size; omit both limit and cursor to get every record (default {DEFAULT_PAGE_SIZE})",
+)
+CURSOR_QUERY = Query(None, description=f"Opaque cursor from a previous page's {NEXT_CURSOR_HEADER} header")
+
+
+def fields_query(names: List[str]):
+    """A ``?fields=`` parameter accepting comma-separated ``names``."""
+    return Query(
+        None, pattern=fields_pattern(names),
+        description=f"Comma-separated fields to return, of {', '.join(names)}; omit for every field",
+    )
+
+
+PRODUCT_FIELDS_QUERY = fields_query(list(Product.model_fields))
+USER_FIELDS_QUERY = fields_query(list(UserPublic.model_fields))
+# The schemas of responses projected with ?fields= only hold the fields asked for
+PROJECTED_RESPONSES = {200: {"description": "The requested fields of each record; all of them without fields"}}
+
+
+async def read_page(query, cursor: Optional[str], **kwargs):
+    """Run a paged async database query resuming from ``cursor``.
+
+    The database rejects resume keys that do not fit the requested ordering,
+    which is reported as an invalid cursor.
+    """
+    try:
+        after = None if cursor is None else decode_cursor(cursor)
+        return await query(after=after, **kwargs)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def export_response(records: Iterable, model: type, name: str, export_format: str, exclude=frozenset()):
+    """Stream ``records`` in the requested export format."""
+    if export_format == "csv":
+        body = iter_csv(records, list(model.model_fields), exclude)
+    else:
+        body = iter_ndjson(records, exclude)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'},
+    )
+
+
+async def send_json(
+    request: Request, response: Response, table: str, version: Optional[int], load: Callable[[], Awaitable],
+    exclude: AbstractSet[str] = frozenset(),
+) -> Response:
+    """Answer a GET for ``table`` data at ``version`` with pre-encoded JSON or MessagePack.
+
+    ``load`` reads the record or list of records, or returns an iterator
+    over a full listing to be read and encoded in the threadpool, and may
+    set headers on ``response``. Read ``version`` before the data it covers: a write
+    landing in between then leaves an older ETag and cache tag on newer
+    data, which only costs a refetch. With an ``If-None-Match`` naming the
+    current ETag the answer is an empty 304, and while the version is
+    unchanged the body comes from the response cache. Backends without
+    versions get neither, but still reuse cached record encodings. Fields
+    in ``exclude`` are left out of every record.
+
+    The body is MessagePack if ``Accept`` prefers it, and large bodies are
+    compressed as ``Accept-Encoding`` allows before they are cached, so a
+    cache hit costs neither encoding nor compression. Each combination
+    has an ETag and cache entry of its own.
+    """
+    media_type = preferred_media_type(request.headers.get("accept"))
+    encoding = choose_encoding(request.headers.get("accept-encoding")) if settings.compress_min_bytes else None
+    variant = "" if media_type == JSON_MEDIA_TYPE else "-msgpack"
+    if encoding is not None:
+        variant += f"-{encoding}"
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    etag = None if version is None else f'"{db.epoch}-{version}{variant}"'
+    if etag is not None:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if etag in tags or "*" in tags:
+                return Response(status_code=304, headers={"ETag": etag, "Vary": response.headers["Vary"]})
+        response.headers["ETag"] = etag
+
+    # Queries are percent-encoded, so the space cannot be part of one
+    key = f"{request.url.path}?{request.url.query} {variant}"
+    cached = response_cache.get_response(key, etag)
+    if cached is not None:
+        body, headers = cached
+    else:
+        records = await load()
+        if isinstance(records, BaseModel):
+            body = response_cache.fragment(table, records, exclude, media_type)
+        elif isinstance(records, list):
+            body = response_cache.encode(table, records, exclude, media_type)
+        else:
+            # A full listing, read as it is encoded, off the event loop
+            body = await run_in_threadpool(response_cache.encode, table, records, exclude, media_type)
+        if encoding is not None and len(body) >= settings.compress_min_bytes:
+            body = Compressor(encoding, COMPRESSION_LEVELS[encoding]).compress(body)
+            response.headers["Content-Encoding"] = encoding
+        headers = dict(response.headers)
+        response_cache.put_response(key, etag, body, headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def change_log():
+    """The database's change log; without one, change feeds and sync are not implemented."""
+    changes = db.changes
+    if changes is None:
+        raise HTTPException(status_code=501, detail="This storage backend has no change feed")
+    return changes
+
+
+def change_stream(request: Request, table: str, exclude: AbstractSet[str] = frozenset()) -> StreamingResponse:
+    """Stream committed changes to ``table`` as server-sent events.
+
+    Resumes after the request's ``Last-Event-ID`` while the log still has
+    the changes since; otherwise the stream opens with a "reset" event.
+    """
+    changes = change_log()
+    seq = parse_event_id(request.headers.get("last-event-id"), db.epoch)
+    body = iter_events(
+        changes, db.epoch, table, seq, lambda change: response_cache.fragment(table, change.record, exclude)
+    )
+    # Proxies must pass events on as they come rather than buffer them
+    return StreamingResponse(
+        body, media_type=EVENT_STREAM_MEDIA_TYPE, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def sync_response(table: str, since: Optional[str], exclude: AbstractSet[str] = frozenset()) -> Response:
+    """Answer a delta sync of ``table`` from the token ``since``.
+
+    Tokens are change numbers, like the feeds' event ids, so either can be
+    used for the other. Without a token, or with one whose changes are no
+    longer known, the answer asks for a full resync and carries the token
+    to sync from after reloading.
+    """
+    changes = change_log()
+    seq = parse_event_id(since, db.epoch)
+    result = None if seq is None else await db.aio.changes_since(table, seq)
+    if result is None:
+        # Taken before the client reloads, so nothing is missed
+        last_seq, upserts, deletes, resync = changes.last_seq, [], [], b"true"
+    else:
+        (last_seq, upserts, deletes), resync = result, b"false"
+    body = b'{"token":"%s","resync":%s,"upserts":%s,"deletes":%s}' % (
+        event_id(db.epoch, last_seq).encode(), resync,
+        response_cache.encode(table, upserts, exclude), fast_json.dumps(deletes),
+    )
+    return Response(body, media_type="application/json")
+
+
+SINCE_QUERY = Query(None, description="Token from the previous sync; omit to start with a full resync")
+
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy(request: Request, exc: HasherBusy):
+    """Turn away requests that would queue behind too many password hashes."""
+    return JSONResponse(
+        {"detail": "Too many password operations in progress"}, status_code=503, headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(DuplicateEmail)
+async def duplicate_email(request: Request, exc: DuplicateEmail):
+    """Reject user writes that would reuse another user's email."""
+    return JSONResponse({"detail": "Email already registered"}, status_code=409)
+
+
+def set_next_cursor(response: Response, next_after: Optional[Any]):
+    """Advertise the cursor for the following page, if there is one."""
+    if next_after is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_after)
+
 
 @app.get("/")
-def read_root():
+async def read_root():
     """Root endpoint returning welcome message."""
     return {"message": "Welcome to the Product CRUD API"}
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
 
 
-@app.get("/products", response_model=List[Product])
-def get_products():
-    """Get all products"""
-    return db.get_all_products()
+@app.get("/metrics")
+async def metrics():
+    """Response cache hit, miss and eviction counts, and password hasher load."""
+    return {"response_cache": response_cache.stats(), "password_hasher": password_hasher.stats()}
+
+
+@app.get("/products", response_model=List[Product], responses=PROJECTED_RESPONSES)
+async def get_products(
+    request: Request,
+    response: Response,
+    category: Optional[str] = Query(None, description="Only products in this category"),
+    in_stock: Optional[bool] = Query(None, description="Only products with this stock status"),
+    tag: Optional[List[str]] = Query(None, description="Only products carrying every given tag"),
+    min_price: Optional[float] = Query(None, description="Lowest price to include"),
+    max_price: Optional[float] = Query(None, description="Highest price to include"),
+    sort: Optional[ProductSort] = Query(None, description="Sort order; defaults to id"),
+    limit: Optional[int] = LIMIT_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    fields: Optional[str] = PRODUCT_FIELDS_QUERY,
+):
+    """Get all products matching the filters, or one page of them when limit or cursor is given"""
+    async def load():
+        paginate = limit is not None or cursor is not None
+        filtered = any(value is not None for value in (category, in_stock, tag, min_price, max_price, sort))
+        if not paginate and not filtered:
+            return db.iter_all_products()
+        products, next_after = await read_page(
+            db.aio.query_products,
+            cursor,
+            category=category,
+            in_stock=in_stock,
+            tags=tag,
+            min_price=min_price,
+            max_price=max_price,
+            sort=sort,
+            limit=(limit or DEFAULT_PAGE_SIZE) if paginate else None,
+        )
+        set_next_cursor(response, next_after)
+        return products
+
+    return await send_json(
+        request, response, "products", await db.aio.collection_version("products"), load, projection(fields, Product)
+    )
+
+
+@app.get("/products/export", response_class=StreamingResponse)
+async def export_products(format: ExportFormat = Query("ndjson", description="ndjson or csv")):
+    """Stream every product as NDJSON or CSV"""
+    # Read as of the version current when streaming starts, in the
+    # threadpool, a chunk at a time; later writes do not leak in
+    return export_response(db.iter_all_products(), Product, "products", format)
+
 
+@app.get("/products/search", response_model=List[Product])
+async def search_products(
+    q: str = Query(..., min_length=1, description="Words to look for in product names and descriptions"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of results"),
+):
+    """Search products by name and description, best matches first"""
+    return TrustedJSONResponse(await db.aio.search_products(q, limit))
 
-@app.get("/products/{product_id}", response_model=Product)
-def get_product(product_id: int):
+
+@app.get("/products/changes", response_model=ProductChanges)
+async def product_changes(since: Optional[str] = SINCE_QUERY):
+    """Products created, updated or deleted since a sync token"""
+    return await sync_response("products", since)
+
+
+@app.get("/products/events", response_class=StreamingResponse)
+async def product_events(request: Request):
+    """Server-sent events for every product created, updated or deleted"""
+    return change_stream(request, "products")
+
+
+@app.get("/products/{product_id}", response_model=Product, responses=PROJECTED_RESPONSES)
+async def get_product(
+    request: Request, response: Response, product_id: int, fields: Optional[str] = PRODUCT_FIELDS_QUERY
+):
     """Get a specific product by ID"""
-    product = db.get_product(product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    async def load():
+        product = await db.aio.get_product(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product
+
+    return await send_json(
+        request, response, "products", await db.aio.record_version("products", product_id), load,
+        projection(fields, Product),
+    )
 
 
 @app.post("/products", response_model=Product)
-def create_product(product: ProductCreate):
+async def create_product(product: ProductCreate):
     """Create a new product"""
     # TODO: Add validation logic here
-    return db.create_product(product)
+    return TrustedJSONResponse(await db.aio.create_product(product))
 
 
 @app.put("/products/{product_id}", response_model=Product)
-def update_product(product_id: int, product_update: ProductUpdate):
+async def update_product(product_id: int, product_update: ProductUpdate):
     """Update an existing product"""
     # TODO: Add validation and error handling
-    updated_product = db.update_product(product_id, product_update)
+    updated_product = await db.aio.update_product(product_id, product_update)
     if not updated_product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return updated_product
+    return TrustedJSONResponse(updated_product)
 
 
 @app.delete("/products/{product_id}")
-def delete_product(product_id: int):
+async def delete_product(product_id: int):
     """Delete a product"""
-    if db.delete_product(product_id):
+    if await db.aio.delete_product(product_id):
         return {"message": "Product deleted successfully"}
     raise HTTPException(status_code=404, detail="Product not found")
 
 
-@app.post("/users", response_model=User)
-def create_user(user: UserCreate):
-    """Create a new user"""
-    # TODO: Add validation logic here
-    return db.create_user(user)
+@app.post("/products/bulk", response_model=BulkResult)
+async def bulk_products(batch: ProductBulkRequest):
+    """Create, update and delete many products in one pass"""
+    operations = request_operations(batch.creates, batch.updates, batch.deletes)
+    return TrustedJSONResponse(BulkResult(results=await db.aio.bulk_products(operations)))
 
-@app.get("/users", response_model=List[User])
-def get_users():
-    """Get all users"""
-    return db.get_all_users()
 
-@app.get("/users/{user_id}", response_model=User)
-def get_user(user_id: int):
-    """Get a specific user by ID"""
-    user = db.get_user(user_id)
+@app.post(
+    "/products/bulk/stream",
+    response_model=BulkResult,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "description": 'One operation per line: {"op": "create", "data": {...}}, '
+                       '{"op": "update", "id": 1, "data": {...}} or {"op": "delete", "id": 1}',
+        "content": {BULK_MEDIA_TYPE: {"schema": {"type": "string"}}},
+    }},
+)
+async def bulk_products_stream(request: Request):
+    """Apply an NDJSON stream of product operations as it arrives"""
+    results: List[BulkItemResult] = []
+    batch = []
+
+    async def flush():
+        if batch:
+            results.extend(await db.aio.bulk_products(list(batch)))
+            batch.clear()
+
+    line_number = 0
+    async for line in iter_lines(request.stream()):
+        line_number += 1
+        try:
+            batch.append(parse_operation(line))
+        except ValueError as exc:
+            await flush()
+            results.append(BulkItemResult(status=422, detail=f"line {line_number}: {exc}"))
+            continue
+        if len(batch) >= STREAM_BATCH_SIZE:
+            await flush()
+    await flush()
+    return TrustedJSONResponse(BulkResult(results=results))
+
+
+@app.post("/users", response_model=UserPublic)
+async def create_user(user: UserCreate):
+    """Create a new user; the password is stored hashed"""
+    # Checked again when the user is stored; this only avoids a wasted hash
+    if await db.aio.get_user_by_email(user.email) is not None:
+        raise DuplicateEmail(user.email)
+    user = user.model_copy(update={"password": await password_hasher.hash(user.password)})
+    return TrustedJSONResponse(await db.aio.create_user(user), exclude=HIDDEN_USER_FIELDS)
+
+@app.get("/users", response_model=List[UserPublic], responses=PROJECTED_RESPONSES)
+async def get_users(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = LIMIT_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    fields: Optional[str] = USER_FIELDS_QUERY,
+):
+    """Get all users, or one page of them when limit or cursor is given"""
+    async def load():
+        if limit is None and cursor is None:
+            return db.iter_all_users()
+        users, next_after = await read_page(db.aio.get_users_page, cursor, limit=limit or DEFAULT_PAGE_SIZE)
+        set_next_cursor(response, next_after)
+        return users
+
+    return await send_json(
+        request, response, "users", await db.aio.collection_version("users"), load,
+        projection(fields, User, HIDDEN_USER_FIELDS),
+    )
+
+@app.get("/users/export", response_class=StreamingResponse)
+async def export_users(format: ExportFormat = Query("ndjson", description="ndjson or csv")):
+    """Stream every user as NDJSON or CSV, without passwords"""
+    return export_response(db.iter_all_users(), User, "users", format, exclude=HIDDEN_USER_FIELDS)
+
+@app.get("/users/changes", response_model=UserChanges)
+async def user_changes(since: Optional[str] = SINCE_QUERY):
+    """Users created, updated or deleted since a sync token, without passwords"""
+    return await sync_response("users", since, HIDDEN_USER_FIELDS)
+
+@app.get("/users/events", response_class=StreamingResponse)
+async def user_events(request: Request):
+    """Server-sent events for every user created, updated or deleted, without passwords"""
+    return change_stream(request, "users", HIDDEN_USER_FIELDS)
+
+@app.get("/users/by-email/{email}", response_model=UserPublic)
+async def get_user_by_email(email: str):
+    """Get the user with an email, ignoring case"""
+    user = await db.aio.get_user_by_email(email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return TrustedJSONResponse(user, exclude=HIDDEN_USER_FIELDS)
 
-@app.put("/users/{user_id}", response_model=User)
-def update_user(user_id: int, user_update: UserUpdate):
-    """Update an existing user"""
-    updated_user = db.update_user(user_id, user_update)
+@app.get("/users/{user_id}", response_model=UserPublic, responses=PROJECTED_RESPONSES)
+async def get_user(request: Request, response: Response, user_id: int, fields: Optional[str] = USER_FIELDS_QUERY):
+    """Get a specific user by ID"""
+    async def load():
+        user = await db.aio.get_user(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    return await send_json(
+        request, response, "users", await db.aio.record_version("users", user_id), load,
+        projection(fields, User, HIDDEN_USER_FIELDS),
+    )
+
+@app.put("/users/{user_id}", response_model=UserPublic)
+async def update_user(user_id: int, user_update: UserUpdate):
+    """Update an existing user; a new password is stored hashed"""
+    if user_update.password is not None:
+        user_update = user_update.model_copy(update={"password": await password_hasher.hash(user_update.password)})
+    updated_user = await db.aio.update_user(user_id, user_update)
     if not updated_user:
         raise HTTPException(status_code=404, detail="User not found")
-    return updated_user
+    return TrustedJSONResponse(updated_user, exclude=HIDDEN_USER_FIELDS)
+
+@app.post("/users/{user_id}/verify-password", response_model=PasswordCheckResult)
+async def verify_user_password(user_id: int, check: PasswordCheck):
+    """Check a password against the user's stored hash"""
+    user = await db.aio.get_user(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return PasswordCheckResult(valid=await password_hasher.verify(check.password, user.password))
 
 @app.delete("/users/{user_id}")
-def delete_user(user_id: int):
+async def delete_user(user_id: int):
     """Delete a user"""
-    success = db.delete_user(user_id)
+    success = await db.aio.delete_user(user_id)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"}
 
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = settings.workers):
+    """Run the API, in ``workers`` processes if more than one.
+
+    Uvicorn's workers each import this module afresh. With the memory
+    backend they would each build a separate database, so this process
+    keeps the one it built and serves it over a socket, which the workers
+    find in their environment; SQLite workers open the shared file.
+    """
+    # Change feed streams never finish on their own; cut them off rather
+    # than wait for every client to leave
+    options = {"host": host, "port": port, "timeout_graceful_shutdown": SHUTDOWN_TIMEOUT}
+    if workers <= 1:
+        uvicorn.run(app, **options)
+    elif settings.backend == "memory":
+        with StorageServer(db) as server:
+            os.environ[ENV_PREFIX + "STORAGE_SOCKET"] = server.address
+            uvicorn.run("main:app", workers=workers, **options)
+        db.close()
+    else:
+        uvicorn.run("main:app", workers=workers, **options)
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    serve()
@@ -0,0 +1,205 @@
+"""ASGI middleware speaking MessagePack wherever the API speaks JSON, and compressing responses."""
+from typing import Dict, List, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import fast_msgpack
+from compression import Compressor, choose_encoding
+from fast_msgpack import JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, MSGPACK_MEDIA_TYPES, preferred_media_type
+
+# Responses that must reach the client as they are written; EventSource
+# clients and the proxies in between do not all cope with compressed events
+UNCOMPRESSED_MEDIA_TYPES = frozenset({"text/event-stream"})
+
+
+def media_type_of(headers: Headers) -> str:
+    """The media type of a Content-Type header, without parameters; empty if there is none."""
+    return headers.get("content-type", "").partition(";")[0].strip().lower()
+
+
+def add_vary(headers: MutableHeaders, name: str):
+    """Add ``name`` to the Vary header unless it is already listed."""
+    vary = headers.get("vary")
+    if vary is None:
+        headers["Vary"] = name
+    elif name.lower() not in {token.strip().lower() for token in vary.split(",")}:
+        headers["Vary"] = f"{vary}, {name}"
+
+
+async def read_body(receive: Receive) -> bytes:
+    """The whole body of a request, however many messages it comes in."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def replay(body: bytes, receive: Receive) -> Receive:
+    """A ``receive`` delivering ``body`` as the request, then whatever ``receive`` gets next."""
+    sent = False
+
+    async def receive_body() -> Message:
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive_body
+
+
+class MsgpackMiddleware:
+    """Lets clients send and receive MessagePack in place of JSON.
+
+    Request bodies sent as MessagePack are decoded and passed on as JSON,
+    so routes validate them as usual. JSON responses to clients that
+    prefer MessagePack in ``Accept`` are re-encoded; responses a route
+    already encoded as MessagePack, as send_json does, pass untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        send = MsgpackSender(send, preferred_media_type(headers.get("accept")))
+        if media_type_of(headers) in MSGPACK_MEDIA_TYPES:
+            if fast_msgpack.ormsgpack is None:
+                await JSONResponse({"detail": "MessagePack is not supported"}, status_code=415)(scope, receive, send)
+                return
+            try:
+                # Keys other than strings and binary values have no JSON form
+                body = orjson.dumps(fast_msgpack.loads(await read_body(receive)))
+            except (ValueError, TypeError):
+                await JSONResponse({"detail": "Invalid MessagePack body"}, status_code=400)(scope, receive, send)
+                return
+            replaced = (b"content-length", b"content-type")
+            raw = [header for header in scope["headers"] if header[0] not in replaced]
+            raw += [(b"content-type", JSON_MEDIA_TYPE.encode()), (b"content-length", str(len(body)).encode())]
+            scope = {**scope, "headers": raw}
+            receive = replay(body, receive)
+        await self.app(scope, receive, send)
+
+
+class MsgpackSender:
+    """The ``send`` of one response, re-encoding it as MessagePack if it is JSON and that is preferred."""
+
+    def __init__(self, send: Send, media_type: str):
+        self.send = send
+        self.media_type = media_type
+        # The start of a JSON response held back until its body is complete
+        self.start: Optional[Message] = None
+        self.chunks: List[bytes] = []
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            if media_type_of(headers) != JSON_MEDIA_TYPE:
+                await self.send(message)
+                return
+            add_vary(headers, "Accept")
+            if self.media_type == JSON_MEDIA_TYPE or "content-encoding" in headers:
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.send(message)
+            return
+        self.chunks.append(message.get("body", b""))
+        if message.get("more_body"):
+            return
+        body = b"".join(self.chunks)
+        headers = MutableHeaders(raw=self.start["headers"])
+        if body:
+            body = fast_msgpack.dumps(orjson.loads(body))
+            headers["Content-Type"] = MSGPACK_MEDIA_TYPE
+            headers["Content-Length"] = str(len(body))
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """Compresses responses of at least ``minimum_size`` bytes with zstd or gzip.
+
+    The encoding is the best of compression.ENCODINGS the client accepts,
+    at its level in ``levels``. Streamed responses are compressed chunk by
+    chunk whatever their size, so each chunk still reaches the client as
+    it is written. Responses that already have a Content-Encoding, such as
+    those send_json compresses and caches, pass untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, levels: Dict[str, int]):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = levels
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+            if encoding is not None:
+                send = CompressingSender(send, Compressor(encoding, self.levels[encoding]), self.minimum_size)
+        await self.app(scope, receive, send)
+
+
+class CompressingSender:
+    """The ``send`` of one response, compressing its body if it is worth it."""
+
+    def __init__(self, send: Send, compressor: Compressor, minimum_size: int):
+        self.send = send
+        self.compressor = compressor
+        self.minimum_size = minimum_size
+        # The start of the response, held back until the first body message
+        # shows whether to compress; None once sent
+        self.start: Optional[Message] = None
+        self.compressing = False
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if "content-encoding" in headers or media_type_of(headers) in UNCOMPRESSED_MEDIA_TYPES:
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.minimum_size:
+                await self.send(start)
+                await self.send(message)
+                return
+            self.compressing = True
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.compressor.encoding
+            add_vary(headers, "Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.compressor.compress(body)
+                headers["Content-Length"] = str(len(body))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send(start)
+        if not self.compressing:
+            await self.send(message)
+        elif body or not more_body:
+            await self.send({
+                "type": "http.response.body", "body": self.compressor.chunk(body, final=not more_body),
+                "more_body": more_body,
+            })
@@ -1,8 +1,18 @@
 """Pydantic models for product data structures."""
-from typing import Optional, List
+from typing import Annotated, Literal, Optional, List, Union
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+
+
+ProductSort = Literal["price", "-price", "created_at"]
+
+
+def _not_null(value):
+    """Reject an explicit null in a partial update; leave the field out to keep it."""
+    if value is None:
+        raise ValueError("may be omitted but not null")
+    return value
 
 
 class Product(BaseModel):
@@ -36,9 +46,73 @@ class ProductUpdate(BaseModel):
     tags: Optional[List[str]] = None
     in_stock: Optional[bool] = None
 
+    reject_nulls = field_validator("*")(_not_null)
+
+
+class ProductBulkUpdate(ProductUpdate):
+    """Model for one update in a bulk request."""
+    id: int
+
+
+class ProductBulkRequest(BaseModel):
+    """Model for a bulk request; creates run first, then updates, then deletes."""
+    creates: List[ProductCreate] = []
+    updates: List[ProductBulkUpdate] = []
+    deletes: List[int] = []
+
+
+class BulkCreateOperation(BaseModel):
+    """One create line in a streamed bulk request."""
+    op: Literal["create"]
+    data: ProductCreate
+
+
+class BulkUpdateOperation(BaseModel):
+    """One update line in a streamed bulk request."""
+    op: Literal["update"]
+    id: int
+    data: ProductUpdate
+
+
+class BulkDeleteOperation(BaseModel):
+    """One delete line in a streamed bulk request."""
+    op: Literal["delete"]
+    id: int
+
+
+BulkOperation = Annotated[
+    Union[BulkCreateOperation, BulkUpdateOperation, BulkDeleteOperation],
+    Field(discriminator="op"),
+]
+
+
+class BulkItemResult(BaseModel):
+    """Outcome of one operation in a bulk request; op is None for unreadable lines."""
+    op: Optional[Literal["create", "update", "delete"]] = None
+    id: Optional[int] = None
+    status: int
+    detail: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    """Outcomes of a bulk request, in request order."""
+    results: List[BulkItemResult]
+
+
+class ProductChanges(BaseModel):
+    """Products written since a sync token, and the token to send next time.
+
+    With ``resync`` set, the changes since the token are no longer known:
+    reload every product, then sync from the new token.
+    """
+    token: str
+    resync: bool = False
+    upserts: List[Product] = []
+    deletes: List[int] = []
+
 
 class User(BaseModel):
-    """User model with all fields."""
+    """User model with all fields; password holds the hash set by the API."""
     id: int
     name: str
     email: str
@@ -46,6 +120,22 @@ class User(BaseModel):
     created_at: datetime = datetime.now()
 
 
+class UserPublic(BaseModel):
+    """User model as returned by the API, without the password hash."""
+    id: int
+    name: str
+    email: str
+    created_at: datetime
+
+
+class UserChanges(BaseModel):
+    """Users written since a sync token, like ProductChanges."""
+    token: str
+    resync: bool = False
+    upserts: List[UserPublic] = []
+    deletes: List[int] = []
+
+
 class UserCreate(BaseModel):
     """Model for creating a new user."""
     name: str
@@ -57,4 +147,16 @@ class UserUpdate(BaseModel):
     """Model for updating an existing user."""
     name: Optional[str] = None
     email: Optional[str] = None
-    password: Optional[str] = None
\ No newline at end of file
+    password: Optional[str] = None
+
+    reject_nulls = field_validator("*")(_not_null)
+
+
+class PasswordCheck(BaseModel):
+    """Model for checking a user's password."""
+    password: str
+
+
+class PasswordCheckResult(BaseModel):
+    """Whether a checked password matched."""
+    valid: bool
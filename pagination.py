@@ -0,0 +1,27 @@
+"""Opaque cursor helpers for keyset pagination."""
+import base64
+import binascii
+import json
+from typing import Any
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: Any) -> str:
+    """Encode the sort key of the last item on a page as an opaque cursor."""
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Any:
+    """Decode a cursor produced by ``encode_cursor``.
+
+    Raises ValueError if the cursor was not produced by this module.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
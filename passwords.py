@@ -0,0 +1,132 @@
+"""Password hashing on a pool of worker processes."""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from typing import Dict, Optional
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing when every worker is busy and the queue is full."""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, cost: int, block_size: int, parallelism: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=2 ** cost, r=block_size, p=parallelism,
+        maxmem=256 * 2 ** cost * block_size * parallelism, dklen=KEY_BYTES,
+    )
+
+
+def hash_password(password: str, cost: int, block_size: int = 8, parallelism: int = 1) -> str:
+    """Hash ``password`` with scrypt at ``2 ** cost`` iterations.
+
+    Returns ``scrypt$cost$block_size$parallelism$salt$key``, so a hash can
+    be checked after the configured cost has changed.
+    """
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, cost, block_size, parallelism)
+    return f"{SCHEME}${cost}${block_size}${parallelism}${_b64(salt)}${_b64(key)}"
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """Check ``password`` against a ``hash_password`` result.
+
+    Values that are not hashes are passwords stored in plaintext before
+    hashing was introduced, and are compared as they are.
+    """
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        cost, block_size, parallelism = int(parts[1]), int(parts[2]), int(parts[3])
+        salt, key = _unb64(parts[4]), _unb64(parts[5])
+    except ValueError:
+        return False
+    return hmac.compare_digest(_scrypt(password, salt, cost, block_size, parallelism), key)
+
+
+def _ignore_interrupts():
+    # Ctrl+C reaches the whole process group; leave it to the server, which
+    # shuts the pool down, rather than killing workers mid-hash
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class PasswordHasher:
+    """Runs ``hash_password`` and ``verify_password`` on worker processes.
+
+    A hash costs tens of milliseconds of CPU, which would stall every other
+    request if it ran on the event loop, and would hold a threadpool worker
+    and the GIL for most of that time in a thread. The processes start on
+    first use. At most ``workers + queue`` hashes are in flight; beyond
+    that, calls raise HasherBusy at once rather than letting sign-ups pile
+    up behind each other. With ``workers=0`` hashes run inline, for tests.
+    Used from the event loop only.
+    """
+
+    def __init__(self, workers: Optional[int] = None, cost: int = 14, queue: int = 64):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.cost = cost
+        self.limit = self.workers + queue
+        self.pending = 0
+        self.rejected = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers would re-import the server's __main__ module and
+            # with it the database; forked ones only run the hash function
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork") if "fork" in methods else None
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_ignore_interrupts)
+            # Stop the workers even if the server exits without its shutdown
+            # step; a uvicorn worker process would otherwise wait forever for
+            # them. Runs before the pool's own queue finalizers (priority 10)
+            Finalize(self, self._pool.shutdown, exitpriority=100)
+        return self._pool
+
+    async def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if self.pending >= self.limit:
+            self.rejected += 1
+            raise HasherBusy(f"{self.pending} password hashes already in progress")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), function, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash ``password`` at the configured cost."""
+        return await self._run(hash_password, password, self.cost)
+
+    async def verify(self, password: str, stored: str) -> bool:
+        """Check ``password`` against a stored hash."""
+        return await self._run(verify_password, password, stored)
+
+    def stats(self) -> Dict[str, int]:
+        """Workers, hashes in flight and calls turned away."""
+        return {"workers": self.workers, "pending": self.pending, "limit": self.limit, "rejected": self.rejected}
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
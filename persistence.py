@@ -0,0 +1,285 @@
+"""Write-ahead log and snapshot persistence for the in-memory database."""
+import gc
+import glob
+import os
+import pickle
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+from columnar import ColumnarProducts, ProductTable, write_snapshot
+from locks import hold
+from models import Product, User
+from rows import product_from_row, user_from_row, user_row
+
+SNAPSHOT_FILE = "snapshot.bin"
+WAL_PATTERN = "wal-{:08d}.log"
+
+# Each WAL record is framed as payload length, CRC32 of the payload, payload
+_FRAME = struct.Struct(">II")
+
+
+def fsync_directory(path: str):
+    """Make the entries created, renamed and deleted in directory ``path`` durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def paused_gc():
+    """Suspend the cyclic garbage collector while loading many objects.
+
+    Recovery allocates millions of long-lived objects, and each generation
+    threshold crossed would otherwise rescan all of them.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+@dataclass
+class StoreState:
+    """Everything needed to rebuild an InMemoryDatabase."""
+    products: MutableMapping[int, Product] = field(default_factory=ProductTable)
+    users: Dict[int, User] = field(default_factory=dict)
+    next_id: int = 1
+    next_user_id: int = 1
+
+
+class Persistence:
+    """Durable storage for one database in a data directory.
+
+    Writes are appended to a write-ahead log. Appends are buffered and a
+    background thread writes and fsyncs the buffer every
+    ``commit_interval`` seconds (group commit), so one fsync covers many
+    writes; an interval of 0 fsyncs each write before returning. Every
+    ``snapshot_every`` records the log rolls over to a new segment and a
+    columnar snapshot of the full state is written in the background, after
+    which older segments are deleted. Recovery maps the snapshot (see
+    ``columnar``) and replays the remaining segments on top of it.
+
+    WAL records are ``("put_product", row)``, ``("delete_product", id)``,
+    ``("put_user", row)``, ``("delete_user", id)`` and ``("clear",)``.
+    """
+
+    def __init__(self, data_dir: str, commit_interval: float = 0.05, snapshot_every: int = 100_000):
+        self.data_dir = data_dir
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(data_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._file = None
+        self._segment = 0
+        self._records_since_snapshot = 0
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    # Recovery
+
+    def recover(self) -> Optional[StoreState]:
+        """Load the last snapshot and replay the WAL; None if the directory is empty.
+
+        Must be called once, before the first ``append``.
+        """
+        state, first_segment = self._load_snapshot()
+        segments = [segment for segment in self._segments() if segment >= first_segment]
+        for segment in segments:
+            for record in self._read_segment(segment):
+                state = state or StoreState()
+                self._replay(state, record)
+                self._records_since_snapshot += 1
+
+        self._open_segment(max(segments, default=first_segment - 1) + 1)
+        if self.commit_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="wal-flusher", daemon=True)
+            self._flusher.start()
+        return state
+
+    def _load_snapshot(self) -> Tuple[Optional[StoreState], int]:
+        """Return the snapshot state and the first WAL segment not covered by it."""
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return None, 0
+        snapshot = ColumnarProducts(path)
+        extra = snapshot.extra
+        state = StoreState(
+            products=ProductTable(snapshot),
+            users={row[0]: user_from_row(row) for row in extra["users"]},
+            next_id=extra["next_id"],
+            next_user_id=extra["next_user_id"],
+        )
+        return state, extra["wal_segment"]
+
+    @staticmethod
+    def _replay(state: StoreState, record: tuple):
+        """Apply one WAL record to ``state``."""
+        op = record[0]
+        if op == "put_product":
+            product = product_from_row(record[1])
+            state.products[product.id] = product
+            state.next_id = max(state.next_id, product.id + 1)
+        elif op == "delete_product":
+            # A deleted id was allocated, so it must never be handed out again
+            state.products.pop(record[1], None)
+            state.next_id = max(state.next_id, record[1] + 1)
+        elif op == "put_user":
+            user = user_from_row(record[1])
+            state.users[user.id] = user
+            state.next_user_id = max(state.next_user_id, user.id + 1)
+        elif op == "delete_user":
+            state.users.pop(record[1], None)
+            state.next_user_id = max(state.next_user_id, record[1] + 1)
+        elif op == "clear":
+            state.products.clear()
+            state.users.clear()
+            state.next_id = state.next_user_id = 1
+
+    def _segments(self) -> List[int]:
+        """Numbers of the WAL segments on disk, oldest first."""
+        prefix, suffix = WAL_PATTERN.split("{")[0], ".log"
+        paths = glob.glob(os.path.join(self.data_dir, prefix + "*" + suffix))
+        return sorted(int(os.path.basename(path)[len(prefix):-len(suffix)]) for path in paths)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.data_dir, WAL_PATTERN.format(segment))
+
+    def _read_segment(self, segment: int) -> Iterator[Any]:
+        """Yield the records of a segment, stopping at a torn or corrupt tail."""
+        with open(self._segment_path(segment), "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, checksum = _FRAME.unpack_from(data, offset)
+            start = offset + _FRAME.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            yield pickle.loads(payload)
+            offset = start + length
+
+    # Logging
+
+    def append(self, records: List[tuple]):
+        """Log ``records``; durable once the next group commit completes."""
+        data = bytearray()
+        for record in records:
+            payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            data += _FRAME.pack(len(payload), zlib.crc32(payload))
+            data += payload
+        # The flusher holds the lock through each fsync
+        with hold(self._lock):
+            self._buffer += data
+            self._records_since_snapshot += len(records)
+            if self.commit_interval <= 0:
+                self._flush_locked()
+
+    @property
+    def snapshot_due(self) -> bool:
+        """Whether enough records were logged to warrant a new snapshot."""
+        return self._records_since_snapshot >= self.snapshot_every and not self.snapshot_running
+
+    @property
+    def snapshot_running(self) -> bool:
+        """Whether a background snapshot is being written."""
+        return self._snapshot_thread is not None and self._snapshot_thread.is_alive()
+
+    def flush(self):
+        """Write and fsync everything appended so far."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer and self._file is not None:
+            self._file.write(self._buffer)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer.clear()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.commit_interval):
+            self.flush()
+
+    def _open_segment(self, segment: int):
+        """Start appending to a new WAL segment (caller holds the lock or is single-threaded)."""
+        if self._file is not None:
+            self._flush_locked()
+            self._file.close()
+        self._segment = segment
+        self._file = open(self._segment_path(segment), "ab")
+
+    # Snapshots
+
+    def snapshot(self, state: StoreState, wait: bool = False):
+        """Roll the WAL over and write ``state`` as the new snapshot.
+
+        ``state`` must be captured at the same moment as this call, with no
+        writes in between; the records it holds are treated as immutable. The
+        snapshot itself is written on a background thread unless ``wait``,
+        after any snapshot started before it, so concurrent calls neither
+        share the temporary file nor replace a newer snapshot with an older.
+        """
+        with hold(self._lock):
+            self._open_segment(self._segment + 1)
+            self._records_since_snapshot = 0
+            segment = self._segment
+            self._snapshot_thread = threading.Thread(
+                target=self._write_snapshot, args=(state, segment, self._snapshot_thread),
+                name="snapshot-writer", daemon=True,
+            )
+            self._snapshot_thread.start()
+        if wait:
+            self.wait_for_snapshot()
+
+    def wait_for_snapshot(self):
+        """Block until the snapshot being written, if any, is on disk."""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+
+    def _write_snapshot(self, state: StoreState, segment: int, previous: Optional[threading.Thread]):
+        """Wait for ``previous``, write the snapshot atomically, then drop the segments it covers."""
+        if previous is not None:
+            previous.join()
+        extra = {
+            "wal_segment": segment,
+            "next_id": state.next_id,
+            "next_user_id": state.next_user_id,
+            "users": [user_row(user) for user in state.users.values()],
+        }
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            write_snapshot(f, state.products.rows(), extra)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # The new snapshot must be durable before the segments it covers go
+        fsync_directory(self.data_dir)
+        for old in self._segments():
+            if old < segment:
+                os.remove(self._segment_path(old))
+
+    def close(self):
+        """Stop the flusher, wait for any snapshot and flush the log."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
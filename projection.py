@@ -0,0 +1,25 @@
+"""Sparse fieldsets: ``?fields=`` choosing which record fields a response carries."""
+import re
+from typing import AbstractSet, FrozenSet, Iterable, Optional, Type
+
+from pydantic import BaseModel
+
+
+def fields_pattern(names: Iterable[str]) -> str:
+    """Regex matching a comma-separated list of ``names``, for validating ``?fields=``."""
+    choice = "|".join(re.escape(name) for name in names)
+    return f"^({choice})(,({choice}))*$"
+
+
+def projection(fields: Optional[str], model: Type[BaseModel], hidden: AbstractSet[str] = frozenset()) -> FrozenSet[str]:
+    """The ``model`` fields to leave out of a response asking for ``fields``.
+
+    ``fields`` is a comma-separated list already checked against
+    ``fields_pattern``; None asks for every field. ``hidden`` fields are
+    always left out. The result is meant as ``exclude`` for encoding, so
+    the other fields are never read.
+    """
+    if fields is None:
+        return frozenset(hidden)
+    wanted = set(fields.split(","))
+    return frozenset(name for name in model.model_fields if name not in wanted) | hidden
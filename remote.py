@@ -0,0 +1,383 @@
+"""Access to one process's storage from other processes, over a Unix socket."""
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from functools import cached_property
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.reduction import ForkingPickler
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from changes import ChangeLog
+from models import (
+    BulkItemResult, Product, ProductCreate, ProductSort, ProductUpdate, User, UserCreate, UserUpdate
+)
+from storage import ProductOperation, Storage
+
+# Storage methods a client may call, besides the table views' own calls
+REMOTE_METHODS = frozenset({
+    "clear", "checkpoint", "collection_version", "record_version", "changes_since",
+    "create_product", "get_all_products", "get_products_page", "query_products", "get_product",
+    "update_product", "delete_product", "bulk_products", "search_products",
+    "create_user", "get_all_users", "get_users_page", "get_user", "get_user_by_email",
+    "update_user", "delete_user",
+})
+# Storage methods returning iterators, which are sent STREAM_CHUNK records a message
+STREAM_METHODS = frozenset({"iter_all_products", "iter_all_users"})
+STREAM_CHUNK = 1000
+_TABLES = ("products", "users")
+
+# Seconds a client's change log follower waits for changes per call
+FOLLOW_TIMEOUT = 15
+
+
+class RemoteError(Exception):
+    """Stands in for an exception, or a result, the owner could not send back as itself."""
+
+
+class StorageServer:
+    """Serves ``storage`` to RemoteDatabase clients in other processes.
+
+    Lets several API worker processes share one in-memory database: this
+    process owns it, and every call a worker makes is sent over a Unix
+    socket, run here and answered with the pickled result or exception;
+    full scans are streamed back STREAM_CHUNK records at a time. Each
+    client connection gets a thread, so calls from different workers run
+    concurrently, under the storage's own locking. The socket lives in a
+    fresh directory readable only by the current user, unless ``address``
+    is given.
+    """
+
+    def __init__(self, storage: Storage, address: Optional[str] = None):
+        self.storage = storage
+        self._directory = None
+        if address is None:
+            self._directory = tempfile.mkdtemp(prefix="product-api-")
+            address = os.path.join(self._directory, "storage.sock")
+        self.address = address
+        self._listener = Listener(address, family="AF_UNIX")
+        self._closed = False
+        self._thread = threading.Thread(target=self._accept, name="storage-server", daemon=True)
+
+    def __enter__(self) -> "StorageServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """Accept clients in the background."""
+        self._thread.start()
+
+    def close(self):
+        """Stop accepting clients and remove the socket; the storage is left open."""
+        self._closed = True
+        # accept() does not return when the listener is closed under it
+        Client(self.address, family="AF_UNIX").close()
+        self._thread.join()
+        self._listener.close()
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _accept(self):
+        while True:
+            conn = self._listener.accept()
+            if self._closed:
+                conn.close()
+                return
+            threading.Thread(target=self._serve, args=(conn,), name="storage-client", daemon=True).start()
+
+    def _serve(self, conn: Connection):
+        """Answer one client's calls until it disconnects."""
+        with conn:
+            while True:
+                try:
+                    name, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if name in STREAM_METHODS:
+                    replies = self._stream(getattr(self.storage, name)(*args, **kwargs))
+                else:
+                    try:
+                        replies = [(True, self._call(name, args, kwargs))]
+                    except Exception as exc:
+                        replies = [(False, exc)]
+                try:
+                    for ok, result in replies:
+                        self._send(conn, ok, result)
+                except OSError:
+                    # The client went away, as one that stops reading a stream does
+                    return
+
+    @staticmethod
+    def _stream(records: Iterator[Any]) -> Iterator[Tuple[bool, Any]]:
+        """Replies sending ``records`` in chunks, then None; an exception ends the stream instead."""
+        chunk = []
+        try:
+            for record in records:
+                chunk.append(record)
+                if len(chunk) == STREAM_CHUNK:
+                    yield True, chunk
+                    chunk = []
+        except Exception as exc:
+            yield False, exc
+            return
+        if chunk:
+            yield True, chunk
+        yield True, None
+
+    @staticmethod
+    def _send(conn: Connection, ok: bool, result: Any):
+        """Send one reply; what cannot be pickled, or unpickled as an exception, is sent as a RemoteError."""
+        try:
+            data = ForkingPickler.dumps((ok, result))
+            if not ok:
+                # Exceptions whose arguments do not match __init__ fail here
+                ForkingPickler.loads(data)
+        except Exception as exc:
+            error = exc if ok else result
+            data = ForkingPickler.dumps((False, RemoteError(f"{type(error).__name__}: {error}")))
+        conn.send_bytes(data)
+
+    def _call(self, name: str, args: tuple, kwargs: dict) -> Any:
+        storage = self.storage
+        if name in REMOTE_METHODS:
+            return getattr(storage, name)(*args, **kwargs)
+        if name == "epoch":
+            return storage.epoch
+        if name == "count" and args[0] in _TABLES:
+            return len(getattr(storage, args[0]))
+        if name == "ids" and args[0] in _TABLES:
+            return list(getattr(storage, args[0]))
+        if name == "changes":
+            # Blocks this connection's thread until there are changes
+            log = storage.changes
+            return None if log is None else (log.wait(*args), log.last_seq)
+        raise AttributeError(f"Storage has no remote method {name!r}")
+
+
+class RemoteView(Mapping):
+    """Read-only ``{id: record}`` view of a remote table, read through on every access."""
+
+    def __init__(self, remote: "RemoteDatabase", table: str, get):
+        self._remote = remote
+        self._table = table
+        self._get = get
+
+    def __len__(self) -> int:
+        return self._remote._call("count", self._table)
+
+    def __getitem__(self, record_id: int):
+        record = self._get(record_id)
+        if record is None:
+            raise KeyError(record_id)
+        return record
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._remote._call("ids", self._table))
+
+
+class RemoteDatabase(Storage):
+    """Storage owned by another process and reached through its StorageServer.
+
+    Every call is one round trip over the server's socket, with arguments
+    and results pickled. Connections are opened on first use and reused
+    most recently used first; a thread holds one for a single call, so
+    there are at most as many as threads calling at once. Version counters
+    and the epoch are the owner's, so ETags and cached responses agree
+    across every process using it. ``changes`` mirrors the owner's change
+    log, numbered the same. ``close`` only closes this process's
+    connections.
+    """
+
+    blocking_reads = True
+    blocking_writes = True
+
+    def __init__(self, address: str, change_log_size: int = 10_000):
+        self.address = address
+        self._change_log_size = change_log_size
+        self._idle: "queue.LifoQueue[Connection]" = queue.LifoQueue()
+        self.products = RemoteView(self, "products", self.get_product)
+        self.users = RemoteView(self, "users", self.get_user)
+
+    def _connection(self) -> Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return Client(self.address, family="AF_UNIX")
+
+    def _call(self, name: str, *args, **kwargs) -> Any:
+        conn = self._connection()
+        try:
+            conn.send((name, args, kwargs))
+            ok, result = conn.recv()
+        except BaseException:
+            # The reply may still be on its way; never reuse the connection
+            conn.close()
+            raise
+        self._idle.put(conn)
+        if not ok:
+            raise result
+        return result
+
+    def _stream(self, name: str) -> Iterator[Any]:
+        """Iterate the records a STREAM_METHODS call sends back, a chunk at a time.
+
+        The connection is held until the stream ends; one left part read
+        still has chunks on their way, so it is closed rather than reused.
+        """
+        conn = self._connection()
+        finished = False
+        try:
+            conn.send((name, (), {}))
+            while True:
+                ok, chunk = conn.recv()
+                if not ok:
+                    finished = True
+                    raise chunk
+                if chunk is None:
+                    finished = True
+                    return
+                yield from chunk
+        finally:
+            if finished:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    @cached_property
+    def epoch(self) -> str:
+        return self._call("epoch")
+
+    @cached_property
+    def changes(self) -> Optional[ChangeLog]:
+        """Local copy of the owner's change log, from now on; None if the owner keeps none.
+
+        A background thread waits on the owner for new changes and copies
+        them in, so readers here never make a round trip.
+        """
+        reply = self._call("changes", 0, 0)
+        if reply is None:
+            return None
+        # Delta sync asks the owner, so nothing is kept compacted here
+        mirror = ChangeLog(self._change_log_size, compacted_capacity=0)
+        mirror.restart(reply[1])
+        threading.Thread(target=self._follow, args=(mirror,), name="change-follower", daemon=True).start()
+        return mirror
+
+    def _follow(self, mirror: ChangeLog):
+        """Copy the owner's changes into ``mirror`` as they are committed, until the owner goes away."""
+        while True:
+            try:
+                changes, last_seq = self._call("changes", mirror.last_seq, FOLLOW_TIMEOUT)
+            except (EOFError, OSError):
+                return
+            if changes is None:
+                # Fell too far behind; readers that had not caught up must reload
+                mirror.restart(last_seq)
+            else:
+                mirror.extend(changes)
+
+    def collection_version(self, table: str) -> Optional[int]:
+        return self._call("collection_version", table)
+
+    def record_version(self, table: str, record_id: int) -> Optional[int]:
+        return self._call("record_version", table, record_id)
+
+    def changes_since(self, table: str, seq: int) -> Optional[Tuple[int, List[Any], List[int]]]:
+        # Asks the owner, whose log reaches further back than the local copy
+        return self._call("changes_since", table, seq)
+
+    def checkpoint(self, wait: bool = False):
+        """Ask the owner to snapshot its state, if it persists it."""
+        self._call("checkpoint", wait=wait)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def clear(self):
+        self._call("clear")
+
+    def create_product(self, product_data: ProductCreate) -> Product:
+        return self._call("create_product", product_data)
+
+    def get_all_products(self) -> List[Product]:
+        return list(self.iter_all_products())
+
+    def iter_all_products(self) -> Iterator[Product]:
+        return self._stream("iter_all_products")
+
+    def get_products_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[Product], Optional[int]]:
+        return self._call("get_products_page", limit, after)
+
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[ProductSort] = None,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+    ) -> Tuple[List[Product], Optional[Any]]:
+        return self._call(
+            "query_products",
+            category=category,
+            in_stock=in_stock,
+            tags=None if tags is None else list(tags),
+            min_price=min_price,
+            max_price=max_price,
+            sort=sort,
+            limit=limit,
+            after=after,
+        )
+
+    def get_product(self, product_id: int) -> Optional[Product]:
+        return self._call("get_product", product_id)
+
+    def update_product(self, product_id: int, update_data: ProductUpdate) -> Optional[Product]:
+        return self._call("update_product", product_id, update_data)
+
+    def delete_product(self, product_id: int) -> bool:
+        return self._call("delete_product", product_id)
+
+    def bulk_products(self, operations: Iterable[ProductOperation]) -> List[BulkItemResult]:
+        return self._call("bulk_products", list(operations))
+
+    def search_products(self, query: str, limit: int) -> List[Product]:
+        return self._call("search_products", query, limit)
+
+    def create_user(self, user_data: UserCreate) -> User:
+        return self._call("create_user", user_data)
+
+    def get_all_users(self) -> List[User]:
+        return list(self.iter_all_users())
+
+    def iter_all_users(self) -> Iterator[User]:
+        return self._stream("iter_all_users")
+
+    def get_users_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[User], Optional[int]]:
+        return self._call("get_users_page", limit, after)
+
+    def get_user(self, user_id: int) -> Optional[User]:
+        return self._call("get_user", user_id)
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        return self._call("get_user_by_email", email)
+
+    def update_user(self, user_id: int, update_data: UserUpdate) -> Optional[User]:
+        return self._call("update_user", user_id, update_data)
+
+    def delete_user(self, user_id: int) -> bool:
+        return self._call("delete_user", user_id)
@@ -0,0 +1,148 @@
+"""Cache of encoded responses and per-record fragments."""
+import sys
+import threading
+from collections import OrderedDict
+from typing import AbstractSet, Dict, Hashable, Iterable, Optional, Tuple
+
+from pydantic import BaseModel
+
+import fast_json
+import fast_msgpack
+from fast_msgpack import JSON_MEDIA_TYPE
+
+# How records are encoded for each media type a response can have
+ENCODERS = {JSON_MEDIA_TYPE: fast_json.dumps, fast_msgpack.MSGPACK_MEDIA_TYPE: fast_msgpack.dumps}
+
+
+def record_tag(record: BaseModel) -> tuple:
+    """The field values of ``record``, which tell whether a cached encoding of it is current.
+
+    Snapshot rows are rebuilt on every read, so a record is recognised by
+    its values rather than by identity.
+    """
+    return tuple(record.__dict__.values())
+
+
+def tag_size(tag: tuple) -> int:
+    """Bytes ``tag`` keeps alive, counting every value as its own.
+
+    The values of a snapshot row are not shared with any stored record,
+    so they are counted in full; lists are counted with their items.
+    """
+    size = sys.getsizeof(tag)
+    for value in tag:
+        size += sys.getsizeof(value)
+        if isinstance(value, list):
+            size += sum(map(sys.getsizeof, value))
+    return size
+
+
+class ResponseCache:
+    """LRU cache of response bodies and encoded records, bounded in bytes.
+
+    Responses are stored with the version of the data they were built from
+    and only served while the caller still sees that version, so a write
+    invalidates exactly the responses that include it. Record fragments
+    are stored with the field values of the record they encode and reused
+    while the record's values are unchanged, so a listing re-encodes only
+    the records written since it was last built. Those values count
+    towards the budget along with the fragment. Thread-safe, so full listings can be encoded
+    in the threadpool; encoding itself runs outside the lock.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._size = 0
+        # key -> (tag, value, size); responses are tagged with a version
+        # and fragments with record_tag of their record
+        self._entries: "OrderedDict[Hashable, Tuple[object, object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.fragment_hits = self.fragment_misses = self.evictions = 0
+
+    def get_response(self, key: str, version: Optional[int]) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """The body and headers cached for ``key`` at ``version``, if any."""
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(("response", key))
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(("response", key))
+            self.hits += 1
+            return entry[1]
+
+    def put_response(self, key: str, version: Optional[int], body: bytes, headers: Dict[str, str]):
+        """Cache a response built from data read at ``version`` or later."""
+        if version is not None:
+            self._put(("response", key), version, (body, headers), len(body) + len(key))
+
+    def encode(
+        self, table: str, records: Iterable[BaseModel], exclude: AbstractSet[str] = frozenset(),
+        media_type: str = JSON_MEDIA_TYPE,
+    ) -> bytes:
+        """Encode ``records`` as a JSON or MessagePack array, reusing the cached encoding of each."""
+        if not self.max_bytes:
+            if isinstance(records, list):
+                return ENCODERS[media_type](records, exclude)
+            # Encoded as read, so an iterator's records are never all held at once
+            encoder = ENCODERS[media_type]
+            fragments = [encoder(record, exclude) for record in records]
+        else:
+            fragments = [self.fragment(table, record, exclude, media_type) for record in records]
+        if media_type == JSON_MEDIA_TYPE:
+            return b"[" + b",".join(fragments) + b"]"
+        return fast_msgpack.array_header(len(fragments)) + b"".join(fragments)
+
+    def fragment(
+        self, table: str, record: BaseModel, exclude: AbstractSet[str] = frozenset(),
+        media_type: str = JSON_MEDIA_TYPE,
+    ) -> bytes:
+        """``record`` without the ``exclude`` fields as ``media_type``, cached per ``table``, id, ``exclude`` and type.
+
+        ``exclude`` must be hashable, such as a frozenset.
+        """
+        key = (table, record.id, exclude, media_type)
+        tag = record_tag(record)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == tag:
+                self._entries.move_to_end(key)
+                self.fragment_hits += 1
+                return entry[1]
+            self.fragment_misses += 1
+        body = ENCODERS[media_type](record, exclude)
+        self._put(key, tag, body, len(body) + tag_size(tag))
+        return body
+
+    def _put(self, key: Hashable, tag: object, value: object, size: int):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (tag, value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss and eviction counts and current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fragment_hits": self.fragment_hits,
+            "fragment_misses": self.fragment_misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
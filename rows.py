@@ -0,0 +1,45 @@
+"""Flat tuple representations of stored records, used for logging and snapshots."""
+from typing import Tuple, Type, TypeVar
+
+from models import Product, User
+
+PRODUCT_FIELDS = tuple(Product.model_fields)
+USER_FIELDS = tuple(User.model_fields)
+
+
+def product_row(product: Product) -> tuple:
+    """Flatten a product into a tuple of field values."""
+    return tuple(getattr(product, name) for name in PRODUCT_FIELDS)
+
+
+def user_row(user: User) -> tuple:
+    """Flatten a user into a tuple of field values."""
+    return tuple(getattr(user, name) for name in USER_FIELDS)
+
+
+Model = TypeVar("Model", Product, User)
+
+
+def _construct(model: Type[Model], fields: Tuple[str, ...], row: tuple) -> Model:
+    """Build a model from trusted values with every field set.
+
+    Equivalent to ``model.model_construct`` for complete rows, but skips its
+    per-call default and alias handling, which dominates recovery time.
+    """
+    instance = model.__new__(model)
+    _set = object.__setattr__
+    _set(instance, "__dict__", dict(zip(fields, row)))
+    _set(instance, "__pydantic_fields_set__", set(fields))
+    _set(instance, "__pydantic_extra__", None)
+    _set(instance, "__pydantic_private__", None)
+    return instance
+
+
+def product_from_row(row: tuple) -> Product:
+    """Rebuild a product from ``product_row`` output without re-validating it."""
+    return _construct(Product, PRODUCT_FIELDS, row)
+
+
+def user_from_row(row: tuple) -> User:
+    """Rebuild a user from ``user_row`` output without re-validating it."""
+    return _construct(User, USER_FIELDS, row)
@@ -0,0 +1,123 @@
+"""Full-text search index with BM25 ranking."""
+import heapq
+import math
+import re
+from typing import Dict, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric terms."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TextIndex:
+    """Inverted index over document text, updated in place and ranked with BM25.
+
+    Postings map each term to ``{doc_id: term frequency}``, so adding or
+    removing a document only touches the postings of its own terms.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: int, text: str):
+        """Index ``text`` under ``doc_id``."""
+        terms = tokenize(text)
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        postings = self._postings
+        for term, count in counts.items():
+            docs = postings.get(term)
+            if docs is None:
+                postings[term] = {doc_id: count}
+            else:
+                docs[doc_id] = count
+        self._doc_lengths[doc_id] = len(terms)
+        self._total_length += len(terms)
+
+    def remove(self, doc_id: int, text: str):
+        """Remove ``doc_id``, which must have been indexed with ``text``."""
+        length = self._doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        postings = self._postings
+        for term in set(tokenize(text)):
+            docs = postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del postings[term]
+
+    def clear(self):
+        """Remove every document."""
+        self._postings.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """Return up to ``limit`` ``(doc_id, score)`` pairs, best first.
+
+        Terms are scored rarest first, with MaxScore pruning: a term adds at
+        most its IDF weight to a document, so once ``limit`` documents score
+        more than every remaining term could add together, no unseen
+        document can reach the results, and the remaining, commoner terms
+        only add to the scores of documents already found. The results are
+        the same as those of scoring every match. Ties are broken by the
+        lower doc id.
+        """
+        doc_count = len(self._doc_lengths)
+        if not doc_count or limit <= 0:
+            return []
+
+        k1 = self.k1
+        avg_length = self._total_length / doc_count or 1.0
+        # BM25 length normalisation is k1 * (1 - b + b * dl / avgdl)
+        norm_base = k1 * (1 - self.b)
+        norm_per_term = k1 * self.b / avg_length
+        doc_lengths = self._doc_lengths
+
+        terms = []
+        for term in set(tokenize(query)):
+            docs = self._postings.get(term)
+            if docs:
+                df = len(docs)
+                weight = math.log(1 + (doc_count - df + 0.5) / (df + 0.5)) * (k1 + 1)
+                terms.append((weight, docs))
+        # tf / (tf + norm) < 1, so a term adds less than its weight to any score
+        terms.sort(key=lambda term: term[0], reverse=True)
+        remaining = sum(weight for weight, _ in terms)
+
+        scores: Dict[int, float] = {}
+        get = scores.get
+        pruned = False
+        for weight, docs in terms:
+            remaining -= weight
+            if not pruned:
+                for doc_id, tf in docs.items():
+                    scores[doc_id] = get(doc_id, 0.0) + weight * tf / (
+                        tf + norm_base + norm_per_term * doc_lengths[doc_id]
+                    )
+                # Scores only grow, so the limit-th one is a lower bound on the cutoff
+                pruned = len(scores) >= limit and heapq.nlargest(limit, scores.values())[-1] > remaining
+            else:
+                matched = docs.keys() & scores.keys() if len(docs) < len(scores) else scores
+                for doc_id in matched:
+                    tf = docs.get(doc_id)
+                    if tf:
+                        scores[doc_id] += weight * tf / (
+                            tf + norm_base + norm_per_term * doc_lengths[doc_id]
+                        )
+
+        top = heapq.nlargest(limit, ((score, -doc_id) for doc_id, score in scores.items()))
+        return [(-neg_id, score) for score, neg_id in top]
@@ -0,0 +1,480 @@
+"""SQLite storage backend for catalogs that must be durable or outgrow memory."""
+import json
+import queue
+import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import (
+    BulkItemResult, Product, ProductCreate, ProductSort, ProductUpdate, User, UserCreate, UserUpdate
+)
+from rows import product_from_row, user_from_row
+from search import tokenize
+from storage import (
+    PRODUCT_SORT_KEYS, DuplicateEmail, ProductOperation, Storage, email_key, record_id, resume_key
+)
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    price REAL NOT NULL,
+    category TEXT NOT NULL,
+    tags TEXT NOT NULL,         -- JSON array, in the order given
+    in_stock INTEGER NOT NULL,
+    created_at TEXT NOT NULL,   -- ISO 8601
+    created_ts REAL NOT NULL    -- created_at.timestamp(), the creation-time sort key
+);
+CREATE INDEX products_category ON products (category, id);
+CREATE INDEX products_in_stock ON products (in_stock, id);
+CREATE INDEX products_price ON products (price, id);
+CREATE INDEX products_created ON products (created_ts, id);
+
+CREATE TABLE product_tags (
+    tag TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    PRIMARY KEY (tag, product_id)
+) WITHOUT ROWID;
+CREATE INDEX product_tags_product ON product_tags (product_id);
+
+-- rowid is the product id, text is the name and description
+CREATE VIRTUAL TABLE products_fts USING fts5(text, tokenize = 'unicode61 remove_diacritics 0');
+
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    email_key TEXT              -- storage.email_key(email), NULL only for duplicates from version 1
+);
+CREATE UNIQUE INDEX users_email ON users (email_key);
+"""
+
+# Column lists in PRODUCT_FIELDS / USER_FIELDS order
+PRODUCT_COLUMNS = "id, name, description, price, category, tags, in_stock, created_at"
+USER_COLUMNS = "id, name, email, password, created_at"
+
+# Sort column and direction for each ProductSort; None orders by id
+_ORDER = {
+    None: (None, False),
+    "price": ("price", False),
+    "-price": ("price", True),
+    "created_at": ("created_ts", False),
+}
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections, each used by one thread at a time.
+
+    Connections are opened on demand up to ``size`` and handed out most
+    recently used first. Each keeps its own compiled statement cache, so
+    the fixed SQL used by the backend is prepared once per connection.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of the block."""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self.size:
+                conn = self._connect()
+                self._opened.append(conn)
+                return conn
+        return self._idle.get()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; writes open their own BEGIN IMMEDIATE transactions
+        conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False, cached_statements=256
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def close(self):
+        """Close every connection the pool opened."""
+        with self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened.clear()
+
+
+class TableView(Mapping):
+    """Read-only ``{id: record}`` view of a table, read through on every access."""
+
+    def __init__(self, storage: "SQLiteDatabase", table: str, get: Callable[[int], Any]):
+        self._storage = storage
+        self._table = table
+        self._get = get
+
+    def __len__(self) -> int:
+        return self._storage._scalar(f"SELECT COUNT(*) FROM {self._table}")
+
+    def __getitem__(self, record_id: int):
+        record = self._get(record_id)
+        if record is None:
+            raise KeyError(record_id)
+        return record
+
+    def __iter__(self) -> Iterator[int]:
+        with self._storage._pool.connection() as conn:
+            ids = [row[0] for row in conn.execute(f"SELECT id FROM {self._table} ORDER BY id")]
+        return iter(ids)
+
+
+def _product(row: tuple) -> Product:
+    product_id, name, description, price, category, tags, in_stock, created_at = row
+    return product_from_row((
+        product_id, name, description, price, category,
+        json.loads(tags), bool(in_stock), datetime.fromisoformat(created_at),
+    ))
+
+
+def _user(row: tuple) -> User:
+    return user_from_row(row[:4] + (datetime.fromisoformat(row[4]),))
+
+
+class SQLiteDatabase(Storage):
+    """Storage in a SQLite database file, with the same behaviour as InMemoryDatabase.
+
+    The file uses WAL journaling, so readers never wait for the single
+    writer. Category, stock, price and creation-time filters and orderings
+    are served by indexes, tags by a ``product_tags`` table and search by
+    an FTS5 table ranked with BM25.
+    """
+
+    blocking_reads = True
+    blocking_writes = True
+
+    def __init__(self, path: str, pool_size: int = 40):
+        self._pool = ConnectionPool(path, pool_size)
+        self.products = TableView(self, "products", self.get_product)
+        self.users = TableView(self, "users", self.get_user)
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            created = version == 0
+            if created:
+                # executescript would commit first, so run the statements one by one
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+            elif version == 1:
+                self._add_email_keys(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if created:
+            self._init_sample_data()
+
+    @staticmethod
+    def _add_email_keys(conn: sqlite3.Connection):
+        """Upgrade a version 1 file: index users by email; of duplicates, the first by id keeps it."""
+        conn.execute("ALTER TABLE users ADD COLUMN email_key TEXT")
+        keys: Dict[str, int] = {}
+        for user_id, email in conn.execute("SELECT id, email FROM users ORDER BY id").fetchall():
+            keys.setdefault(email_key(email), user_id)
+        conn.executemany("UPDATE users SET email_key = ? WHERE id = ?", keys.items())
+        conn.execute("CREATE UNIQUE INDEX users_email ON users (email_key)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block in a write transaction, rolled back if it raises."""
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _scalar(self, sql: str, params: tuple = ()) -> Any:
+        with self._pool.connection() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def close(self):
+        """Close all pooled connections."""
+        self._pool.close()
+
+    def clear(self):
+        """Remove all products and users and reset id allocation."""
+        with self._transaction() as conn:
+            for table in ("products", "product_tags", "products_fts", "users"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("DELETE FROM sqlite_sequence")
+
+    def create_product(self, product_data: ProductCreate) -> Product:
+        """Create a new product in the database."""
+        with self._transaction() as conn:
+            return self._insert_product(conn, product_data)
+
+    def get_all_products(self) -> List[Product]:
+        """Get all products in id order."""
+        with self._pool.connection() as conn:
+            rows = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id").fetchall()
+        return [_product(row) for row in rows]
+
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[ProductSort] = None,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+    ) -> Tuple[List[Product], Optional[Any]]:
+        """Get products matching every given filter, ordered by ``sort`` (id by default).
+
+        Pages are read with keyset conditions on ``(sort column, id)``, so
+        each one is a range scan of the matching index.
+        """
+        after = resume_key(sort, after)
+        conditions, params = [], []
+        if category is not None:
+            conditions.append("category = ?")
+            params.append(category)
+        if in_stock is not None:
+            conditions.append("in_stock = ?")
+            params.append(int(in_stock))
+        for tag in tags or ():
+            conditions.append("id IN (SELECT product_id FROM product_tags WHERE tag = ?)")
+            params.append(tag)
+        if min_price is not None:
+            conditions.append("price >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("price <= ?")
+            params.append(max_price)
+
+        column, descending = _ORDER[sort]
+        direction, compare = (" DESC", "<") if descending else ("", ">")
+        if column is None:
+            order = "id"
+            if after is not None:
+                conditions.append("id > ?")
+                params.append(after)
+        else:
+            order = f"{column}{direction}, id{direction}"
+            if after is not None:
+                conditions.append(f"({column}, id) {compare} (?, ?)")
+                params.extend(after)
+
+        sql = f"SELECT {PRODUCT_COLUMNS} FROM products"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        with self._pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return self._page([_product(row) for row in rows], limit, PRODUCT_SORT_KEYS[sort])
+
+    def get_product(self, product_id: int) -> Optional[Product]:
+        """Get a specific product by ID."""
+        with self._pool.connection() as conn:
+            return self._select_product(conn, product_id)
+
+    def update_product(self, product_id: int, update_data: ProductUpdate) -> Optional[Product]:
+        """Update an existing product in the database."""
+        with self._transaction() as conn:
+            return self._update_product(conn, product_id, update_data.model_dump(exclude_unset=True))
+
+    def delete_product(self, product_id: int) -> bool:
+        """Delete a product from the database."""
+        with self._transaction() as conn:
+            return self._delete_product(conn, product_id)
+
+    def bulk_products(self, operations: Iterable[ProductOperation]) -> List[BulkItemResult]:
+        """Apply a batch of product writes in order, in a single transaction."""
+        results = []
+        with self._transaction() as conn:
+            for op, product_id, payload in operations:
+                if op == "create":
+                    product_id, found = self._insert_product(conn, payload).id, True
+                elif op == "update":
+                    changes = payload.model_dump(exclude_unset=True, exclude={"id"})
+                    found = self._update_product(conn, product_id, changes) is not None
+                else:
+                    found = self._delete_product(conn, product_id)
+                if found:
+                    results.append(BulkItemResult(op=op, id=product_id, status=200))
+                else:
+                    results.append(BulkItemResult(op=op, id=product_id, status=404, detail="Product not found"))
+        return results
+
+    def search_products(self, query: str, limit: int) -> List[Product]:
+        """Get up to ``limit`` products best matching ``query``, ranked by FTS5's BM25."""
+        terms = tokenize(query)
+        if not terms or limit <= 0:
+            return []
+        match = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        columns = ", ".join(f"p.{column}" for column in PRODUCT_COLUMNS.split(", "))
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {columns} FROM products_fts f JOIN products p ON p.id = f.rowid"
+                " WHERE products_fts MATCH ? ORDER BY f.rank, p.id LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [_product(row) for row in rows]
+
+    def _select_product(self, conn: sqlite3.Connection, product_id: int) -> Optional[Product]:
+        row = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = ?", (product_id,)).fetchone()
+        return _product(row) if row is not None else None
+
+    def _insert_product(self, conn: sqlite3.Connection, product_data: ProductCreate) -> Product:
+        data = product_data.model_dump()
+        created_at = datetime.now()
+        cursor = conn.execute(
+            "INSERT INTO products (name, description, price, category, tags, in_stock, created_at, created_ts)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (data["name"], data["description"], data["price"], data["category"], json.dumps(data["tags"]),
+             int(data["in_stock"]), created_at.isoformat(), created_at.timestamp()),
+        )
+        product = Product(id=cursor.lastrowid, **data, created_at=created_at)
+        self._insert_tags(conn, product)
+        self._insert_text(conn, product)
+        return product
+
+    def _update_product(self, conn: sqlite3.Connection, product_id: int, changes: dict) -> Optional[Product]:
+        product = self._select_product(conn, product_id)
+        if product is None:
+            return None
+        updated = product.model_copy(update=changes)
+        conn.execute(
+            "UPDATE products SET name = ?, description = ?, price = ?, category = ?, tags = ?, in_stock = ?"
+            " WHERE id = ?",
+            (updated.name, updated.description, updated.price, updated.category, json.dumps(updated.tags),
+             int(updated.in_stock), product_id),
+        )
+        if updated.tags != product.tags:
+            conn.execute("DELETE FROM product_tags WHERE product_id = ?", (product_id,))
+            self._insert_tags(conn, updated)
+        if (updated.name, updated.description) != (product.name, product.description):
+            conn.execute("DELETE FROM products_fts WHERE rowid = ?", (product_id,))
+            self._insert_text(conn, updated)
+        return updated
+
+    def _delete_product(self, conn: sqlite3.Connection, product_id: int) -> bool:
+        if conn.execute("DELETE FROM products WHERE id = ?", (product_id,)).rowcount == 0:
+            return False
+        conn.execute("DELETE FROM product_tags WHERE product_id = ?", (product_id,))
+        conn.execute("DELETE FROM products_fts WHERE rowid = ?", (product_id,))
+        return True
+
+    @staticmethod
+    def _insert_tags(conn: sqlite3.Connection, product: Product):
+        conn.executemany(
+            "INSERT INTO product_tags (tag, product_id) VALUES (?, ?)",
+            [(tag, product.id) for tag in dict.fromkeys(product.tags)],
+        )
+
+    @staticmethod
+    def _insert_text(conn: sqlite3.Connection, product: Product):
+        conn.execute(
+            "INSERT INTO products_fts (rowid, text) VALUES (?, ?)",
+            (product.id, f"{product.name} {product.description}"),
+        )
+
+    def create_user(self, user_data: UserCreate) -> User:
+        """Create a new user in the database; raises DuplicateEmail if the email is taken."""
+        data = user_data.model_dump()
+        created_at = datetime.now()
+        try:
+            with self._transaction() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO users (name, email, password, created_at, email_key) VALUES (?, ?, ?, ?, ?)",
+                    (data["name"], data["email"], data["password"], created_at.isoformat(), email_key(data["email"])),
+                )
+        except sqlite3.IntegrityError:
+            raise DuplicateEmail(data["email"]) from None
+        return User(id=cursor.lastrowid, **data, created_at=created_at)
+
+    def get_all_users(self) -> List[User]:
+        """Get all users in id order."""
+        with self._pool.connection() as conn:
+            rows = conn.execute(f"SELECT {USER_COLUMNS} FROM users ORDER BY id").fetchall()
+        return [_user(row) for row in rows]
+
+    def get_users_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[User], Optional[int]]:
+        """Get up to ``limit`` users with ids greater than ``after``."""
+        after = resume_key(None, after)
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                (after if after is not None else 0, limit + 1),
+            ).fetchall()
+        return self._page([_user(row) for row in rows], limit, record_id)
+
+    def get_user(self, user_id: int) -> Optional[User]:
+        """Get a specific user by ID."""
+        with self._pool.connection() as conn:
+            row = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+        return _user(row) if row is not None else None
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get the user with ``email``, ignoring case, through the unique email index."""
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE email_key = ?", (email_key(email),)
+            ).fetchone()
+        return _user(row) if row is not None else None
+
+    def update_user(self, user_id: int, update_data: UserUpdate) -> Optional[User]:
+        """Update an existing user in the database; raises DuplicateEmail if the new email is taken."""
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+                if row is None:
+                    return None
+                user = _user(row)
+                updated = user.model_copy(update=update_data.model_dump(exclude_unset=True))
+                conn.execute(
+                    "UPDATE users SET name = ?, email = ?, password = ? WHERE id = ?",
+                    (updated.name, updated.email, updated.password, user_id),
+                )
+                # Only when it changes, so a duplicate kept from version 1 can still be edited
+                if email_key(updated.email) != email_key(user.email):
+                    conn.execute("UPDATE users SET email_key = ? WHERE id = ?", (email_key(updated.email), user_id))
+        except sqlite3.IntegrityError:
+            raise DuplicateEmail(update_data.email) from None
+        return updated
+
+    def delete_user(self, user_id: int) -> bool:
+        """Delete a user from the database."""
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount > 0
+
+    @staticmethod
+    def _page(records: list, limit: Optional[int], sort_key: Callable) -> Tuple[list, Optional[Any]]:
+        """Trim a ``limit + 1`` result to a page and the key to resume after."""
+        if limit is not None and len(records) > limit:
+            del records[limit:]
+            return records, sort_key(records[-1])
+        return records, None
@@ -0,0 +1,372 @@
+"""Interface shared by the product and user storage backends."""
+import uuid
+from abc import ABC, abstractmethod
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+from changes import ChangeLog
+from locks import WouldBlock, non_blocking
+from models import (
+    BulkItemResult, Product, ProductCreate, ProductSort, ProductUpdate, User, UserCreate, UserUpdate
+)
+
+# ("create", None, ProductCreate), ("update", id, ProductUpdate) or ("delete", id, None);
+# only ShardedDatabase passes an id with a create, to place it on its shard
+ProductOperation = Tuple[str, Optional[int], Optional[Union[ProductCreate, ProductUpdate]]]
+
+SAMPLE_PRODUCTS = [
+    ProductCreate(
+        name="Wireless Headphones",
+        description="High-quality wireless headphones with noise cancellation",
+        price=199.99,
+        category="Electronics",
+        tags=["audio", "wireless", "premium"]
+    ),
+    ProductCreate(
+        name="Coffee Maker",
+        description="Programmable coffee maker with built-in grinder",
+        price=89.99,
+        category="Appliances",
+        tags=["kitchen", "coffee", "automatic"]
+    ),
+    ProductCreate(
+        name="Laptop Stand",
+        description="Adjustable aluminum laptop stand for ergonomic work",
+        price=45.99,
+        category="Accessories",
+        tags=["ergonomic", "aluminum", "adjustable"]
+    )
+]
+
+
+class DuplicateEmail(Exception):
+    """Raised when a user write would give two users the same email."""
+
+
+def email_key(email: str) -> str:
+    """The form of ``email`` that uniqueness and lookups compare: trimmed and case-folded."""
+    return email.strip().casefold()
+
+
+def record_id(record) -> int:
+    """Default sort key: the record id."""
+    return record.id
+
+
+# Sort key of a product for each ProductSort, as returned to resume after it
+PRODUCT_SORT_KEYS: Dict[Optional[str], Callable[[Product], Any]] = {
+    None: record_id,
+    "price": lambda product: (product.price, product.id),
+    "-price": lambda product: (product.price, product.id),
+    "created_at": lambda product: (product.created_at.timestamp(), product.id),
+}
+
+
+class Storage(ABC):
+    """Product and user storage behind the API endpoints.
+
+    ``products`` and ``users`` are read-only ``{id: record}`` views. Ids are
+    allocated in increasing order and never reused, except after ``clear``.
+    Resume keys passed as ``after`` come from the previous page of the same
+    query; a malformed one raises ValueError.
+    """
+
+    products: Mapping[int, Product]
+    users: Mapping[int, User]
+
+    # Whether reads or writes can wait on I/O; AsyncStorage moves those off
+    # the event loop and calls everything else inline
+    blocking_reads = False
+    blocking_writes = False
+
+    # Log of committed writes for change feeds; None if this backend keeps none
+    changes: Optional[ChangeLog] = None
+
+    @cached_property
+    def aio(self) -> "AsyncStorage":
+        """Awaitable interface to this storage, for async endpoints."""
+        return AsyncStorage(self)
+
+    @cached_property
+    def epoch(self) -> str:
+        """Token unique to this storage object.
+
+        Version counters start over when the process restarts; pairing them
+        with the epoch keeps a version from one run from matching another's.
+        """
+        return uuid.uuid4().hex[:12]
+
+    def collection_version(self, table: str) -> Optional[int]:
+        """Counter raised by every write to ``table`` ("products" or "users").
+
+        None if this backend does not track versions.
+        """
+        return None
+
+    def record_version(self, table: str, record_id: int) -> Optional[int]:
+        """Counter raised by every write to one record of ``table``.
+
+        None if the record does not exist or this backend does not track versions.
+        """
+        return None
+
+    def changes_since(self, table: str, seq: int) -> Optional[Tuple[int, List[Any], List[int]]]:
+        """What changed in ``table`` after change ``seq`` of ``changes``, for delta sync.
+
+        Returns the number to sync from next time, the records created or
+        updated since, and the ids deleted since; a record changed more
+        than once appears once, as it is now. None if the changes since
+        ``seq`` are no longer known, or this backend keeps no change log.
+        """
+        if self.changes is None:
+            return None
+        changed = self.changes.changed_since(table, seq)
+        if changed is None:
+            return None
+        last_seq, ids = changed
+        records = getattr(self, table)
+        upserts, deletes = [], []
+        for record_id in ids:
+            # Read after last_seq, so possibly newer; sent again next time
+            record = records.get(record_id)
+            if record is None:
+                deletes.append(record_id)
+            else:
+                upserts.append(record)
+        return last_seq, upserts, deletes
+
+    def _init_sample_data(self):
+        """Initialize the database with sample product data."""
+        for product_data in SAMPLE_PRODUCTS:
+            self.create_product(product_data)
+
+    @abstractmethod
+    def clear(self):
+        """Remove all products and users and reset id allocation."""
+
+    def close(self):
+        """Release resources; the storage must not be used afterwards."""
+
+    @abstractmethod
+    def create_product(self, product_data: ProductCreate) -> Product:
+        """Create a new product."""
+
+    @abstractmethod
+    def get_all_products(self) -> List[Product]:
+        """Get all products in id order."""
+
+    def iter_all_products(self) -> Iterator[Product]:
+        """Iterate all products in id order, for exports and other full scans.
+
+        Nothing is read until iteration starts, so the iterator can be
+        handed to a worker thread; backends that can avoid holding every
+        product at once read them as they go.
+        """
+        yield from self.get_all_products()
+
+    def get_products_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[Product], Optional[int]]:
+        """Get up to ``limit`` products with ids greater than ``after``.
+
+        Returns the page and the id to resume after, or None on the last page.
+        """
+        return self.query_products(limit=limit, after=after)
+
+    @abstractmethod
+    def query_products(
+        self,
+        category: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[ProductSort] = None,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+    ) -> Tuple[List[Product], Optional[Any]]:
+        """Get products matching every given filter, ordered by ``sort`` (id by default).
+
+        Returns the page and the sort key to resume after, or None on the
+        last page: the id for the default order, ``(price, id)`` or
+        ``(created_at.timestamp(), id)`` otherwise.
+        """
+
+    @abstractmethod
+    def get_product(self, product_id: int) -> Optional[Product]:
+        """Get a specific product by ID."""
+
+    @abstractmethod
+    def update_product(self, product_id: int, update_data: ProductUpdate) -> Optional[Product]:
+        """Update an existing product."""
+
+    @abstractmethod
+    def delete_product(self, product_id: int) -> bool:
+        """Delete a product."""
+
+    @abstractmethod
+    def bulk_products(self, operations: Iterable[ProductOperation]) -> List[BulkItemResult]:
+        """Apply a batch of product writes in order, with a result per operation."""
+
+    @abstractmethod
+    def search_products(self, query: str, limit: int) -> List[Product]:
+        """Get up to ``limit`` products best matching ``query``, ranked by BM25."""
+
+    @abstractmethod
+    def create_user(self, user_data: UserCreate) -> User:
+        """Create a new user; raises DuplicateEmail if the email is taken."""
+
+    @abstractmethod
+    def get_all_users(self) -> List[User]:
+        """Get all users in id order."""
+
+    def iter_all_users(self) -> Iterator[User]:
+        """Iterate all users in id order; see ``iter_all_products``."""
+        yield from self.get_all_users()
+
+    @abstractmethod
+    def get_users_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[User], Optional[int]]:
+        """Get up to ``limit`` users with ids greater than ``after``.
+
+        Returns the page and the id to resume after, or None on the last page.
+        """
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[User]:
+        """Get a specific user by ID."""
+
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get the user whose email matches ``email`` ignoring case."""
+
+    @abstractmethod
+    def update_user(self, user_id: int, update_data: UserUpdate) -> Optional[User]:
+        """Update an existing user; raises DuplicateEmail if the new email is taken."""
+
+    @abstractmethod
+    def delete_user(self, user_id: int) -> bool:
+        """Delete a user."""
+
+
+def resume_key(sort: Optional[str], after: Optional[Any]) -> Optional[Any]:
+    """Validate a resume key for ``sort`` and return it in index form."""
+    if after is None:
+        return None
+    if sort is None:
+        if isinstance(after, int) and not isinstance(after, bool):
+            return after
+    elif (
+        isinstance(after, (list, tuple)) and len(after) == 2
+        and isinstance(after[0], (int, float)) and not isinstance(after[0], bool)
+        and isinstance(after[1], int) and not isinstance(after[1], bool)
+    ):
+        return tuple(after)
+    raise ValueError("Invalid resume key")
+
+
+class AsyncStorage:
+    """Awaitable counterpart of the Storage methods.
+
+    Work that finishes in microseconds, like reading the in-memory store,
+    runs inline on the event loop, where it costs less than handing it to
+    a worker thread. If it would have to wait for a lock, say while a bulk
+    batch holds the write lock, it is retried in the threadpool instead,
+    so the loop never stalls behind it. Calls that can block on I/O (per
+    ``blocking_reads`` and ``blocking_writes``), and bulk batches and
+    unpaged listings, which can hold the CPU for a long time, always run
+    in the threadpool.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+
+    async def _read(self, method: Callable, *args, **kwargs):
+        if self.storage.blocking_reads:
+            return await run_in_threadpool(method, *args, **kwargs)
+        return await self._inline(method, *args, **kwargs)
+
+    async def _write(self, method: Callable, *args, **kwargs):
+        if self.storage.blocking_writes:
+            return await run_in_threadpool(method, *args, **kwargs)
+        return await self._inline(method, *args, **kwargs)
+
+    @staticmethod
+    async def _inline(method: Callable, *args, **kwargs):
+        """Call ``method`` on the event loop, or in the threadpool if it would wait for a lock.
+
+        A write gives up before changing anything, or is rolled back, so it
+        is safe to call again.
+        """
+        try:
+            with non_blocking():
+                return method(*args, **kwargs)
+        except WouldBlock:
+            return await run_in_threadpool(method, *args, **kwargs)
+
+    async def collection_version(self, table: str) -> Optional[int]:
+        return await self._read(self.storage.collection_version, table)
+
+    async def record_version(self, table: str, record_id: int) -> Optional[int]:
+        return await self._read(self.storage.record_version, table, record_id)
+
+    async def changes_since(self, table: str, seq: int) -> Optional[Tuple[int, List[Any], List[int]]]:
+        return await self._read(self.storage.changes_since, table, seq)
+
+    async def create_product(self, product_data: ProductCreate) -> Product:
+        return await self._write(self.storage.create_product, product_data)
+
+    async def get_all_products(self) -> List[Product]:
+        return await run_in_threadpool(self.storage.get_all_products)
+
+    async def get_products_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[Product], Optional[int]]:
+        return await self._read(self.storage.get_products_page, limit, after)
+
+    async def query_products(self, **query) -> Tuple[List[Product], Optional[Any]]:
+        if query.get("limit") is None:
+            # Unpaged, a query can read every product
+            return await run_in_threadpool(self.storage.query_products, **query)
+        return await self._read(self.storage.query_products, **query)
+
+    async def get_product(self, product_id: int) -> Optional[Product]:
+        return await self._read(self.storage.get_product, product_id)
+
+    async def update_product(self, product_id: int, update_data: ProductUpdate) -> Optional[Product]:
+        return await self._write(self.storage.update_product, product_id, update_data)
+
+    async def delete_product(self, product_id: int) -> bool:
+        return await self._write(self.storage.delete_product, product_id)
+
+    async def bulk_products(self, operations: Iterable[ProductOperation]) -> List[BulkItemResult]:
+        return await run_in_threadpool(self.storage.bulk_products, operations)
+
+    async def search_products(self, query: str, limit: int) -> List[Product]:
+        return await self._read(self.storage.search_products, query, limit)
+
+    async def create_user(self, user_data: UserCreate) -> User:
+        return await self._write(self.storage.create_user, user_data)
+
+    async def get_all_users(self) -> List[User]:
+        return await run_in_threadpool(self.storage.get_all_users)
+
+    async def get_users_page(
+        self, limit: int, after: Optional[int] = None
+    ) -> Tuple[List[User], Optional[int]]:
+        return await self._read(self.storage.get_users_page, limit, after)
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        return await self._read(self.storage.get_user, user_id)
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        return await self._read(self.storage.get_user_by_email, email)
+
+    async def update_user(self, user_id: int, update_data: UserUpdate) -> Optional[User]:
+        return await self._write(self.storage.update_user, user_id, update_data)
+
+    async def delete_user(self, user_id: int) -> bool:
+        return await self._write(self.storage.delete_user, user_id)
@@ -3,18 +3,15 @@ import pytest
 from fastapi.testclient import TestClient
 
 from database import InMemoryDatabase
+from passwords import PasswordHasher
 
 
 @pytest.fixture
 def test_db():
     """Create a fresh database instance for each test."""
     db = InMemoryDatabase()
-    # Clear sample data that was initialized
-    db.products.clear()
-    db.users.clear()
-    # Reset IDs to start from 1
-    db.next_id = 1
-    db.next_user_id = 1
+    # Clear sample data that was initialized and reset IDs to start from 1
+    db.clear()
     return db
 
 
@@ -30,6 +27,8 @@ def client(test_db, monkeypatch):
     # Also update main's reference if it exists
     if hasattr(main, 'db'):
         monkeypatch.setattr(main, "db", test_db)
+    # Hash passwords inline and cheaply; test_passwords covers the worker pool
+    monkeypatch.setattr(main, "password_hasher", PasswordHasher(workers=0, cost=4))
     
     from main import app
     return TestClient(app)
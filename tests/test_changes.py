@@ -0,0 +1,98 @@
+"""Tests for the log of committed writes."""
+import threading
+
+from changes import Change, ChangeLog
+
+
+class TestChangeLog:
+    """Tests for ChangeLog numbering, retention and waiting."""
+
+    def test_since_returns_changes_after_seq(self):
+        """Test that changes are numbered from 1 and read back after a given number."""
+        log = ChangeLog()
+        log.append("create", "products", 1, "first")
+        log.append("delete", "products", 1)
+        assert log.last_seq == 2
+        assert log.since(0) == [Change(1, "create", "products", 1, "first"), Change(2, "delete", "products", 1)]
+        assert [change.seq for change in log.since(1)] == [2]
+        assert log.since(2) == []
+
+    def test_dropped_changes_need_a_reload(self):
+        """Test that asking for changes no longer kept, or not yet made, gets None."""
+        log = ChangeLog(capacity=2)
+        for i in range(3):
+            log.append("create", "products", i)
+        assert log.since(0) is None
+        assert [change.seq for change in log.since(1)] == [2, 3]
+        assert log.since(4) is None
+
+    def test_wait_wakes_on_append(self):
+        """Test that a reader blocked in wait gets a change appended from another thread."""
+        log = ChangeLog()
+        timer = threading.Timer(0.05, log.append, ("create", "users", 1))
+        timer.start()
+        assert [change.op for change in log.wait(0, timeout=5)] == ["create"]
+        assert log.wait(1, timeout=0.01) == []
+        timer.join()
+
+    def test_mirror_keeps_numbers(self):
+        """Test that extend keeps another log's numbers and restart skips ahead."""
+        source, mirror = ChangeLog(), ChangeLog()
+        source.append("create", "products", 1)
+        source.append("update", "products", 1)
+        mirror.restart(1)
+        mirror.extend(source.since(1))
+        assert mirror.since(1) == source.since(1)
+        assert mirror.since(0) is None
+
+        mirror.restart(10)
+        assert mirror.since(2) is None
+        assert mirror.since(10) == []
+
+    def test_listeners_called_per_change(self):
+        """Test that subscribed listeners hear every change until they unsubscribe."""
+        log = ChangeLog()
+        calls = []
+        listener = lambda: calls.append(log.last_seq)
+        log.subscribe(listener)
+        log.append("reset")
+        log.extend([Change(2, "reset")])
+        log.unsubscribe(listener)
+        log.append("reset")
+        assert calls == [1, 2]
+
+
+class TestCompactedLog:
+    """Tests for the per-record compacted log behind delta sync."""
+
+    def test_changed_since_lists_each_record_once(self):
+        """Test that a record changed several times is listed once, at its last change."""
+        log = ChangeLog(capacity=2)
+        log.append("create", "products", 1)
+        log.append("create", "products", 2)
+        log.append("create", "users", 1)
+        log.append("update", "products", 1)
+        assert log.changed_since("products", 0) == (4, [2, 1])
+        assert log.changed_since("products", 2) == (4, [1])
+        assert log.changed_since("users", 3) == (4, [])
+        assert log.changed_since("products", 5) is None
+
+    def test_evicted_records_need_a_resync(self):
+        """Test that tokens from before the oldest kept record's change get None."""
+        log = ChangeLog(compacted_capacity=2)
+        for record_id in (1, 2, 3):
+            log.append("create", "products", record_id)
+        assert log.changed_since("products", 0) is None
+        assert log.changed_since("products", 1) == (3, [2, 3])
+        assert log.changed_since("users", 0) == (3, [])
+
+    def test_reset_needs_a_resync(self):
+        """Test that a reset, or a mirror restarting, invalidates every earlier token."""
+        log = ChangeLog()
+        log.append("create", "products", 1)
+        log.append("reset")
+        assert log.changed_since("products", 1) is None
+        assert log.changed_since("products", 2) == (2, [])
+        log.restart(10)
+        assert log.changed_since("users", 2) is None
+        assert log.changed_since("users", 10) == (10, [])
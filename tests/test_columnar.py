@@ -0,0 +1,132 @@
+"""Tests for the columnar snapshot format and the layered product table."""
+from datetime import datetime
+
+import pytest
+
+from columnar import ColumnarProducts, ProductTable, write_snapshot
+from models import Product
+from rows import product_row
+
+
+def make_product(product_id, name="Product", price=10.0, category="Cat", tags=("tag",), in_stock=True):
+    return Product(
+        id=product_id,
+        name=name,
+        description=f"Description of {name}",
+        price=price,
+        category=category,
+        tags=list(tags),
+        in_stock=in_stock,
+        created_at=datetime(2024, 1, 1, 12, 0, 0, product_id),
+    )
+
+
+@pytest.fixture
+def products():
+    return [
+        make_product(3, "Café table", price=5.0, category="Furniture", tags=["wood", "café"]),
+        make_product(1, "Lamp", price=20.0, tags=[], in_stock=False),
+        make_product(2, "Desk", price=5.0, category="Furniture", tags=["wood"]),
+    ]
+
+
+@pytest.fixture
+def snapshot(tmp_path, products):
+    path = tmp_path / "snapshot.bin"
+    with open(path, "wb") as f:
+        write_snapshot(f, [product_row(p) for p in products], {"next_id": 4})
+    return ColumnarProducts(str(path))
+
+
+class TestColumnarProducts:
+    """Tests for reading products back from a columnar snapshot."""
+
+    def test_round_trip(self, snapshot, products):
+        """Test that every field survives, with rows ordered by id."""
+        assert list(snapshot) == [1, 2, 3]
+        assert [snapshot[p.id] for p in products] == products
+        assert snapshot.extra == {"next_id": 4}
+
+    def test_mapping_lookups(self, snapshot):
+        """Test length, membership and missing ids."""
+        assert len(snapshot) == 3
+        assert 2 in snapshot
+        assert 4 not in snapshot
+        assert "2" not in snapshot
+        with pytest.raises(KeyError):
+            snapshot[4]
+
+    def test_index_readers(self, snapshot):
+        """Test the bulk readers used to build indexes, with and without skipped ids."""
+        assert snapshot.live_ids() == [1, 2, 3]
+        assert snapshot.price_keys() == [(5.0, 2), (5.0, 3), (20.0, 1)]
+        assert snapshot.price_keys(skip={2}) == [(5.0, 3), (20.0, 1)]
+        assert [key[1] for key in snapshot.created_keys()] == [1, 2, 3]
+        assert snapshot.ids_by_category() == {"Cat": {1}, "Furniture": {2, 3}}
+        assert snapshot.ids_by_in_stock(skip={1}) == {True: {2, 3}}
+        assert snapshot.ids_by_tag(skip={3}) == {"wood": {2}}
+
+    def test_empty_snapshot(self, tmp_path):
+        """Test that a snapshot without products can be opened."""
+        path = tmp_path / "empty.bin"
+        with open(path, "wb") as f:
+            write_snapshot(f, [])
+        snapshot = ColumnarProducts(str(path))
+        assert len(snapshot) == 0
+        assert snapshot.extra == {}
+        assert snapshot.ids_by_tag() == {}
+
+    def test_rejects_other_files(self, tmp_path):
+        """Test that a file in another format is refused."""
+        path = tmp_path / "other.bin"
+        path.write_bytes(b"not a snapshot" * 4)
+        with pytest.raises(ValueError):
+            ColumnarProducts(str(path))
+
+
+class TestProductTable:
+    """Tests for writes layered over a snapshot."""
+
+    def test_writes_shadow_snapshot_rows(self, snapshot):
+        """Test replacing, deleting and adding products over the snapshot."""
+        table = ProductTable(snapshot)
+        table[2] = make_product(2, "New desk")
+        del table[1]
+        table[4] = make_product(4, "Chair")
+
+        assert len(table) == 3
+        assert list(table) == [2, 3, 4]
+        assert [p.name for p in table.values()] == ["New desk", "Café table", "Chair"]
+        assert [row[1] for row in table.rows()] == ["New desk", "Café table", "Chair"]
+        assert 1 not in table and table.get(1) is None
+        assert table.shadowed() == {1, 2}
+        assert [p.id for p in table.in_memory()] == [2, 4]
+        with pytest.raises(KeyError):
+            del table[1]
+
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_iterates_in_id_order_however_inserted(self, snapshot, compact):
+        """Test that rows written out of id order are still iterated in id order."""
+        table = ProductTable(snapshot, compact=compact)
+        for product_id in (6, 4, 5):
+            table[product_id] = make_product(product_id)
+        assert list(table) == [1, 2, 3, 4, 5, 6]
+        assert [p.id for p in table.values()] == [1, 2, 3, 4, 5, 6]
+        assert [row[0] for row in table.rows()] == [1, 2, 3, 4, 5, 6]
+
+    def test_copy_is_independent(self, snapshot):
+        """Test that a copy keeps its contents when the original changes."""
+        table = ProductTable(snapshot)
+        copy = table.copy()
+        del table[3]
+        table[5] = make_product(5)
+        assert list(copy) == [1, 2, 3]
+
+    def test_clear_detaches_snapshot(self, snapshot):
+        """Test that clearing removes snapshot rows too."""
+        table = ProductTable(snapshot)
+        table.clear()
+        assert len(table) == 0
+        assert table.base is None
+        table[1] = make_product(1)
+        assert list(table) == [1]
@@ -0,0 +1,135 @@
+"""Tests for compact in-memory product storage."""
+from datetime import datetime
+
+import pytest
+
+import compact
+from compact import CompactProducts
+from database import InMemoryDatabase, ShardedDatabase
+from models import Product, ProductCreate, ProductUpdate
+from persistence import Persistence
+
+
+def product(product_id: int, **changes) -> Product:
+    fields = dict(
+        id=product_id, name=f"Prödüct {product_id}", description="Déscription", price=product_id * 1.5,
+        category=f"Cat {product_id % 3}", tags=[f"tag{product_id % 4}", "shared"], in_stock=product_id % 2 == 0,
+        created_at=datetime(2024, 5, 6, 7, 8, 9, product_id),
+    )
+    fields.update(changes)
+    return Product(**fields)
+
+
+class TestCompactProducts:
+    """Tests for CompactProducts."""
+
+    def test_round_trips_every_field(self):
+        """Test that rows read back equal to the products written."""
+        table = CompactProducts()
+        products = [product(i) for i in range(1, 20)] + [product(20, tags=[], in_stock=False, name="")]
+        for item in products:
+            table[item.id] = item
+        assert [table[item.id] for item in products] == products
+        assert list(table) == list(range(1, 21))
+        assert list(table.values()) == products
+        assert len(table) == 20
+
+    def test_update_delete_and_missing(self):
+        """Test replacing and deleting rows, and reads of absent ids."""
+        table = CompactProducts()
+        table[1], table[2] = product(1), product(2)
+        table[1] = product(1, name="Renamed", tags=["new"])
+        del table[2]
+        assert table[1].name == "Renamed" and table[1].tags == ["new"]
+        assert 2 not in table and 99 not in table and -1 not in table
+        assert table.get(2) is None and table.get(99) is None
+        with pytest.raises(KeyError):
+            del table[2]
+        assert len(table) == 1
+
+    def test_compaction_keeps_live_rows(self, monkeypatch):
+        """Test that rewriting the columns after many updates loses nothing."""
+        monkeypatch.setattr(compact, "_MIN_GARBAGE", 4)
+        table = CompactProducts()
+        for i in range(1, 6):
+            table[i] = product(i)
+        for round_ in range(5):
+            for i in range(1, 6):
+                table[i] = product(i, price=float(round_))
+        assert table._fresh is None
+        assert len(table._columns.ids) < 30
+        assert [p.price for p in table.values()] == [4.0] * 5
+
+    def test_compaction_moves_a_step_per_write(self, monkeypatch):
+        """Test that compaction spreads over writes, which land in both generations meanwhile."""
+        monkeypatch.setattr(compact, "_MIN_GARBAGE", 4)
+        monkeypatch.setattr(compact, "_COMPACT_STEP", 2)
+        table = CompactProducts()
+        for i in range(1, 9):
+            table[i] = product(i)
+        for i in range(1, 6):
+            table[i] = product(i, price=0.0)
+        for i in range(1, 6):
+            table[i] = product(i, price=1.0)
+        assert table._fresh is not None
+        old = table._columns
+        moved = table._cursor
+        table[1] = product(1, name="Moved")
+        del table[2]
+        table[12] = product(12)
+        assert table._columns is old and table._cursor == moved + 6
+        assert table[1].name == "Moved" and 2 not in table and table[12] == product(12)
+        while table._fresh is not None:
+            table[12] = product(12)
+        assert table._columns is not old
+        assert list(table) == [1, 3, 4, 5, 6, 7, 8, 12]
+        assert table[1].name == "Moved" and table[3].price == 1.0 and table[8] == product(8)
+
+    def test_id_stride(self):
+        """Test that slots are kept for every id_stride-th id only, and other ids are absent."""
+        table = CompactProducts(id_stride=4)
+        for i in range(3, 4000, 4):
+            table[i] = product(i)
+        assert len(table._columns.slots) == 1000
+        assert table[3999] == product(3999)
+        assert 3996 not in table and table.get(4) is None
+        assert list(table) == list(range(3, 4000, 4))
+
+    def test_copy_is_independent(self):
+        """Test that a copy does not see later writes."""
+        table = CompactProducts()
+        table[1] = product(1)
+        snapshot = table.copy()
+        table[1] = product(1, name="Changed")
+        table[2] = product(2)
+        assert snapshot[1].name == product(1).name
+        assert list(snapshot) == [1]
+
+
+class TestCompactDatabase:
+    """Tests for InMemoryDatabase with compact products."""
+
+    def test_recovers_into_compact_columns(self, tmp_path):
+        """Test that a persisted database reopens with compact in-memory rows."""
+        db = InMemoryDatabase(persistence=Persistence(str(tmp_path), commit_interval=0), compact=True)
+        created = db.create_product(ProductCreate(name="New", description="D", price=1.0, category="C"))
+        db.update_product(1, ProductUpdate(price=2.0))
+        db.close()
+
+        db = InMemoryDatabase(persistence=Persistence(str(tmp_path), commit_interval=0), compact=True)
+        assert isinstance(db.products._added, CompactProducts)
+        assert db.get_product(created.id) == created
+        assert db.get_product(1).price == 2.0
+        assert db.query_products(category="C")[0] == [created]
+        db.close()
+
+    def test_shards_size_slots_to_their_ids(self):
+        """Test that each shard of a compact sharded database keeps slots for its own ids only."""
+        db = ShardedDatabase(shards=4, compact=True)
+        created = [
+            db.create_product(ProductCreate(name=f"P{i}", description="D", price=1.0, category="C"))
+            for i in range(200)
+        ]
+        for shard in db.shards:
+            assert len(shard.products._added._columns.slots) <= 51
+        assert [db.get_product(product.id) for product in created] == created
@@ -0,0 +1,63 @@
+"""Tests for response body compression."""
+import gzip
+import zlib
+
+import pytest
+
+import compression
+from compression import Compressor, choose_encoding
+
+zstandard = pytest.importorskip("zstandard")
+
+
+def decompress(encoding: str, body: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+
+class TestChooseEncoding:
+    """Tests for Accept-Encoding negotiation."""
+
+    @pytest.mark.parametrize("accept_encoding,expected", [
+        (None, None),
+        ("identity", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("ZSTD;q=0.5", "zstd"),
+        ("zstd;q=0, gzip", "gzip"),
+        ("gzip; q=0", None),
+    ])
+    def test_choose_encoding(self, accept_encoding, expected):
+        """Test that zstd is preferred, gzip is the fallback and q=0 rules an encoding out."""
+        assert choose_encoding(accept_encoding) == expected
+
+    def test_gzip_only_without_zstandard(self, monkeypatch):
+        """Test that without zstandard clients accepting both get gzip."""
+        monkeypatch.setattr(compression, "ENCODINGS", ("gzip",))
+        assert choose_encoding("zstd, gzip") == "gzip"
+
+
+class TestCompressor:
+    """Tests for whole and streamed compression."""
+
+    @pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+    def test_round_trip(self, encoding):
+        """Test that a whole body and the same body as chunks both decompress to it."""
+        body = b'{"name":"Product","price":9.99},' * 1000
+        assert decompress(encoding, Compressor(encoding, 1).compress(body)) == body
+
+        compressor = Compressor(encoding, 1)
+        chunks = [compressor.chunk(body[:100]), compressor.chunk(body[100:]), compressor.chunk(b"", final=True)]
+        assert decompress(encoding, b"".join(chunks)) == body
+
+    @pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+    def test_chunks_decode_as_they_arrive(self, encoding):
+        """Test that each flushed chunk can be decompressed before the stream ends."""
+        compressor = Compressor(encoding, 3)
+        if encoding == "gzip":
+            decoder = zlib.decompressobj(31)
+        else:
+            decoder = zstandard.ZstdDecompressor().decompressobj()
+        assert decoder.decompress(compressor.chunk(b"first line\n")) == b"first line\n"
+        assert decoder.decompress(compressor.chunk(b"second line\n")) == b"second line\n"
@@ -2,22 +2,37 @@
 import pytest
 from datetime import datetime
 
-from database import InMemoryDatabase
+from database import InMemoryDatabase, ShardedDatabase
+from remote import RemoteDatabase, StorageServer
+from sqlite_database import SQLiteDatabase
+from storage import DuplicateEmail
 from models import ProductCreate, ProductUpdate, UserCreate, UserUpdate
 
 
 class TestInMemoryDatabase:
-    """Tests for InMemoryDatabase class."""
+    """Tests for the storage backends: InMemoryDatabase (plain, compact and remote), ShardedDatabase and SQLiteDatabase."""
 
-    @pytest.fixture
-    def db(self):
+    @pytest.fixture(params=["memory", "compact", "sharded", "sqlite", "remote"])
+    def db(self, request, tmp_path):
         """Create a fresh database instance."""
-        db = InMemoryDatabase()
-        db.products.clear()
-        db.users.clear()
-        db.next_id = 1
-        db.next_user_id = 1
-        return db
+        server = None
+        if request.param == "sqlite":
+            db = SQLiteDatabase(str(tmp_path / "products.db"))
+        elif request.param == "sharded":
+            db = ShardedDatabase(shards=3)
+        elif request.param == "compact":
+            db = InMemoryDatabase(compact=True)
+        elif request.param == "remote":
+            server = StorageServer(InMemoryDatabase())
+            server.start()
+            db = RemoteDatabase(server.address)
+        else:
+            db = InMemoryDatabase()
+        db.clear()
+        yield db
+        db.close()
+        if server is not None:
+            server.close()
 
     class TestProductOperations:
         """Tests for product database operations."""
@@ -184,6 +199,306 @@ class TestInMemoryDatabase:
             assert db.get_product(product2.id) is None
             assert db.get_product(product3.id) is not None
 
+        def test_get_all_products_is_a_snapshot(self, db):
+            """Test that later writes do not change an already returned list."""
+            product = db.create_product(ProductCreate(
+                name="Original", description="Desc", price=10.0, category="Cat"
+            ))
+            snapshot = db.get_all_products()
+
+            db.update_product(product.id, ProductUpdate(name="Changed"))
+            db.create_product(ProductCreate(
+                name="New", description="Desc", price=10.0, category="Cat"
+            ))
+
+            assert [p.name for p in snapshot] == ["Original"]
+
+        def test_get_all_products_keeps_insertion_order_after_delete(self, db):
+            """Test that listing preserves creation order around deletes."""
+            product_data = ProductCreate(
+                name="Product",
+                description="Desc",
+                price=10.0,
+                category="Cat"
+            )
+            ids = [db.create_product(product_data).id for _ in range(5)]
+            db.delete_product(ids[1])
+            db.delete_product(ids[3])
+            new_product = db.create_product(product_data)
+
+            listed_ids = [p.id for p in db.get_all_products()]
+            assert listed_ids == [ids[0], ids[2], ids[4], new_product.id]
+
+        def test_get_products_page(self, db):
+            """Test walking the products in pages by id."""
+            product_data = ProductCreate(
+                name="Product",
+                description="Desc",
+                price=10.0,
+                category="Cat"
+            )
+            for _ in range(5):
+                db.create_product(product_data)
+
+            page, next_after = db.get_products_page(2)
+            assert [p.id for p in page] == [1, 2]
+            assert next_after == 2
+
+            page, next_after = db.get_products_page(2, after=next_after)
+            assert [p.id for p in page] == [3, 4]
+
+            page, next_after = db.get_products_page(2, after=next_after)
+            assert [p.id for p in page] == [5]
+            assert next_after is None
+
+        def test_get_products_page_skips_deleted_ids(self, db):
+            """Test that a cursor stays valid when its row is deleted."""
+            product_data = ProductCreate(
+                name="Product",
+                description="Desc",
+                price=10.0,
+                category="Cat"
+            )
+            for _ in range(4):
+                db.create_product(product_data)
+
+            page, next_after = db.get_products_page(2)
+            db.delete_product(next_after)
+            db.delete_product(3)
+
+            page, next_after = db.get_products_page(2, after=next_after)
+            assert [p.id for p in page] == [4]
+            assert next_after is None
+
+    class TestProductIndexes:
+        """Tests for secondary product indexes and filtered queries."""
+
+        @pytest.fixture
+        def catalog(self, db):
+            """Populate the database with a small mixed catalog."""
+            rows = [
+                ("Phone", "Electronics", ["mobile", "sale"], True),
+                ("Cable", "Electronics", ["sale"], False),
+                ("Kettle", "Appliances", ["kitchen", "sale"], True),
+                ("Toaster", "Appliances", ["kitchen"], True),
+            ]
+            return [
+                db.create_product(ProductCreate(
+                    name=name, description="Desc", price=10.0,
+                    category=category, tags=tags, in_stock=in_stock
+                ))
+                for name, category, tags, in_stock in rows
+            ]
+
+        @staticmethod
+        def names(db, **filters):
+            products, _ = db.query_products(**filters)
+            return [p.name for p in products]
+
+        def test_filter_by_category(self, db, catalog):
+            """Test filtering by category."""
+            assert self.names(db, category="Electronics") == ["Phone", "Cable"]
+            assert self.names(db, category="Missing") == []
+
+        def test_filter_by_in_stock(self, db, catalog):
+            """Test filtering by stock status."""
+            assert self.names(db, in_stock=False) == ["Cable"]
+            assert self.names(db, in_stock=True) == ["Phone", "Kettle", "Toaster"]
+
+        def test_filter_by_tags(self, db, catalog):
+            """Test that multiple tags must all match."""
+            assert self.names(db, tags=["sale"]) == ["Phone", "Cable", "Kettle"]
+            assert self.names(db, tags=["sale", "kitchen"]) == ["Kettle"]
+
+        def test_combined_filters(self, db, catalog):
+            """Test intersecting category, stock and tag filters."""
+            assert self.names(db, category="Electronics", in_stock=True, tags=["sale"]) == ["Phone"]
+
+        def test_filtered_pagination(self, db, catalog):
+            """Test paging through a filtered result."""
+            page, next_after = db.query_products(tags=["sale"], limit=2)
+            assert [p.name for p in page] == ["Phone", "Cable"]
+            page, next_after = db.query_products(tags=["sale"], limit=2, after=next_after)
+            assert [p.name for p in page] == ["Kettle"]
+            assert next_after is None
+
+        def test_update_moves_product_between_indexes(self, db, catalog):
+            """Test that updates re-index category, stock and tags."""
+            phone = catalog[0]
+            db.update_product(phone.id, ProductUpdate(
+                category="Mobile", in_stock=False, tags=["refurbished"]
+            ))
+
+            assert self.names(db, category="Electronics") == ["Cable"]
+            assert self.names(db, category="Mobile") == ["Phone"]
+            assert self.names(db, in_stock=False) == ["Phone", "Cable"]
+            assert self.names(db, tags=["mobile"]) == []
+            assert self.names(db, tags=["refurbished"]) == ["Phone"]
+
+        def test_delete_removes_from_indexes(self, db, catalog):
+            """Test that deleted products stop matching filters."""
+            db.delete_product(catalog[2].id)
+            assert self.names(db, category="Appliances") == ["Toaster"]
+            assert self.names(db, tags=["kitchen"]) == ["Toaster"]
+
+    class TestProductOrdering:
+        """Tests for price ranges and sorted product queries."""
+
+        @pytest.fixture
+        def catalog(self, db):
+            """Populate the database with products at repeating prices."""
+            return [
+                db.create_product(ProductCreate(
+                    name=f"Product {i}", description="Desc", price=float(i % 7),
+                    category="Rare" if i % 20 == 0 else "Common", tags=["even"] if i % 2 == 0 else []
+                ))
+                for i in range(60)
+            ]
+
+        @staticmethod
+        def collect(db, limit, **query):
+            """Page through a query and return every product id in order."""
+            ids, after = [], None
+            while True:
+                page, after = db.query_products(limit=limit, after=after, **query)
+                ids.extend(p.id for p in page)
+                if after is None:
+                    return ids
+
+        def test_price_range_by_id(self, db, catalog):
+            """Test that a price range without sort keeps id order."""
+            products, _ = db.query_products(min_price=2.0, max_price=3.0)
+            assert [p.id for p in products] == [p.id for p in catalog if 2.0 <= p.price <= 3.0]
+
+        @pytest.mark.parametrize("sort", ["price", "-price", "created_at"])
+        @pytest.mark.parametrize("filters", [
+            {},
+            {"min_price": 2.0},
+            {"max_price": 4.0},
+            {"min_price": 1.5, "max_price": 5.0},
+            {"tags": ["even"], "min_price": 3.0},
+            {"category": "Rare"},
+            {"category": "Rare", "max_price": 3.0},
+        ])
+        def test_sorted_pages_match_full_sort(self, db, catalog, sort, filters):
+            """Test sorted, filtered pagination against a brute-force sort."""
+            expected = [
+                p for p in catalog
+                if filters.get("min_price", -1) <= p.price <= filters.get("max_price", 100)
+                and ("even" in p.tags or "tags" not in filters)
+                and p.category == filters.get("category", p.category)
+            ]
+            if sort == "created_at":
+                expected.sort(key=lambda p: (p.created_at, p.id))
+            else:
+                expected.sort(key=lambda p: (p.price, p.id), reverse=sort == "-price")
+
+            assert self.collect(db, 4, sort=sort, **filters) == [p.id for p in expected]
+
+        def test_price_index_follows_updates_and_deletes(self, db, catalog):
+            """Test that price changes and deletes move products in the order."""
+            db.update_product(catalog[0].id, ProductUpdate(price=100.0))
+            db.delete_product(catalog[1].id)
+
+            products, _ = db.query_products(sort="-price", limit=1)
+            assert products[0].id == catalog[0].id
+            products, _ = db.query_products(min_price=1.0, max_price=1.0)
+            assert catalog[1].id not in [p.id for p in products]
+
+        def test_invalid_resume_key(self, db, catalog):
+            """Test that a resume key for another ordering is rejected."""
+            with pytest.raises(ValueError):
+                db.query_products(sort="price", after=5)
+            with pytest.raises(ValueError):
+                db.query_products(after=[1.0, 5])
+
+    class TestBulkOperations:
+        """Tests for batched product writes."""
+
+        @staticmethod
+        def create(name, price=10.0, tags=()):
+            return "create", None, ProductCreate(
+                name=name, description="Desc", price=price, category="Cat", tags=list(tags)
+            )
+
+        def test_bulk_create_update_delete(self, db):
+            """Test applying mixed operations and their result statuses."""
+            existing = db.create_product(self.create("Existing")[2])
+
+            results = db.bulk_products([
+                self.create("First", price=5.0),
+                self.create("Second", price=1.0),
+                ("update", existing.id, ProductUpdate(price=3.0)),
+                ("update", 999, ProductUpdate(price=3.0)),
+                ("delete", 999, None),
+            ])
+
+            assert [(r.op, r.id, r.status) for r in results] == [
+                ("create", 2, 200),
+                ("create", 3, 200),
+                ("update", 1, 200),
+                ("update", 999, 404),
+                ("delete", 999, 404),
+            ]
+            products, _ = db.query_products(sort="price")
+            assert [p.name for p in products] == ["Second", "Existing", "First"]
+
+        def test_bulk_indexes_final_state_once(self, db):
+            """Test that products touched several times in a batch index correctly."""
+            db.bulk_products([
+                self.create("Lamp", tags=["old"]),
+                ("update", 1, ProductUpdate(name="Light", tags=["new"], price=50.0)),
+                self.create("Gone"),
+                ("delete", 2, None),
+            ])
+
+            assert db.query_products(tags=["old"])[0] == []
+            assert [p.name for p in db.query_products(tags=["new"])[0]] == ["Light"]
+            assert [p.name for p in db.query_products(min_price=40.0)[0]] == ["Light"]
+            assert [p.name for p in db.search_products("light", 10)] == ["Light"]
+            assert db.search_products("gone", 10) == []
+            assert [p.id for p in db.get_all_products()] == [1]
+
+        def test_bulk_large_batch_merges_sorted_indexes(self, db):
+            """Test that a large batch keeps id and price order intact."""
+            db.bulk_products([self.create(f"P{i}", price=float(i % 10)) for i in range(500)])
+
+            products, _ = db.query_products(sort="price", limit=3)
+            assert [p.price for p in products] == [0.0, 0.0, 0.0]
+            page, _ = db.get_products_page(2, after=250)
+            assert [p.id for p in page] == [251, 252]
+
+    class TestProductSearch:
+        """Tests for full-text product search."""
+
+        def test_search_by_name_and_description(self, db):
+            """Test that both name and description are searched."""
+            db.create_product(ProductCreate(
+                name="Coffee Maker", description="Brews coffee", price=10.0, category="Cat"
+            ))
+            db.create_product(ProductCreate(
+                name="Grinder", description="Grinds beans for coffee", price=10.0, category="Cat"
+            ))
+            db.create_product(ProductCreate(
+                name="Kettle", description="Boils water", price=10.0, category="Cat"
+            ))
+
+            assert [p.name for p in db.search_products("coffee", 10)] == ["Coffee Maker", "Grinder"]
+            assert [p.name for p in db.search_products("water", 10)] == ["Kettle"]
+
+        def test_search_follows_updates_and_deletes(self, db):
+            """Test that postings change in place with the product."""
+            product = db.create_product(ProductCreate(
+                name="Desk Lamp", description="LED lamp", price=10.0, category="Cat"
+            ))
+            db.update_product(product.id, ProductUpdate(name="Floor Light", description="Tall light"))
+
+            assert db.search_products("lamp", 10) == []
+            assert [p.id for p in db.search_products("light", 10)] == [product.id]
+
+            db.delete_product(product.id)
+            assert db.search_products("light", 10) == []
+
     class TestUserOperations:
         """Tests for user database operations."""
 
@@ -231,7 +546,7 @@ class TestInMemoryDatabase:
                 password="pass"
             )
             db.create_user(user_data)
-            db.create_user(user_data)
+            db.create_user(user_data.model_copy(update={"email": "user2@example.com"}))
             
             users = db.get_all_users()
             assert len(users) == 2
@@ -362,9 +677,165 @@ class TestInMemoryDatabase:
             assert db.get_user(user2.id) is None
             assert db.get_user(user3.id) is not None
 
+        def test_get_users_page(self, db):
+            """Test walking the users in pages by id."""
+            for i in range(3):
+                db.create_user(UserCreate(
+                    name=f"User {i}",
+                    email=f"user{i}@example.com",
+                    password="pass"
+                ))
+
+            page, next_after = db.get_users_page(2)
+            assert [u.id for u in page] == [1, 2]
+
+            page, next_after = db.get_users_page(2, after=next_after)
+            assert [u.id for u in page] == [3]
+            assert next_after is None
+
+    class TestUserEmailIndex:
+        """Tests for unique, case-insensitive user emails."""
+
+        def test_get_user_by_email(self, db):
+            """Test looking a user up by email, ignoring case and surrounding spaces."""
+            user = db.create_user(UserCreate(name="User", email="User@Example.com", password="pass"))
+            assert db.get_user_by_email("user@example.com") == user
+            assert db.get_user_by_email(" USER@EXAMPLE.COM ") == user
+            assert db.get_user_by_email("other@example.com") is None
+
+        def test_create_duplicate_email(self, db):
+            """Test that a second user cannot take an email in another case."""
+            db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+            with pytest.raises(DuplicateEmail):
+                db.create_user(UserCreate(name="Other", email="USER@example.com", password="pass"))
+            assert len(db.users) == 1
+
+        def test_update_follows_email(self, db):
+            """Test that the index moves with an updated email."""
+            user = db.create_user(UserCreate(name="User", email="old@example.com", password="pass"))
+            db.update_user(user.id, UserUpdate(email="new@example.com"))
+            assert db.get_user_by_email("old@example.com") is None
+            assert db.get_user_by_email("new@example.com").id == user.id
+            db.create_user(UserCreate(name="Other", email="old@example.com", password="pass"))
+
+        def test_update_to_taken_email(self, db):
+            """Test that an update cannot take another user's email, but may change its own case."""
+            first = db.create_user(UserCreate(name="First", email="first@example.com", password="pass"))
+            second = db.create_user(UserCreate(name="Second", email="second@example.com", password="pass"))
+            with pytest.raises(DuplicateEmail):
+                db.update_user(second.id, UserUpdate(email="First@example.com"))
+            assert db.get_user(second.id).email == "second@example.com"
+            assert db.update_user(first.id, UserUpdate(email="FIRST@example.com")).email == "FIRST@example.com"
+            assert db.get_user_by_email("first@example.com").id == first.id
+
+        def test_delete_frees_email(self, db):
+            """Test that a deleted user's email can be registered again."""
+            user = db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+            db.delete_user(user.id)
+            assert db.get_user_by_email("user@example.com") is None
+            db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+
+    class TestChangeLog:
+        """Tests for the log of committed writes behind the change feeds."""
+
+        @pytest.fixture
+        def changes(self, db):
+            if db.changes is None:
+                pytest.skip("backend keeps no change log")
+            return db.changes
+
+        @staticmethod
+        def read(changes, seq, count):
+            """Collect ``count`` changes after ``seq``; a remote log's copy may lag behind."""
+            found = []
+            while len(found) < count:
+                batch = changes.wait(seq, timeout=5)
+                assert batch, f"only {len(found)} of {count} changes logged"
+                found.extend(batch)
+                seq = batch[-1].seq
+            return found
+
+        def test_writes_logged_in_commit_order(self, db, changes):
+            """Test that each committed write is logged once, with the record written."""
+            start = changes.last_seq
+            product = db.create_product(ProductCreate(name="Product", description="Desc", price=10.0, category="Cat"))
+            updated = db.update_product(product.id, ProductUpdate(price=12.0))
+            db.delete_product(product.id)
+            user = db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+            db.bulk_products([("create", None, ProductCreate(name="Bulk", description="D", price=1.0, category="C"))])
+
+            logged = self.read(changes, start, 5)
+            assert [(c.op, c.table, c.id) for c in logged[:4]] == [
+                ("create", "products", product.id),
+                ("update", "products", product.id),
+                ("delete", "products", product.id),
+                ("create", "users", user.id),
+            ]
+            assert [c.record for c in logged[:4]] == [product, updated, None, user]
+            assert (logged[4].op, logged[4].record.name) == ("create", "Bulk")
+            assert [c.seq for c in logged] == list(range(start + 1, start + 6))
+
+        def test_failed_write_logs_nothing(self, db, changes):
+            """Test that rejected and missed writes leave no change."""
+            start = changes.last_seq
+            db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+            start = self.read(changes, start, 1)[-1].seq
+            with pytest.raises(DuplicateEmail):
+                db.create_user(UserCreate(name="Other", email="USER@example.com", password="pass"))
+            assert db.delete_product(999) is False
+            assert changes.wait(start, timeout=0.1) == []
+
+        def test_changes_since_for_delta_sync(self, db, changes):
+            """Test that delta sync gets each changed record once, as it is now, and deleted ids."""
+            kept = db.create_product(ProductCreate(name="Kept", description="D", price=1.0, category="C"))
+            gone = db.create_product(ProductCreate(name="Gone", description="D", price=1.0, category="C"))
+            user = db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+            # The owner's position, where a remote log's copy may lag
+            start = db.changes_since("users", changes.last_seq)[0]
+            updated = db.update_product(kept.id, ProductUpdate(name="Renamed"))
+            db.update_product(kept.id, ProductUpdate(price=2.0))
+            db.delete_product(gone.id)
+            db.update_user(user.id, UserUpdate(name="Renamed"))
+
+            last_seq, upserts, deletes = db.changes_since("products", start)
+            assert [(p.id, p.name, p.price) for p in upserts] == [(kept.id, updated.name, 2.0)]
+            assert deletes == [gone.id]
+            assert db.changes_since("products", last_seq) == (last_seq, [], [])
+            assert [u.name for u in db.changes_since("users", start)[1]] == ["Renamed"]
+
+        def test_changes_since_after_clear(self, db, changes):
+            """Test that tokens from before a clear need a full resync."""
+            db.create_product(ProductCreate(name="Product", description="D", price=1.0, category="C"))
+            start = db.changes_since("products", changes.last_seq)[0]
+            db.clear()
+            assert db.changes_since("products", start) is None
+
+        def test_clear_logs_reset(self, db, changes):
+            """Test that clearing tells readers to reload everything."""
+            start = changes.last_seq
+            db.clear()
+            assert self.read(changes, start, 1)[-1].op == "reset"
+
     class TestDatabaseIsolation:
         """Tests for database isolation and state management."""
 
+        def test_clear_resets_storage_and_ids(self, db):
+            """Test that clear removes all records and restarts ids."""
+            db.create_product(ProductCreate(
+                name="Product", description="Desc", price=10.0, category="Cat"
+            ))
+            db.create_user(UserCreate(
+                name="User", email="user@example.com", password="pass"
+            ))
+
+            db.clear()
+
+            assert db.get_all_products() == []
+            assert db.get_all_users() == []
+            assert db.create_product(ProductCreate(
+                name="Product", description="Desc", price=10.0, category="Cat"
+            )).id == 1
+
         def test_products_and_users_independent(self, db):
             """Test that products and users are independent."""
             product_data = ProductCreate(
@@ -389,7 +860,7 @@ class TestInMemoryDatabase:
             
             # IDs should be independent
             product2 = db.create_product(product_data)
-            user2 = db.create_user(user_data)
+            user2 = db.create_user(user_data.model_copy(update={"email": "user2@example.com"}))
             
             assert product2.id == 2
             assert user2.id == 2
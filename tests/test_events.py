@@ -0,0 +1,115 @@
+"""Tests for the server-sent event change streams."""
+import asyncio
+import json
+import threading
+
+import pytest
+
+import events
+from changes import ChangeLog
+from events import ChangeNotifier, event_id, iter_events, parse_event_id
+
+EPOCH = "abc123"
+
+
+def encode(change) -> bytes:
+    return json.dumps(change.record, separators=(",", ":")).encode()
+
+
+def parse(message: bytes) -> list:
+    """Split SSE messages into (id, event, data) tuples."""
+    result = []
+    for block in message.decode().strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        result.append((fields["id"], fields["event"], json.loads(fields["data"])))
+    return result
+
+
+class TestEventIds:
+    """Tests for event ids naming the epoch and change number."""
+
+    def test_round_trip(self):
+        """Test that an id from this epoch gives back its change number."""
+        assert parse_event_id(event_id(EPOCH, 42), EPOCH) == 42
+
+    def test_foreign_or_malformed_ids(self):
+        """Test that ids from another run, or garbage, are not trusted."""
+        assert parse_event_id(None, EPOCH) is None
+        assert parse_event_id(event_id("other", 42), EPOCH) is None
+        assert parse_event_id(f"{EPOCH}-x", EPOCH) is None
+        assert parse_event_id("42", EPOCH) is None
+
+
+@pytest.mark.anyio
+class TestIterEvents:
+    """Tests for the messages streamed from a change log."""
+
+    @pytest.fixture
+    def anyio_backend(self):
+        return "asyncio"
+
+    async def test_new_stream_starts_with_reset(self):
+        """Test that a stream without Last-Event-ID tells the client to load everything first."""
+        log = ChangeLog()
+        log.append("create", "products", 1, {"id": 1})
+        stream = iter_events(log, EPOCH, "products", None, encode)
+        assert parse(await anext(stream)) == [(event_id(EPOCH, 1), "reset", {})]
+        await stream.aclose()
+
+    async def test_resumes_after_last_event_id(self):
+        """Test that a resumed stream replays only later changes to its own table."""
+        log = ChangeLog()
+        log.append("create", "products", 1, {"id": 1})
+        log.append("create", "users", 1, {"id": 1})
+        log.append("update", "products", 1, {"id": 1, "name": "New"})
+        log.append("delete", "products", 1)
+        stream = iter_events(log, EPOCH, "products", 1, encode)
+        assert parse(await anext(stream)) == [
+            (event_id(EPOCH, 3), "update", {"id": 1, "name": "New"}),
+            (event_id(EPOCH, 4), "delete", {"id": 1}),
+        ]
+        await stream.aclose()
+
+    async def test_reset_when_changes_dropped_or_cleared(self):
+        """Test that resuming from a dropped change, or a clear, sends reset events."""
+        log = ChangeLog(capacity=1)
+        log.append("create", "products", 1, {"id": 1})
+        log.append("reset")
+        stream = iter_events(log, EPOCH, "products", 0, encode)
+        assert parse(await anext(stream)) == [(event_id(EPOCH, 2), "reset", {})]
+        await stream.aclose()
+
+        stream = iter_events(log, EPOCH, "products", 1, encode)
+        assert parse(await anext(stream)) == [(event_id(EPOCH, 2), "reset", {})]
+        await stream.aclose()
+
+    async def test_idle_streams_wake_on_write_from_another_thread(self):
+        """Test that many idle streams share one listener and all get a change written elsewhere."""
+        log = ChangeLog()
+        streams = [iter_events(log, EPOCH, "products", 0, encode) for _ in range(100)]
+        reads = [asyncio.ensure_future(anext(stream)) for stream in streams]
+        await asyncio.sleep(0.01)
+        assert not any(read.done() for read in reads)
+        assert len(log._listeners) == 1
+
+        threading.Thread(target=log.append, args=("create", "products", 7, {"id": 7})).start()
+        messages = await asyncio.wait_for(asyncio.gather(*reads), 5)
+        assert all(parse(message) == [(event_id(EPOCH, 1), "create", {"id": 7})] for message in messages)
+        assert log._listeners == ()
+        for stream in streams:
+            await stream.aclose()
+
+    async def test_keepalive_while_idle(self, monkeypatch):
+        """Test that an idle stream sends a comment now and then."""
+        monkeypatch.setattr(events, "KEEPALIVE_INTERVAL", 0.01)
+        stream = iter_events(ChangeLog(), EPOCH, "products", 0, encode)
+        assert await asyncio.wait_for(anext(stream), 5) == events.KEEPALIVE
+        await stream.aclose()
+
+    async def test_notifier_wait_sees_missed_change(self):
+        """Test that a change made before waiting returns at once."""
+        log = ChangeLog()
+        notifier = ChangeNotifier(log, asyncio.get_running_loop())
+        log.append("reset")
+        assert await notifier.wait(0, timeout=5)
+        assert not await notifier.wait(1, timeout=0.01)
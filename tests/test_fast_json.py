@@ -0,0 +1,37 @@
+"""Tests for the fast JSON encoding path."""
+from datetime import datetime
+
+import pytest
+
+import fast_json
+from models import BulkItemResult, BulkResult, Product, User
+
+
+class TestFastJson:
+    """Tests for fast_json.dumps."""
+
+    @pytest.mark.parametrize("model", [
+        Product(
+            id=1, name='Ünïcode "quoted"', description="line\nbreak", price=99.99, category="C",
+            tags=["a", "b"], created_at=datetime(2024, 1, 2, 3, 4, 5, 123456),
+        ),
+        Product(id=2, name="N", description="D", price=10, category="C", created_at=datetime(2024, 1, 2)),
+        User(id=1, name="U", email="u@example.com", password="secret", created_at=datetime(2024, 1, 2)),
+        BulkResult(results=[BulkItemResult(op="create", id=1, status=200), BulkItemResult(status=422, detail="x")]),
+    ])
+    def test_matches_pydantic(self, model):
+        """Test that models encode exactly as model_dump_json does."""
+        assert fast_json.dumps(model) == model.model_dump_json().encode()
+        assert fast_json.dumps([model, model]) == b"[" + b",".join([model.model_dump_json().encode()] * 2) + b"]"
+
+    def test_exclude(self):
+        """Test that excluded fields are left out of models and list items."""
+        user = User(id=1, name="U", email="u@example.com", password="secret", created_at=datetime(2024, 1, 2))
+        expected = user.model_dump_json(exclude={"password"}).encode()
+        assert fast_json.dumps(user, {"password"}) == expected
+        assert fast_json.dumps([user], {"password"}) == b"[" + expected + b"]"
+
+    def test_rejects_unknown_types(self):
+        """Test that values orjson cannot encode still raise TypeError."""
+        with pytest.raises(TypeError):
+            fast_json.dumps({"value": object.__new__(type("Opaque", (), {"__slots__": ()}))})
@@ -0,0 +1,60 @@
+"""Tests for the MessagePack encoding path."""
+from datetime import datetime
+
+import orjson
+import pytest
+
+import fast_json
+import fast_msgpack
+from fast_msgpack import JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE
+from models import Product, User
+
+
+class TestFastMsgpack:
+    """Tests for fast_msgpack.dumps, loads and array_header."""
+
+    def test_decodes_like_json(self):
+        """Test that models decode to the same values from MessagePack as from JSON."""
+        product = Product(
+            id=1, name="Ünïcode", description="D", price=9.5, category="C", tags=["a"],
+            created_at=datetime(2024, 1, 2, 3, 4, 5, 123456),
+        )
+        user = User(id=1, name="U", email="u@example.com", password="secret", created_at=datetime(2024, 1, 2))
+        for content, exclude in ((product, frozenset()), ([product, product], frozenset()), (user, {"password"})):
+            assert fast_msgpack.loads(fast_msgpack.dumps(content, exclude)) == orjson.loads(
+                fast_json.dumps(content, exclude)
+            )
+
+    @pytest.mark.parametrize("length", [0, 15, 16, 2 ** 16 - 1, 2 ** 16])
+    def test_array_header(self, length):
+        """Test that a header followed by encoded items decodes as the array of them."""
+        body = fast_msgpack.array_header(length) + fast_msgpack.dumps(1) * length
+        assert fast_msgpack.loads(body) == [1] * length
+
+    def test_loads_rejects_invalid_bodies(self):
+        """Test that truncated or non-MessagePack bodies raise ValueError."""
+        with pytest.raises(ValueError):
+            fast_msgpack.loads(fast_msgpack.dumps({"name": "x"})[:-1])
+
+
+class TestPreferredMediaType:
+    """Tests for Accept header negotiation."""
+
+    @pytest.mark.parametrize("accept,expected", [
+        (None, JSON_MEDIA_TYPE),
+        ("*/*", JSON_MEDIA_TYPE),
+        ("application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/x-msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/json, application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/msgpack;q=0.5, application/json", JSON_MEDIA_TYPE),
+        ("application/msgpack, */*;q=0.1", MSGPACK_MEDIA_TYPE),
+        ("application/msgpack;q=0", JSON_MEDIA_TYPE),
+    ])
+    def test_preferred_media_type(self, accept, expected):
+        """Test that MessagePack is chosen only when rated at least as high as JSON."""
+        assert fast_msgpack.preferred_media_type(accept) == expected
+
+    def test_json_only_without_ormsgpack(self, monkeypatch):
+        """Test that without ormsgpack every client gets JSON."""
+        monkeypatch.setattr(fast_msgpack, "ormsgpack", None)
+        assert fast_msgpack.preferred_media_type("application/msgpack") == JSON_MEDIA_TYPE
@@ -0,0 +1,122 @@
+"""Tests for index structures."""
+import random
+
+import pytest
+
+from indexes import HashIndex, SortedIndex
+
+
+class TestSortedIndex:
+    """Tests for SortedIndex."""
+
+    @pytest.fixture
+    def index(self, monkeypatch):
+        """Create an index with small buckets so splits are exercised."""
+        monkeypatch.setattr(SortedIndex, "_LOAD", 4)
+        return SortedIndex()
+
+    def test_add_keeps_keys_sorted(self, index):
+        """Test that keys iterate in sorted order regardless of insert order."""
+        keys = list(range(100))
+        random.Random(1).shuffle(keys)
+        for key in keys:
+            index.add(key)
+        assert list(index) == list(range(100))
+        assert len(index) == 100
+
+    def test_add_duplicate_is_noop(self, index):
+        """Test that adding an existing key does not duplicate it."""
+        index.add(5)
+        index.add(5)
+        assert list(index) == [5]
+        assert len(index) == 1
+
+    def test_discard(self, index):
+        """Test removing present and missing keys."""
+        index.update(range(20))
+        assert index.discard(7) is True
+        assert index.discard(7) is False
+        assert index.discard(100) is False
+        assert 7 not in index
+        assert 8 in index
+        assert len(index) == 19
+
+    def test_discard_all(self, index):
+        """Test that emptying every bucket leaves a usable index."""
+        index.update(range(20))
+        for key in range(20):
+            index.discard(key)
+        assert list(index) == []
+        index.add(3)
+        assert list(index) == [3]
+
+    def test_update_merges_with_existing(self, index):
+        """Test bulk insertion into a populated index."""
+        index.update([1, 3, 5])
+        index.update([2, 3, 4])
+        assert list(index) == [1, 2, 3, 4, 5]
+
+    def test_update_sorted_keys_into_empty_index(self, index):
+        """Test that presorted bulk loads and unsorted ones with duplicates agree."""
+        index.update(range(0, 5000, 2))
+        assert list(index) == list(range(0, 5000, 2))
+        other = type(index)()
+        other.update([3, 1, 3, 2])
+        assert list(other) == [1, 2, 3]
+
+    def test_irange_forward(self, index):
+        """Test forward range scans with open and closed bounds."""
+        index.update(range(0, 50, 2))
+        assert list(index.irange(10, 20)) == [10, 12, 14, 16, 18, 20]
+        assert list(index.irange(10, 20, inclusive=(False, False))) == [12, 14, 16, 18]
+        assert list(index.irange(11, 15)) == [12, 14]
+        assert list(index.irange(maximum=4)) == [0, 2, 4]
+        assert list(index.irange(minimum=44)) == [44, 46, 48]
+        assert list(index.irange(100)) == []
+
+    def test_irange_reverse(self, index):
+        """Test reverse range scans with open and closed bounds."""
+        index.update(range(0, 50, 2))
+        assert list(index.irange(10, 20, reverse=True)) == [20, 18, 16, 14, 12, 10]
+        assert list(index.irange(10, 20, inclusive=(False, False), reverse=True)) == [18, 16, 14, 12]
+        assert list(index.irange(maximum=5, reverse=True)) == [4, 2, 0]
+        assert list(index.irange(minimum=45, reverse=True)) == [48, 46]
+        assert list(index.irange(maximum=-1, reverse=True)) == []
+
+    def test_tuple_keys(self, index):
+        """Test that composite keys order by each component."""
+        index.update([(2.0, 1), (1.0, 2), (2.0, 0)])
+        assert list(index) == [(1.0, 2), (2.0, 0), (2.0, 1)]
+
+
+class TestHashIndex:
+    """Tests for HashIndex."""
+
+    def test_add_and_get(self):
+        """Test that ids are grouped by value."""
+        index = HashIndex()
+        index.add("a", 1)
+        index.add("a", 2)
+        index.add("b", 3)
+        assert index.get("a") == {1, 2}
+        assert index.get("b") == {3}
+        assert index.get("missing") == set()
+
+    def test_update_adds_many_ids(self):
+        """Test that bulk adds merge with existing ids for a value."""
+        index = HashIndex()
+        index.add("a", 1)
+        index.update("a", {2, 3})
+        index.update("b", {4})
+        assert index.get("a") == {1, 2, 3}
+        assert index.get("b") == {4}
+
+    def test_discard_drops_empty_values(self):
+        """Test that the last discard for a value removes the value."""
+        index = HashIndex()
+        index.add("a", 1)
+        index.discard("a", 1)
+        index.discard("a", 1)
+        index.discard("missing", 1)
+        assert index.get("a") == set()
+        assert len(index) == 0
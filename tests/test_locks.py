@@ -0,0 +1,166 @@
+"""Tests for the reader-writer lock and concurrent database use."""
+import threading
+import time
+
+from database import InMemoryDatabase
+import pytest
+
+from locks import RWLock, WouldBlock, hold, non_blocking
+from models import ProductCreate, ProductUpdate, UserCreate
+
+
+def run_threads(target, count: int, *args):
+    """Run ``target(i, *args)`` on ``count`` threads, re-raising the first error."""
+    errors = []
+
+    def run(i):
+        try:
+            target(i, *args)
+        except Exception as exc:  # pragma: no cover - only reached on failure
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+class TestRWLock:
+    """Tests for RWLock."""
+
+    def test_readers_share_the_lock(self):
+        """Test that a second reader gets in while the first holds the lock."""
+        lock = RWLock()
+        inside = threading.Barrier(2, timeout=5)
+
+        def reader(i):
+            with lock.read:
+                inside.wait()
+
+        run_threads(reader, 2)
+
+    def test_writer_excludes_readers(self):
+        """Test that a reader waits until the writer releases the lock."""
+        lock = RWLock()
+        events = []
+        lock.acquire_write()
+        reader = threading.Thread(target=lambda: (lock.acquire_read(), events.append("read"), lock.release_read()))
+        reader.start()
+        time.sleep(0.05)
+        events.append("write done")
+        lock.release_write()
+        reader.join()
+        assert events == ["write done", "read"]
+
+    def test_waiting_writer_blocks_new_readers(self):
+        """Test that readers arriving after a waiting writer go after it."""
+        lock = RWLock()
+        events = []
+        lock.acquire_read()
+        writer = threading.Thread(target=lambda: (lock.acquire_write(), events.append("write"), lock.release_write()))
+        writer.start()
+        while not lock._writers_waiting:
+            time.sleep(0.001)
+        reader = threading.Thread(target=lambda: (lock.acquire_read(), events.append("read"), lock.release_read()))
+        reader.start()
+        time.sleep(0.05)
+        assert events == []
+        lock.release_read()
+        writer.join()
+        reader.join()
+        assert events == ["write", "read"]
+
+    def test_non_blocking_raises_instead_of_waiting(self):
+        """Test that inside non_blocking() a taken lock raises WouldBlock and leaves no trace."""
+        lock, plain = RWLock(), threading.Lock()
+        lock.acquire_read()
+        plain.acquire()
+        with non_blocking():
+            with lock.read:
+                pass
+            with pytest.raises(WouldBlock):
+                lock.acquire_write()
+            with pytest.raises(WouldBlock):
+                with hold(plain):
+                    pass
+        assert lock._writers_waiting == 0
+        lock.release_read()
+        plain.release()
+        with non_blocking():
+            with lock.write:
+                with pytest.raises(WouldBlock):
+                    lock.acquire_read()
+            with hold(plain):
+                pass
+
+
+class TestConcurrentDatabase:
+    """Stress tests for InMemoryDatabase shared between threads."""
+
+    def test_concurrent_creates_allocate_unique_ids(self):
+        """Test that products and users created from many threads get distinct ids."""
+        db = InMemoryDatabase()
+        db.clear()
+        product_ids, user_ids = [], []
+
+        def create(i):
+            for n in range(200):
+                product_ids.append(db.create_product(ProductCreate(
+                    name=f"P{i}-{n}", description="D", price=1.0, category="Cat", tags=["t"]
+                )).id)
+                user_ids.append(db.create_user(UserCreate(
+                    name=f"u{i}-{n}", email=f"u{i}-{n}@example.com", password="secret123"
+                )).id)
+
+        run_threads(create, 8)
+        assert sorted(product_ids) == list(range(1, 1601))
+        assert sorted(user_ids) == list(range(1, 1601))
+        assert len(db.products) == len(db.users) == 1600
+        assert len(db.query_products(category="Cat")[0]) == 1600
+
+    def test_concurrent_updates_are_not_lost(self):
+        """Test that threads updating different fields of a product all land."""
+        db = InMemoryDatabase()
+        ids = [product.id for product in db.get_all_products()]
+
+        def update(i):
+            for n in range(300):
+                product_id = ids[n % len(ids)]
+                if i % 2:
+                    db.update_product(product_id, ProductUpdate(price=float(n)))
+                else:
+                    db.update_product(product_id, ProductUpdate(name=f"writer {i} pass {n}"))
+
+        run_threads(update, 4)
+        for product_id in ids:
+            product = db.get_product(product_id)
+            assert product.name.startswith("writer ")
+            assert product.price >= 297.0
+
+    def test_reads_during_writes(self):
+        """Test that filtered queries and scans stay consistent while writers run."""
+        db = InMemoryDatabase()
+        db.clear()
+        done = threading.Event()
+
+        def work(i):
+            if i == 0:
+                for n in range(500):
+                    product = db.create_product(ProductCreate(
+                        name=f"P{n}", description="D", price=float(n), category="Cat", tags=["a", "b"]
+                    ))
+                    if n % 3 == 0:
+                        db.delete_product(product.id)
+                done.set()
+                return
+            while not done.is_set():
+                tagged, _ = db.query_products(tags=["a"], sort="price")
+                assert all("a" in product.tags for product in tagged)
+                assert [product.price for product in tagged] == sorted(product.price for product in tagged)
+                db.get_all_products()
+
+        run_threads(work, 4)
+        assert len(db.query_products(tags=["a", "b"])[0]) == len(db.products) == 333
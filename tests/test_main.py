@@ -1,7 +1,16 @@
 """Tests for main FastAPI application endpoints."""
+import csv
+import io
+import json
+
 import pytest
+import zstandard
 from fastapi import status
 
+import fast_msgpack
+from models import ProductCreate
+from passwords import PasswordHasher
+
 
 class TestRootEndpoint:
     """Tests for root endpoint."""
@@ -123,6 +132,17 @@ class TestProductEndpoints:
         assert data["in_stock"] is False
         assert data["name"] == sample_product_data["name"]
 
+    def test_update_rejects_nulls(self, client, sample_product_data):
+        """Test that explicit nulls are rejected and leave the product, its indexes and version alone."""
+        product = client.post("/products", json=sample_product_data).json()
+        etag = client.get(f"/products/{product['id']}").headers["etag"]
+        for field in ("price", "tags", "name"):
+            response = client.put(f"/products/{product['id']}", json={field: None})
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert client.get(f"/products/{product['id']}").json() == product
+        assert client.get(f"/products/{product['id']}").headers["etag"] == etag
+        assert client.get("/products", params={"min_price": 99}).json() == [product]
+
     def test_update_product_not_found(self, client):
         """Test updating a product that doesn't exist."""
         update_data = {"name": "Updated"}
@@ -170,6 +190,586 @@ class TestProductEndpoints:
         assert data["tags"] == ["new", "updated", "tags"]
 
 
+class TestPagination:
+    """Tests for keyset pagination on list endpoints."""
+
+    def test_products_pages_follow_cursor(self, client, sample_product_data):
+        """Test iterating products page by page with the next cursor."""
+        for _ in range(5):
+            client.post("/products", json=sample_product_data)
+
+        seen = []
+        response = client.get("/products", params={"limit": 2})
+        while True:
+            assert response.status_code == status.HTTP_200_OK
+            seen.extend(p["id"] for p in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            response = client.get("/products", params={"limit": 2, "cursor": cursor})
+
+        assert seen == [1, 2, 3, 4, 5]
+
+    def test_products_without_limit_returns_everything(self, client, sample_product_data):
+        """Test that omitting limit keeps the unpaginated response."""
+        for _ in range(3):
+            client.post("/products", json=sample_product_data)
+
+        response = client.get("/products")
+        assert len(response.json()) == 3
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/products", params={"cursor": "not-a-cursor!"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == "Invalid cursor"
+
+    def test_limit_bounds(self, client):
+        """Test that out-of-range page sizes are rejected."""
+        assert client.get("/products", params={"limit": 0}).status_code == 422
+        assert client.get("/products", params={"limit": 100000}).status_code == 422
+
+    def test_users_pagination(self, client, sample_user_data):
+        """Test paginating users."""
+        for i in range(3):
+            user = sample_user_data.copy()
+            user["email"] = f"user{i}@example.com"
+            client.post("/users", json=user)
+
+        response = client.get("/users", params={"limit": 2})
+        assert [u["id"] for u in response.json()] == [1, 2]
+        cursor = response.headers["X-Next-Cursor"]
+
+        response = client.get("/users", params={"limit": 2, "cursor": cursor})
+        assert [u["id"] for u in response.json()] == [3]
+        assert "X-Next-Cursor" not in response.headers
+
+
+class TestProductFilters:
+    """Tests for filtering the product listing."""
+
+    def test_filter_products(self, client, sample_product_data):
+        """Test filtering by category, stock status and tags."""
+        client.post("/products", json=sample_product_data)
+        other = {**sample_product_data, "name": "Other", "category": "Other", "tags": ["test"], "in_stock": False}
+        client.post("/products", json=other)
+
+        response = client.get("/products", params={"category": "Other"})
+        assert [p["name"] for p in response.json()] == ["Other"]
+
+        response = client.get("/products", params={"in_stock": "true"})
+        assert [p["name"] for p in response.json()] == ["Test Product"]
+
+        response = client.get("/products", params=[("tag", "test"), ("tag", "sample")])
+        assert [p["name"] for p in response.json()] == ["Test Product"]
+
+        response = client.get("/products", params={"tag": "test", "limit": 1})
+        assert [p["name"] for p in response.json()] == ["Test Product"]
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/products", params={"tag": "test", "limit": 1, "cursor": cursor})
+        assert [p["name"] for p in response.json()] == ["Other"]
+
+
+class TestProductSorting:
+    """Tests for price ranges and sorting on the product listing."""
+
+    def test_price_range_cheapest_first(self, client, sample_product_data):
+        """Test a price range sorted by ascending price across pages."""
+        for price in (30.0, 10.0, 50.0, 20.0):
+            client.post("/products", json={**sample_product_data, "price": price})
+
+        params = {"min_price": 15, "max_price": 40, "sort": "price", "limit": 1}
+        response = client.get("/products", params=params)
+        assert [p["price"] for p in response.json()] == [20.0]
+
+        params["cursor"] = response.headers["X-Next-Cursor"]
+        response = client.get("/products", params=params)
+        assert [p["price"] for p in response.json()] == [30.0]
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_sort_descending_price(self, client, sample_product_data):
+        """Test sorting by descending price."""
+        for price in (30.0, 10.0, 50.0):
+            client.post("/products", json={**sample_product_data, "price": price})
+
+        response = client.get("/products", params={"sort": "-price"})
+        assert [p["price"] for p in response.json()] == [50.0, 30.0, 10.0]
+
+    def test_unknown_sort_rejected(self, client):
+        """Test that unsupported sort fields are rejected."""
+        response = client.get("/products", params={"sort": "name"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_cursor_from_other_sort_rejected(self, client, sample_product_data):
+        """Test that an id cursor cannot resume a price-sorted listing."""
+        for _ in range(2):
+            client.post("/products", json=sample_product_data)
+        cursor = client.get("/products", params={"limit": 1}).headers["X-Next-Cursor"]
+
+        response = client.get("/products", params={"sort": "price", "cursor": cursor})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestProductSearch:
+    """Tests for the product search endpoint."""
+
+    def test_search_products(self, client, sample_product_data):
+        """Test ranked search results."""
+        client.post("/products", json={**sample_product_data, "name": "Coffee Maker"})
+        client.post("/products", json={**sample_product_data, "name": "Tea Kettle"})
+
+        response = client.get("/products/search", params={"q": "coffee"})
+        assert response.status_code == status.HTTP_200_OK
+        assert [p["name"] for p in response.json()] == ["Coffee Maker"]
+
+    def test_search_limit(self, client, sample_product_data):
+        """Test that limit caps the number of results."""
+        for _ in range(3):
+            client.post("/products", json=sample_product_data)
+
+        response = client.get("/products/search", params={"q": "test", "limit": 2})
+        assert len(response.json()) == 2
+
+    def test_search_requires_query(self, client):
+        """Test that an empty query is rejected."""
+        assert client.get("/products/search").status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert client.get("/products/search", params={"q": ""}).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class TestExport:
+    """Tests for the streaming export endpoints."""
+
+    def test_export_products_ndjson(self, client, sample_product_data):
+        """Test exporting products as newline-delimited JSON."""
+        client.post("/products", json=sample_product_data)
+        client.post("/products", json={**sample_product_data, "name": "Second"})
+
+        response = client.get("/products/export")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["name"] for row in rows] == ["Test Product", "Second"]
+        assert rows[0]["tags"] == sample_product_data["tags"]
+
+    def test_export_products_csv(self, client, sample_product_data):
+        """Test exporting products as CSV."""
+        client.post("/products", json=sample_product_data)
+
+        response = client.get("/products/export", params={"format": "csv"})
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="products.csv"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert rows[0]["name"] == "Test Product"
+        assert rows[0]["tags"] == "test|sample"
+        assert rows[0]["in_stock"] == "True"
+
+    def test_export_empty_csv_has_header(self, client):
+        """Test that an empty CSV export still has a header row."""
+        response = client.get("/products/export", params={"format": "csv"})
+        assert response.text.splitlines() == ["id,name,description,price,category,tags,in_stock,created_at"]
+
+    def test_export_many_products_spans_chunks(self, client, test_db):
+        """Test exports larger than one encoding batch."""
+        for i in range(1200):
+            test_db.create_product(ProductCreate(name=f"P{i}", description="D", price=1.0, category="C"))
+
+        response = client.get("/products/export")
+        assert len(response.text.splitlines()) == 1200
+
+    def test_export_users_excludes_password(self, client, sample_user_data):
+        """Test that user exports never contain passwords."""
+        client.post("/users", json=sample_user_data)
+
+        rows = [json.loads(line) for line in client.get("/users/export").text.splitlines()]
+        assert rows[0]["email"] == sample_user_data["email"]
+        assert "password" not in rows[0]
+
+        response = client.get("/users/export", params={"format": "csv"})
+        assert "password" not in response.text.splitlines()[0]
+        assert sample_user_data["password"] not in response.text
+
+    def test_export_rejects_unknown_format(self, client):
+        """Test that unsupported formats are rejected."""
+        response = client.get("/products/export", params={"format": "xml"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class TestBulkEndpoints:
+    """Tests for bulk product writes."""
+
+    def test_bulk_json(self, client, sample_product_data):
+        """Test a JSON bulk request with creates, updates and deletes."""
+        client.post("/products", json=sample_product_data)
+
+        response = client.post("/products/bulk", json={
+            "creates": [{**sample_product_data, "name": "New"}],
+            "updates": [{"id": 1, "price": 5.0}, {"id": 42, "price": 1.0}],
+            "deletes": [2, 99],
+        })
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(r["op"], r["id"], r["status"]) for r in response.json()["results"]] == [
+            ("create", 2, 200),
+            ("update", 1, 200),
+            ("update", 42, 404),
+            ("delete", 2, 200),
+            ("delete", 99, 404),
+        ]
+        products = client.get("/products").json()
+        assert [(p["id"], p["price"]) for p in products] == [(1, 5.0)]
+
+    def test_bulk_json_validation(self, client):
+        """Test that a malformed JSON bulk request is rejected as a whole."""
+        response = client.post("/products/bulk", json={"creates": [{"name": "Incomplete"}]})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_bulk_stream(self, client, sample_product_data):
+        """Test an NDJSON bulk request spanning several database batches."""
+        lines = [json.dumps({"op": "create", "data": sample_product_data}) for _ in range(1500)]
+        lines.append(json.dumps({"op": "update", "id": 1500, "data": {"name": "Last"}}))
+        lines.append(json.dumps({"op": "delete", "id": 1}))
+
+        def body():
+            payload = "\n".join(lines).encode()
+            for start in range(0, len(payload), 4096):
+                yield payload[start:start + 4096]
+
+        response = client.post(
+            "/products/bulk/stream", content=body(), headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()["results"]
+        assert len(results) == 1502
+        assert all(r["status"] == 200 for r in results)
+        assert client.get("/products/1500").json()["name"] == "Last"
+        assert client.get("/products/1").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_bulk_stream_reports_bad_lines(self, client, sample_product_data):
+        """Test that invalid lines fail individually and keep their position."""
+        lines = [
+            json.dumps({"op": "create", "data": sample_product_data}),
+            "not json",
+            json.dumps({"op": "rename", "id": 1}),
+            json.dumps({"op": "delete", "id": 1}),
+        ]
+        response = client.post(
+            "/products/bulk/stream", content="\n".join(lines), headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        results = response.json()["results"]
+        assert [r["status"] for r in results] == [200, 422, 422, 200]
+        assert results[1]["op"] is None
+        assert results[1]["detail"].startswith("line 2:")
+
+
+class TestConditionalRequests:
+    """Tests for ETags and If-None-Match."""
+
+    def test_unchanged_product_answers_304(self, client, sample_product_data):
+        """Test that a repeated GET with the ETag gets an empty 304."""
+        product_id = client.post("/products", json=sample_product_data).json()["id"]
+        first = client.get(f"/products/{product_id}")
+        etag = first.headers["etag"]
+
+        response = client.get(f"/products/{product_id}", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    def test_write_changes_record_and_collection_etags(self, client, sample_product_data):
+        """Test that an update invalidates the product and the listing, but not other products."""
+        first_id = client.post("/products", json=sample_product_data).json()["id"]
+        second_id = client.post("/products", json=sample_product_data).json()["id"]
+        listing = client.get("/products").headers["etag"]
+        first = client.get(f"/products/{first_id}").headers["etag"]
+        second = client.get(f"/products/{second_id}").headers["etag"]
+
+        client.put(f"/products/{first_id}", json={"price": 1.0})
+
+        response = client.get(f"/products/{first_id}", headers={"If-None-Match": first})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["price"] == 1.0
+        assert response.headers["etag"] != first
+        assert client.get(f"/products/{second_id}", headers={"If-None-Match": second}).status_code == 304
+        response = client.get("/products", headers={"If-None-Match": listing})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != listing
+
+    def test_users_collection_independent_of_products(self, client, sample_product_data, sample_user_data):
+        """Test that product writes leave the users ETag alone."""
+        user_id = client.post("/users", json=sample_user_data).json()["id"]
+        listing = client.get("/users").headers["etag"]
+        user = client.get(f"/users/{user_id}").headers["etag"]
+
+        client.post("/products", json=sample_product_data)
+
+        assert client.get("/users", headers={"If-None-Match": listing}).status_code == 304
+        assert client.get(f"/users/{user_id}", headers={"If-None-Match": f'W/{user}, "other"'}).status_code == 304
+
+    def test_missing_record_has_no_etag(self, client):
+        """Test that a 404 carries no ETag."""
+        response = client.get("/products/999", headers={"If-None-Match": "*"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert "etag" not in response.headers
+
+
+class TestResponseCache:
+    """Tests for cached GET responses."""
+
+    def test_repeated_get_is_a_cache_hit(self, client, sample_product_data):
+        """Test that a second identical GET is served from the cache, headers included."""
+        client.post("/products", json=sample_product_data)
+        client.post("/products", json=sample_product_data)
+        hits = client.get("/metrics").json()["response_cache"]["hits"]
+
+        first = client.get("/products", params={"limit": 1})
+        second = client.get("/products", params={"limit": 1})
+        assert second.content == first.content
+        assert second.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+        assert second.headers["etag"] == first.headers["etag"]
+        assert client.get("/metrics").json()["response_cache"]["hits"] == hits + 1
+
+    def test_writes_invalidate_cached_responses(self, client, sample_product_data):
+        """Test that list and detail responses reflect an update, create and delete."""
+        product_id = client.post("/products", json=sample_product_data).json()["id"]
+        client.get("/products")
+        client.get(f"/products/{product_id}")
+
+        client.put(f"/products/{product_id}", json={"name": "Renamed"})
+        assert client.get(f"/products/{product_id}").json()["name"] == "Renamed"
+        assert [p["name"] for p in client.get("/products").json()] == ["Renamed"]
+
+        client.post("/products", json=sample_product_data)
+        client.delete(f"/products/{product_id}")
+        assert [p["name"] for p in client.get("/products").json()] == [sample_product_data["name"]]
+        assert client.get(f"/products/{product_id}").status_code == status.HTTP_404_NOT_FOUND
+
+
+MSGPACK = {"Accept": fast_msgpack.MSGPACK_MEDIA_TYPE}
+
+
+class TestMsgpack:
+    """Tests for MessagePack requests and responses."""
+
+    def test_reads_negotiate_msgpack(self, client, sample_product_data):
+        """Test that listings and records come as MessagePack when Accept prefers it, and as JSON otherwise."""
+        for _ in range(3):
+            client.post("/products", json=sample_product_data)
+        for path, params in (("/products", {}), ("/products/2", {}), ("/products", {"fields": "id,name"})):
+            response = client.get(path, params=params, headers=MSGPACK)
+            assert response.headers["content-type"] == fast_msgpack.MSGPACK_MEDIA_TYPE
+            assert fast_msgpack.loads(response.content) == client.get(path, params=params).json()
+        assert client.get("/products").headers["content-type"] == "application/json"
+
+    def test_representations_have_own_etags(self, client, sample_product_data):
+        """Test that JSON and MessagePack bodies are cached and revalidated apart."""
+        client.post("/products", json=sample_product_data)
+        as_json = client.get("/products/1")
+        as_msgpack = client.get("/products/1", headers=MSGPACK)
+        assert as_json.headers["etag"] != as_msgpack.headers["etag"]
+        assert "Accept" in as_msgpack.headers["vary"]
+        assert client.get("/products/1", headers=MSGPACK).content == as_msgpack.content
+        revalidated = client.get("/products/1", headers={**MSGPACK, "If-None-Match": as_msgpack.headers["etag"]})
+        assert revalidated.status_code == status.HTTP_304_NOT_MODIFIED
+        assert client.get("/products/1", headers={"If-None-Match": as_msgpack.headers["etag"]}).status_code == 200
+
+    def test_msgpack_request_bodies(self, client, sample_product_data, sample_user_data):
+        """Test that POST and PUT accept MessagePack bodies and other responses are transcoded."""
+        headers = {**MSGPACK, "Content-Type": fast_msgpack.MSGPACK_MEDIA_TYPE}
+        response = client.post("/products", content=fast_msgpack.dumps(sample_product_data), headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        created = fast_msgpack.loads(response.content)
+        assert created["name"] == sample_product_data["name"]
+
+        response = client.put(
+            f"/products/{created['id']}", content=fast_msgpack.dumps({"price": 5.0}), headers=headers
+        )
+        assert fast_msgpack.loads(response.content)["price"] == 5.0
+        user = fast_msgpack.loads(
+            client.post("/users", content=fast_msgpack.dumps(sample_user_data), headers=headers).content
+        )
+        assert "password" not in user
+
+        response = client.put("/products/999", content=fast_msgpack.dumps({"price": 5.0}), headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert fast_msgpack.loads(response.content) == {"detail": "Product not found"}
+
+    def test_invalid_msgpack_bodies(self, client):
+        """Test that malformed bodies get 400 and well-formed invalid ones 422."""
+        headers = {**MSGPACK, "Content-Type": fast_msgpack.MSGPACK_MEDIA_TYPE}
+        response = client.post("/products", content=b"\xc1", headers=headers)
+        assert response.status_code == 400
+        assert fast_msgpack.loads(response.content) == {"detail": "Invalid MessagePack body"}
+        binary = fast_msgpack.dumps({"name": b"bytes"})
+        assert client.post("/products", content=binary, headers=headers).status_code == 400
+        assert client.post("/products", content=fast_msgpack.dumps({"name": "x"}), headers=headers).status_code == 422
+
+    def test_msgpack_unsupported_without_ormsgpack(self, client, monkeypatch, sample_product_data):
+        """Test that MessagePack bodies get 415 and Accept falls back to JSON without ormsgpack."""
+        monkeypatch.setattr(fast_msgpack, "ormsgpack", None)
+        headers = {**MSGPACK, "Content-Type": fast_msgpack.MSGPACK_MEDIA_TYPE}
+        assert client.post("/products", content=b"\x80", headers=headers).status_code == 415
+        assert client.get("/products", headers=MSGPACK).headers["content-type"] == "application/json"
+
+
+class TestCompression:
+    """Tests for compressed responses."""
+
+    def test_large_listing_compressed_and_cached(self, client, test_db, sample_product_data):
+        """Test that a large listing is compressed with the preferred encoding, once per version."""
+        for _ in range(20):
+            test_db.create_product(ProductCreate(**sample_product_data))
+        uncompressed = client.get("/products", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in uncompressed.headers
+
+        response = client.get("/products", headers={"Accept-Encoding": "gzip, zstd"})
+        assert response.headers["content-encoding"] == "zstd"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.headers["etag"] != uncompressed.headers["etag"]
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(response.content)
+        assert body == uncompressed.content
+        hits = client.get("/metrics").json()["response_cache"]["hits"]
+        assert client.get("/products", headers={"Accept-Encoding": "zstd"}).content == response.content
+        assert client.get("/metrics").json()["response_cache"]["hits"] == hits + 1
+
+        response = client.get("/products", headers={"Accept-Encoding": "gzip", **MSGPACK})
+        assert response.headers["content-encoding"] == "gzip"
+        assert fast_msgpack.loads(response.content) == uncompressed.json()
+
+    def test_small_responses_not_compressed(self, client, sample_product_data):
+        """Test that responses under the threshold go out as they are."""
+        client.post("/products", json=sample_product_data)
+        for path in ("/products/1", "/products/search?q=test", "/health"):
+            assert "content-encoding" not in client.get(path, headers={"Accept-Encoding": "gzip"}).headers
+
+    def test_other_large_responses_compressed(self, client, test_db, sample_product_data):
+        """Test that streamed exports and large responses from other routes are compressed too."""
+        for _ in range(20):
+            test_db.create_product(ProductCreate(**sample_product_data))
+        export = client.get("/products/export", headers={"Accept-Encoding": "gzip"})
+        assert export.headers["content-encoding"] == "gzip"
+        assert "content-length" not in export.headers
+        assert len(export.text.splitlines()) == 20
+        search = client.get("/products/search", params={"q": "test"}, headers={"Accept-Encoding": "gzip"})
+        assert search.headers["content-encoding"] == "gzip"
+        assert len(search.json()) == 20
+
+
+class TestOpenAPI:
+    """Tests that fast responses keep their documented schemas."""
+
+    @pytest.mark.parametrize("path,method,schema", [
+        ("/products", "get", {"type": "array", "items": {"$ref": "#/components/schemas/Product"}}),
+        ("/products", "post", {"$ref": "#/components/schemas/Product"}),
+        ("/products/{product_id}", "put", {"$ref": "#/components/schemas/Product"}),
+        ("/products/search", "get", {"type": "array", "items": {"$ref": "#/components/schemas/Product"}}),
+        ("/products/bulk", "post", {"$ref": "#/components/schemas/BulkResult"}),
+        ("/users/{user_id}", "get", {"$ref": "#/components/schemas/UserPublic"}),
+    ])
+    def test_response_schema(self, client, path, method, schema):
+        """Test that each route documents its response model."""
+        operation = client.get("/openapi.json").json()["paths"][path][method]
+        content = operation["responses"]["200"]["content"]["application/json"]["schema"]
+        assert {key: value for key, value in content.items() if key != "title"} == schema
+
+
+class TestSparseFieldsets:
+    """Tests for ?fields= projection."""
+
+    def test_list_and_detail_projection(self, client, sample_product_data):
+        """Test that products carry only the requested fields, in model order."""
+        created = client.post("/products", json=sample_product_data).json()
+        response = client.get("/products", params={"fields": "price,id"})
+        assert response.status_code == 200
+        assert response.text == f'[{{"id":{created["id"]},"price":99.99}}]'
+        assert client.get(f"/products/{created['id']}", params={"fields": "name"}).json() == {"name": "Test Product"}
+
+    def test_projection_does_not_leak_between_cached_responses(self, client, sample_product_data):
+        """Test that a projected response and the full one are cached apart."""
+        created = client.post("/products", json=sample_product_data).json()
+        assert client.get("/products", params={"fields": "id"}).json() == [{"id": created["id"]}]
+        assert client.get("/products").json() == [created]
+        assert client.get(f"/products/{created['id']}", params={"fields": "id"}).json() == {"id": created["id"]}
+        assert client.get(f"/products/{created['id']}").json() == created
+
+    def test_user_projection_never_reveals_password(self, client, sample_user_data):
+        """Test that users project over public fields, and password cannot be asked for."""
+        user = client.post("/users", json=sample_user_data).json()
+        assert client.get("/users", params={"fields": "email"}).json() == [{"email": sample_user_data["email"]}]
+        assert client.get(f"/users/{user['id']}", params={"fields": "name,id"}).json() == {
+            "id": user["id"], "name": sample_user_data["name"]
+        }
+        assert client.get(f"/users/{user['id']}", params={"fields": "password"}).status_code == 422
+
+    def test_unknown_fields_rejected(self, client):
+        """Test that unknown or malformed field lists are validation errors."""
+        for fields in ("bogus", "id,", "id, name", ""):
+            assert client.get("/products", params={"fields": fields}).status_code == 422
+
+    def test_openapi_lists_fields(self, client):
+        """Test that the fields parameter documents the names it accepts."""
+        parameters = client.get("/openapi.json").json()["paths"]["/users"]["get"]["parameters"]
+        fields = next(p for p in parameters if p["name"] == "fields")
+        assert "created_at" in fields["description"]
+        assert "password" not in fields["description"]
+
+
+class TestChangeFeed:
+    """Tests for the server-sent event change feeds."""
+
+    def test_backend_without_change_log(self, client, test_db, monkeypatch):
+        """Test that feeds and sync answer 501 on a backend keeping no change log, rather than matching /{id}."""
+        monkeypatch.setattr(test_db, "changes", None)
+        for path in ("/products/events", "/users/events", "/products/changes", "/users/changes"):
+            response = client.get(path)
+            assert response.status_code == 501
+
+    def test_openapi_documents_feeds(self, client):
+        """Test that both feeds are routes of their own."""
+        paths = client.get("/openapi.json").json()["paths"]
+        assert "/products/events" in paths
+        assert "/users/events" in paths
+
+    def test_delta_sync(self, client, sample_product_data):
+        """Test syncing from a full resync token to only the changes since."""
+        first = client.post("/products", json=sample_product_data).json()
+        second = client.post("/products", json=sample_product_data).json()
+        start = client.get("/products/changes").json()
+        assert start["resync"] is True
+        assert start["upserts"] == start["deletes"] == []
+
+        client.put(f"/products/{first['id']}", json={"price": 5.0})
+        client.delete(f"/products/{second['id']}")
+        created = client.post("/products", json=sample_product_data).json()
+        delta = client.get("/products/changes", params={"since": start["token"]}).json()
+        assert delta["resync"] is False
+        assert [(p["id"], p["price"]) for p in delta["upserts"]] == [(first["id"], 5.0), (created["id"], 99.99)]
+        assert delta["deletes"] == [second["id"]]
+
+        again = client.get("/products/changes", params={"since": delta["token"]}).json()
+        assert again == {"token": delta["token"], "resync": False, "upserts": [], "deletes": []}
+
+    def test_delta_sync_resync_required(self, client, sample_product_data):
+        """Test that stale, foreign and malformed tokens ask for a full resync."""
+        token = client.get("/products/changes").json()["token"]
+        client.post("/products", json=sample_product_data)
+        client.delete("/products/1")
+        current = client.get("/products/changes", params={"since": token}).json()["token"]
+        for since in ("other-1", "garbage", token.rsplit("-", 1)[0] + "-999"):
+            response = client.get("/products/changes", params={"since": since}).json()
+            assert response == {"token": current, "resync": True, "upserts": [], "deletes": []}
+
+    def test_user_sync_hides_passwords(self, client, sample_user_data):
+        """Test that user deltas carry no password hashes."""
+        token = client.get("/users/changes").json()["token"]
+        client.post("/users", json=sample_user_data)
+        upserts = client.get("/users/changes", params={"since": token}).json()["upserts"]
+        assert [u["email"] for u in upserts] == [sample_user_data["email"]]
+        assert "password" not in upserts[0]
+
+
 class TestUserEndpoints:
     """Tests for user CRUD endpoints."""
 
@@ -187,9 +787,28 @@ class TestUserEndpoints:
         assert data["id"] == 1
         assert data["name"] == sample_user_data["name"]
         assert data["email"] == sample_user_data["email"]
-        assert data["password"] == sample_user_data["password"]
+        assert "password" not in data
         assert "created_at" in data
 
+    def test_create_user_stores_password_hash(self, client, test_db, sample_user_data):
+        """Test that the stored password is a hash of the submitted one."""
+        user_id = client.post("/users", json=sample_user_data).json()["id"]
+        stored = test_db.get_user(user_id).password
+        assert stored.startswith("scrypt$")
+        assert sample_user_data["password"] not in stored
+
+    def test_user_responses_exclude_password(self, client, sample_user_data):
+        """Test that no user read returns the password hash."""
+        user_id = client.post("/users", json=sample_user_data).json()["id"]
+        for response in (
+            client.get("/users"),
+            client.get("/users", params={"limit": 1}),
+            client.get(f"/users/{user_id}"),
+            client.put(f"/users/{user_id}", json={"password": "changed123"}),
+        ):
+            assert response.status_code == status.HTTP_200_OK
+            assert "password" not in response.text
+
     def test_get_all_users(self, client, sample_user_data):
         """Test getting all users."""
         client.post("/users", json=sample_user_data)
@@ -238,7 +857,8 @@ class TestUserEndpoints:
         assert data["name"] == "Updated User"
         assert data["email"] == "updated@example.com"
         # Password should remain unchanged if not updated
-        assert data["password"] == sample_user_data["password"]
+        verify = client.post(f"/users/{user_id}/verify-password", json={"password": sample_user_data["password"]})
+        assert verify.json() == {"valid": True}
 
     def test_update_user_password(self, client, sample_user_data):
         """Test updating user password."""
@@ -249,8 +869,61 @@ class TestUserEndpoints:
         response = client.put(f"/users/{user_id}", json=update_data)
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
-        assert data["password"] == "newpassword123"
         assert data["name"] == sample_user_data["name"]
+        verify = client.post(f"/users/{user_id}/verify-password", json={"password": "newpassword123"})
+        assert verify.json() == {"valid": True}
+        verify = client.post(f"/users/{user_id}/verify-password", json={"password": sample_user_data["password"]})
+        assert verify.json() == {"valid": False}
+
+    def test_create_user_duplicate_email(self, client, sample_user_data):
+        """Test that an email taken in any case gets a 409."""
+        client.post("/users", json=sample_user_data)
+        duplicate = {**sample_user_data, "email": sample_user_data["email"].upper()}
+        response = client.post("/users", json=duplicate)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.json()["detail"] == "Email already registered"
+        assert len(client.get("/users").json()) == 1
+
+    def test_update_user_to_taken_email(self, client, sample_user_data):
+        """Test that an update cannot take another user's email."""
+        client.post("/users", json=sample_user_data)
+        other = client.post("/users", json={**sample_user_data, "email": "other@example.com"}).json()
+        response = client.put(f"/users/{other['id']}", json={"email": sample_user_data["email"]})
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_get_user_by_email(self, client, sample_user_data):
+        """Test looking a user up by email, ignoring case."""
+        created = client.post("/users", json=sample_user_data).json()
+        response = client.get(f"/users/by-email/{sample_user_data['email'].upper()}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == created
+        assert client.get("/users/by-email/nobody@example.com").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_verify_password(self, client, sample_user_data):
+        """Test checking right and wrong passwords."""
+        user_id = client.post("/users", json=sample_user_data).json()["id"]
+        response = client.post(f"/users/{user_id}/verify-password", json={"password": sample_user_data["password"]})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"valid": True}
+        response = client.post(f"/users/{user_id}/verify-password", json={"password": "wrong"})
+        assert response.json() == {"valid": False}
+
+    def test_verify_password_user_not_found(self, client):
+        """Test checking the password of a user that doesn't exist."""
+        response = client.post("/users/999/verify-password", json={"password": "secret"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_create_user_when_hasher_saturated(self, client, monkeypatch, sample_user_data):
+        """Test that sign-ups are turned away while every hash slot is taken."""
+        import main
+        hasher = PasswordHasher(workers=1, cost=4, queue=0)
+        hasher.pending = hasher.limit
+        monkeypatch.setattr(main, "password_hasher", hasher)
+        response = client.post("/users", json=sample_user_data)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "1"
+        assert client.get("/users").json() == []
+        assert client.get("/metrics").json()["password_hasher"]["rejected"] == 1
 
     def test_update_user_partial(self, client, sample_user_data):
         """Test partial update of a user."""
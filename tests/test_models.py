@@ -95,6 +95,12 @@ class TestProductModels:
         assert update.description is None
         assert update.price is None
 
+    def test_product_update_rejects_nulls(self):
+        """Test that a field may be left out of ProductUpdate but not set to null."""
+        for field in ("name", "price", "tags", "in_stock"):
+            with pytest.raises(ValidationError):
+                ProductUpdate(**{field: None})
+
     def test_product_update_dict_exclude_unset(self):
         """Test ProductUpdate dict with exclude_unset."""
         update = ProductUpdate(name="Updated")
@@ -166,6 +172,11 @@ class TestUserModels:
         assert update.email is None
         assert update.password is None
 
+    def test_user_update_rejects_nulls(self):
+        """Test that a field may be left out of UserUpdate but not set to null."""
+        with pytest.raises(ValidationError):
+            UserUpdate(email=None)
+
     def test_user_update_dict_exclude_unset(self):
         """Test UserUpdate dict with exclude_unset."""
         update = UserUpdate(email="updated@example.com")
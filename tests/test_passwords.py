@@ -0,0 +1,73 @@
+"""Tests for password hashing."""
+import asyncio
+
+import pytest
+
+from passwords import HasherBusy, PasswordHasher, hash_password, verify_password
+
+
+class TestHashPassword:
+    """Tests for hash_password and verify_password."""
+
+    def test_round_trip(self):
+        """Test that a hash verifies its password and no other."""
+        stored = hash_password("correct horse", cost=4)
+        assert stored.startswith("scrypt$4$8$1$")
+        assert "correct horse" not in stored
+        assert verify_password("correct horse", stored)
+        assert not verify_password("wrong horse", stored)
+
+    def test_salted(self):
+        """Test that hashing the same password twice gives different hashes."""
+        assert hash_password("secret", cost=4) != hash_password("secret", cost=4)
+
+    def test_verifies_other_costs(self):
+        """Test that a hash is checked at the cost it was made with."""
+        assert verify_password("secret", hash_password("secret", cost=5, block_size=4))
+
+    def test_plaintext_values(self):
+        """Test that passwords stored before hashing still verify."""
+        assert verify_password("legacy", "legacy")
+        assert not verify_password("other", "legacy")
+
+    def test_malformed_hash(self):
+        """Test that a damaged hash never verifies."""
+        assert not verify_password("secret", "scrypt$x$8$1$salt$key")
+
+
+@pytest.mark.anyio
+class TestPasswordHasher:
+    """Tests for the pooled PasswordHasher."""
+
+    @pytest.fixture
+    def anyio_backend(self):
+        return "asyncio"
+
+    async def test_hashes_on_worker_processes(self):
+        """Test that hashes made by the pool verify, in the pool and inline."""
+        hasher = PasswordHasher(workers=2, cost=4)
+        try:
+            stored = await hasher.hash("secret")
+            assert await hasher.verify("secret", stored)
+            assert not await hasher.verify("wrong", stored)
+            assert verify_password("secret", stored)
+            assert hasher.pending == 0
+        finally:
+            hasher.close()
+
+    async def test_rejects_when_saturated(self):
+        """Test that calls beyond workers plus queue fail fast instead of waiting."""
+        hasher = PasswordHasher(workers=1, cost=10, queue=1)
+        try:
+            results = await asyncio.gather(*(hasher.hash("secret") for _ in range(4)), return_exceptions=True)
+            assert sum(isinstance(result, HasherBusy) for result in results) == 2
+            assert sum(isinstance(result, str) for result in results) == 2
+            assert hasher.stats() == {"workers": 1, "pending": 0, "limit": 2, "rejected": 2}
+        finally:
+            hasher.close()
+
+    async def test_inline(self):
+        """Test that workers=0 hashes without a pool."""
+        hasher = PasswordHasher(workers=0, cost=4)
+        assert verify_password("secret", await hasher.hash("secret"))
+        assert hasher._pool is None
@@ -0,0 +1,270 @@
+"""Tests for WAL and snapshot persistence."""
+import os
+import threading
+import time
+
+import pytest
+
+from database import InMemoryDatabase
+from locks import WouldBlock, non_blocking
+from models import ProductCreate, ProductUpdate, UserCreate, UserUpdate
+import persistence
+from persistence import Persistence
+
+
+def open_db(path, **options):
+    """Open a persisted database that syncs every write unless told otherwise."""
+    options.setdefault("commit_interval", 0)
+    return InMemoryDatabase(persistence=Persistence(str(path), **options))
+
+
+def product(name="Product", price=10.0):
+    return ProductCreate(name=name, description="Desc", price=price, category="Cat", tags=["tag"])
+
+
+class TestPersistence:
+    """Tests for recovering an InMemoryDatabase from disk."""
+
+    def test_new_directory_seeds_sample_data(self, tmp_path):
+        """Test that an empty data directory starts with the sample catalog."""
+        db = open_db(tmp_path)
+        assert len(db.get_all_products()) == 3
+        db.close()
+
+        db = open_db(tmp_path)
+        assert len(db.get_all_products()) == 3
+        db.close()
+
+    def test_recovers_writes_from_wal(self, tmp_path):
+        """Test that creates, updates and deletes survive a restart."""
+        db = open_db(tmp_path)
+        db.clear()
+        first = db.create_product(product("First"))
+        second = db.create_product(product("Second"))
+        db.update_product(first.id, ProductUpdate(price=99.0, tags=["changed"]))
+        db.delete_product(second.id)
+        user = db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+        db.update_user(user.id, UserUpdate(name="Renamed"))
+        db.close()
+
+        db = open_db(tmp_path)
+        products = db.get_all_products()
+        assert [(p.id, p.name, p.price, p.tags) for p in products] == [(1, "First", 99.0, ["changed"])]
+        assert products[0].created_at == first.created_at
+        assert [u.name for u in db.get_all_users()] == ["Renamed"]
+        assert db.get_user_by_email("USER@example.com").id == user.id
+        # Indexes are rebuilt from the recovered records
+        assert [p.id for p in db.query_products(tags=["changed"])[0]] == [1]
+        assert [p.id for p in db.search_products("first", 10)] == [1]
+        # Deleted ids are not reused
+        assert db.create_product(product()).id == 3
+        db.close()
+
+    def test_recovers_from_snapshot_and_wal_tail(self, tmp_path):
+        """Test recovery from a snapshot plus the writes logged after it."""
+        db = open_db(tmp_path)
+        db.clear()
+        db.create_product(product("Before"))
+        db.checkpoint(wait=True)
+        db.create_product(product("After"))
+        db.close()
+
+        # The snapshot covers every segment before it, so those are gone
+        wal_files = [name for name in os.listdir(tmp_path) if name.startswith("wal-")]
+        assert "snapshot.bin" in os.listdir(tmp_path)
+        assert len(wal_files) == 1
+
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == ["Before", "After"]
+        db.close()
+
+    def test_concurrent_checkpoints_are_written_in_turn(self, tmp_path, monkeypatch):
+        """Test that checkpoints taken together write one snapshot at a time, in order."""
+        db = open_db(tmp_path)
+        db.clear()
+        writing, segments = [], []
+        write_snapshot = persistence.write_snapshot
+
+        def tracked_write(f, rows, extra):
+            writing.append(extra["wal_segment"])
+            assert len(writing) == 1
+            time.sleep(0.01)
+            write_snapshot(f, rows, extra)
+            segments.append(writing.pop())
+
+        monkeypatch.setattr(persistence, "write_snapshot", tracked_write)
+        threads = []
+        for i in range(4):
+            db.create_product(product(f"P{i}"))
+            threads.append(threading.Thread(target=db.checkpoint))
+            threads[-1].start()
+        for thread in threads:
+            thread.join()
+        db.close()
+
+        assert len(segments) == 4 and segments == sorted(segments)
+        assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == [f"P{i}" for i in range(4)]
+        db.close()
+
+    def test_automatic_snapshot_drops_old_segments(self, tmp_path):
+        """Test that snapshots are taken every ``snapshot_every`` records."""
+        db = open_db(tmp_path, snapshot_every=5)
+        db.clear()
+        for i in range(12):
+            db.create_product(product(f"P{i}"))
+        db.close()
+
+        segments = sorted(name for name in os.listdir(tmp_path) if name.startswith("wal-"))
+        assert len(segments) <= 2
+
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == [f"P{i}" for i in range(12)]
+        db.close()
+
+    def test_write_due_to_snapshot_is_refused_on_the_event_loop(self, tmp_path):
+        """Test that a non-blocking write that would snapshot raises WouldBlock and changes nothing."""
+        # Three sample products and the clear count too
+        db = open_db(tmp_path, snapshot_every=8)
+        db.clear()
+        for i in range(4):
+            db.create_product(product(f"P{i}"))
+        assert db._persistence.snapshot_due
+        with non_blocking(), pytest.raises(WouldBlock):
+            db.create_product(product("Late"))
+        assert [p.name for p in db.get_all_products()] == [f"P{i}" for i in range(4)]
+        assert db.create_product(product("Late")).id == 5
+        assert not db._persistence.snapshot_due
+        db.close()
+
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == [f"P{i}" for i in range(4)] + ["Late"]
+        db.close()
+
+    def test_snapshot_is_durable_before_segments_are_dropped(self, tmp_path, monkeypatch):
+        """Test that the data directory is synced after the snapshot rename, while old segments remain."""
+        synced = []
+        monkeypatch.setattr(
+            persistence, "fsync_directory",
+            lambda path: synced.append((os.path.exists(tmp_path / "snapshot.bin"), len(os.listdir(path)))),
+        )
+        db = open_db(tmp_path)
+        db.checkpoint(wait=True)
+        db.close()
+        # snapshot.bin plus the old and new segments
+        assert synced == [(True, 3)]
+
+    def test_bulk_writes_are_logged(self, tmp_path):
+        """Test that bulk batches are persisted, including create-then-delete ids."""
+        db = open_db(tmp_path)
+        db.clear()
+        db.bulk_products([
+            ("create", None, product("Kept")),
+            ("create", None, product("Dropped")),
+            ("delete", 2, None),
+        ])
+        db.close()
+
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == ["Kept"]
+        assert db.create_product(product()).id == 3
+        db.close()
+
+    def test_torn_tail_is_ignored(self, tmp_path):
+        """Test that a partially written last record does not break recovery."""
+        db = open_db(tmp_path)
+        db.clear()
+        db.create_product(product("Complete"))
+        db.close()
+
+        segment = sorted(name for name in os.listdir(tmp_path) if name.startswith("wal-"))[-1]
+        with open(tmp_path / segment, "ab") as f:
+            f.write(b"\x00\x00\x01\x00garbage")
+
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == ["Complete"]
+        db.close()
+
+    def test_group_commit_flushes_on_close(self, tmp_path):
+        """Test that buffered writes reach disk when the database closes."""
+        db = open_db(tmp_path, commit_interval=60)
+        db.clear()
+        db.create_product(product("Buffered"))
+        db.close()
+
+        db = open_db(tmp_path)
+        assert [p.name for p in db.get_all_products()] == ["Buffered"]
+        db.close()
+
+    @pytest.mark.parametrize("interval", [0, 0.01])
+    def test_flush_makes_writes_durable(self, tmp_path, interval):
+        """Test that flushed writes are on disk without closing."""
+        persistence = Persistence(str(tmp_path), commit_interval=interval)
+        db = InMemoryDatabase(persistence=persistence)
+        db.create_product(product("Durable"))
+        persistence.flush()
+
+        reader = Persistence(str(tmp_path), commit_interval=0)
+        recovered = reader.recover()
+        assert "Durable" in [p.name for p in recovered.products.values()]
+        reader.close()
+        db.close()
+
+    def test_writes_before_first_query_after_snapshot_recovery(self, tmp_path):
+        """Test that indexes built in the background from a snapshot include later writes."""
+        db = open_db(tmp_path)
+        db.clear()
+        for i in range(5):
+            db.create_product(product(f"P{i}", price=float(i)))
+        db.checkpoint(wait=True)
+        db.close()
+
+        db = open_db(tmp_path)
+        db.update_product(1, ProductUpdate(category="Other", price=50.0))
+        db.delete_product(2)
+        db.create_product(ProductCreate(name="New", description="Desc", price=0.5, category="Other"))
+        assert [p.id for p in db.query_products(category="Other")[0]] == [1, 6]
+        assert [p.id for p in db.query_products(tags=["tag"])[0]] == [1, 3, 4, 5]
+        assert [p.id for p in db.query_products(sort="price")[0]] == [6, 3, 4, 5, 1]
+        assert [p.name for p in db.search_products("p3", 10)] == ["P3"]
+        db.close()
+
+        db = open_db(tmp_path)
+        assert [(p.id, p.category) for p in db.get_all_products()] == [
+            (1, "Other"), (3, "Cat"), (4, "Cat"), (5, "Cat"), (6, "Other")
+        ]
+        db.close()
+
+    def test_writes_during_index_build_are_replayed(self, tmp_path, monkeypatch):
+        """Test that writes landing while indexes are built off the lock reach them, and queries wait."""
+        db = open_db(tmp_path)
+        db.clear()
+        for i in range(5):
+            db.create_product(product(f"P{i}", price=float(i)))
+        db.checkpoint(wait=True)
+        db.close()
+
+        building, written = threading.Event(), threading.Event()
+        build = InMemoryDatabase._build_product_indexes
+
+        def held_build(products):
+            building.set()
+            written.wait(5)
+            return build(products)
+
+        monkeypatch.setattr(InMemoryDatabase, "_build_product_indexes", staticmethod(held_build))
+        db = open_db(tmp_path)
+        assert building.wait(5)
+        db.update_product(1, ProductUpdate(category="Other", price=50.0))
+        db.delete_product(2)
+        db.create_product(ProductCreate(name="New", description="Desc", price=0.5, category="Other"))
+        with non_blocking(), pytest.raises(WouldBlock):
+            db.query_products(category="Other")
+        written.set()
+        assert [p.id for p in db.query_products(category="Other")[0]] == [1, 6]
+        assert [p.id for p in db.query_products(sort="price")[0]] == [6, 3, 4, 5, 1]
+        assert [p.name for p in db.search_products("new", 10)] == ["New"]
+        assert db.search_products("p0", 10) == [db.get_product(1)]
+        assert db.search_products("p1", 10) == []
+        db.close()
@@ -0,0 +1,26 @@
+"""Tests for sparse fieldset helpers."""
+import re
+
+from models import Product, User
+from projection import fields_pattern, projection
+
+
+class TestProjection:
+    """Tests for fields_pattern and projection."""
+
+    def test_pattern_accepts_only_known_fields(self):
+        """Test that the pattern takes comma-separated known names and nothing else."""
+        pattern = re.compile(fields_pattern(["id", "name", "in_stock"]))
+        assert pattern.match("id")
+        assert pattern.match("in_stock,id,name")
+        assert not pattern.match("id,")
+        assert not pattern.match("id, name")
+        assert not pattern.match("price")
+        assert not pattern.match("id|price")
+
+    def test_projection_excludes_unrequested_fields(self):
+        """Test that every field not asked for is excluded, and hidden ones always are."""
+        assert projection(None, Product) == frozenset()
+        assert projection("id,price", Product) == frozenset(Product.model_fields) - {"id", "price"}
+        assert projection(None, User, frozenset({"password"})) == {"password"}
+        assert projection("email", User, frozenset({"password"})) == {"id", "name", "created_at", "password"}
@@ -0,0 +1,130 @@
+"""Tests for sharing a database between processes."""
+import multiprocessing
+import os
+
+import pytest
+
+from database import InMemoryDatabase
+from models import ProductCreate, UserCreate
+import remote as remote_module
+from remote import RemoteDatabase, RemoteError, StorageServer
+from storage import DuplicateEmail
+
+
+def product(name="Product"):
+    return ProductCreate(name=name, description="Desc", price=10.0, category="Cat")
+
+
+def create_products(address: str, count: int):
+    """Create products from a separate process."""
+    remote = RemoteDatabase(address)
+    for i in range(count):
+        remote.create_product(product(f"Child {i}"))
+    remote.close()
+
+
+class TestStorageServer:
+    """Tests for RemoteDatabase clients of a StorageServer."""
+
+    @pytest.fixture
+    def owner(self):
+        db = InMemoryDatabase(sample_data=False)
+        yield db
+        db.close()
+
+    @pytest.fixture
+    def server(self, owner):
+        with StorageServer(owner) as server:
+            yield server
+
+    @pytest.fixture
+    def remote(self, server):
+        remote = RemoteDatabase(server.address)
+        yield remote
+        remote.close()
+
+    def test_shares_versions_and_epoch(self, owner, remote):
+        """Test that clients see the owner's data, version counters and epoch, so ETags agree."""
+        created = remote.create_product(product())
+        assert owner.get_product(created.id) == created
+        assert remote.epoch == owner.epoch
+        assert remote.collection_version("products") == owner.collection_version("products") > 0
+        assert remote.record_version("products", created.id) == owner.record_version("products", created.id)
+
+    def test_raises_storage_errors(self, remote):
+        """Test that exceptions raised by the owner reach the caller."""
+        remote.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+        with pytest.raises(DuplicateEmail):
+            remote.create_user(UserCreate(name="Other", email="USER@example.com", password="pass"))
+        with pytest.raises(ValueError):
+            remote.query_products(limit=1, after="not a key")
+        # The connection is still usable after an error
+        assert len(remote.users) == 1
+
+    def test_unpicklable_errors_become_remote_errors(self, owner, remote, monkeypatch):
+        """Test that an exception the owner cannot send back arrives as a RemoteError."""
+        class Local(Exception):
+            pass
+
+        def fail(product_id):
+            raise Local("no pickling")
+
+        monkeypatch.setattr(owner, "get_product", fail)
+        with pytest.raises(RemoteError, match="Local: no pickling"):
+            remote.get_product(1)
+        assert len(remote.products) == 0
+
+    def test_full_scans_stream_in_chunks(self, owner, remote, monkeypatch):
+        """Test that exports are sent a chunk at a time, and a stream left part read is not reused."""
+        monkeypatch.setattr(remote_module, "STREAM_CHUNK", 3)
+        created = [owner.create_product(product(f"P{i}")) for i in range(10)]
+        owner.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+        assert list(remote.iter_all_products()) == created
+        assert remote.get_all_products() == created
+        assert [user.name for user in remote.iter_all_users()] == ["User"]
+
+        products = remote.iter_all_products()
+        assert next(products) == created[0]
+        products.close()
+        assert remote.get_product(created[-1].id) == created[-1]
+        assert remote.get_all_products() == created
+
+    def test_rejects_other_methods(self, remote):
+        """Test that only the storage interface can be called."""
+        with pytest.raises(AttributeError):
+            remote._call("_log", [("clear",)])
+
+    def test_writes_from_other_processes(self, owner, server):
+        """Test that writes from several processes land in the one database."""
+        context = multiprocessing.get_context("fork")
+        children = [context.Process(target=create_products, args=(server.address, 20)) for _ in range(3)]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+            assert child.exitcode == 0
+        assert [p.id for p in owner.get_all_products()] == list(range(1, 61))
+
+    def test_changes_mirror_owner(self, owner, remote):
+        """Test that the client's change log follows the owner's, with the same numbers."""
+        changes = remote.changes
+        start = changes.last_seq
+        assert start == owner.changes.last_seq
+        created = owner.create_product(product())
+        assert changes.wait(start, timeout=5) == owner.changes.since(start)
+        assert changes.since(start)[0].record == created
+
+    def test_changes_restart_when_behind(self, owner, remote):
+        """Test that a client whose next changes were dropped restarts its copy from the owner's position."""
+        changes = remote.changes
+        owner.changes.restart(100)
+        assert changes.wait(0, timeout=5) is None
+        assert changes.last_seq == 100
+
+    def test_close_removes_socket(self, owner):
+        """Test that closing the server removes its socket."""
+        server = StorageServer(owner)
+        server.start()
+        assert os.path.exists(server.address)
+        server.close()
+        assert not os.path.exists(server.address)
@@ -0,0 +1,102 @@
+"""Tests for the response cache."""
+import json
+from datetime import datetime
+
+import fast_msgpack
+from models import Product
+from response_cache import ResponseCache
+
+
+def product(product_id: int, name: str = "Product") -> Product:
+    return Product(
+        id=product_id, name=name, description="Desc", price=1.0, category="Cat",
+        created_at=datetime(2024, 1, 1),
+    )
+
+
+class TestResponseCache:
+    """Tests for ResponseCache."""
+
+    def test_response_served_only_at_its_version(self):
+        """Test that a response is a hit at its version and a miss at any other."""
+        cache = ResponseCache(1024)
+        cache.put_response("/products?", '"a-1"', b"[]", {"ETag": '"a-1"'})
+        assert cache.get_response("/products?", '"a-1"') == (b"[]", {"ETag": '"a-1"'})
+        assert cache.get_response("/products?", '"a-2"') is None
+        assert cache.get_response("/products?", None) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_fragments_reused_until_record_replaced(self):
+        """Test that list encoding reuses record JSON until the record changes."""
+        cache = ResponseCache(4096)
+        first, second = product(1), product(2)
+        body = cache.encode("products", [first, second])
+        assert json.loads(body) == [json.loads(first.model_dump_json()), json.loads(second.model_dump_json())]
+        assert cache.fragment_misses == 2
+
+        renamed = product(1, "Renamed")
+        body = cache.encode("products", [renamed, second, product(2)])
+        assert [item["name"] for item in json.loads(body)] == ["Renamed", "Product", "Product"]
+        assert (cache.fragment_hits, cache.fragment_misses) == (2, 3)
+        assert cache.encode("users", []) == b"[]"
+
+    def test_fragments_cached_per_projection(self):
+        """Test that the same record encoded without different fields is cached separately."""
+        cache = ResponseCache(4096)
+        record = product(1)
+        full = cache.fragment("products", record)
+        narrow = cache.fragment("products", record, frozenset({"description", "tags"}))
+        assert "description" in json.loads(full)
+        assert "description" not in json.loads(narrow)
+        assert cache.fragment("products", record) == full
+        assert cache.fragment("products", record, frozenset({"description", "tags"})) == narrow
+        assert (cache.fragment_hits, cache.fragment_misses) == (2, 2)
+
+    def test_msgpack_listing_matches_json(self):
+        """Test that a MessagePack listing decodes like the JSON one, with fragments cached per media type."""
+        cache = ResponseCache(1 << 20)
+        records = [product(i) for i in range(1, 20)]
+        body = cache.encode("products", records, media_type=fast_msgpack.MSGPACK_MEDIA_TYPE)
+        assert fast_msgpack.loads(body) == json.loads(cache.encode("products", records))
+        assert fast_msgpack.loads(cache.encode("products", [], media_type=fast_msgpack.MSGPACK_MEDIA_TYPE)) == []
+        assert (cache.fragment_hits, cache.fragment_misses) == (0, 38)
+
+    def test_evicts_least_recently_used(self):
+        """Test that the byte budget evicts the entries used longest ago."""
+        cache = ResponseCache(30)
+        cache.put_response("a", "v", b"x" * 10, {})
+        cache.put_response("b", "v", b"x" * 10, {})
+        cache.get_response("a", "v")
+        cache.put_response("c", "v", b"x" * 10, {})
+        assert cache.get_response("b", "v") is None
+        assert cache.get_response("a", "v") is not None
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] <= 30
+
+    def test_oversized_entries_not_cached(self):
+        """Test that an entry larger than the budget is skipped, so a zero budget disables caching."""
+        cache = ResponseCache(0)
+        cache.put_response("a", "v", b"[]", {})
+        assert cache.get_response("a", "v") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_uncached_iterator_encoded_like_list(self):
+        """Test that without a budget an iterator is encoded record by record to the same bytes."""
+        cache = ResponseCache(0)
+        records = [product(i) for i in range(1, 5)]
+        for media_type in (fast_msgpack.JSON_MEDIA_TYPE, fast_msgpack.MSGPACK_MEDIA_TYPE):
+            expected = cache.encode("products", records, media_type=media_type)
+            assert cache.encode("products", iter(records), media_type=media_type) == expected
+            assert cache.encode("products", iter([]), media_type=media_type) == cache.encode(
+                "products", [], media_type=media_type
+            )
+
+    def test_fragment_size_counts_its_tag(self):
+        """Test that the record values kept to validate a fragment count towards the budget."""
+        cache = ResponseCache(1 << 20)
+        body = cache.fragment("products", product(1, "x" * 1000))
+        assert cache.stats()["bytes"] > len(body) + 1000
+
+        cache = ResponseCache(len(body) + 100)
+        assert cache.fragment("products", product(1, "x" * 1000)) == body
+        assert cache.stats()["entries"] == 0
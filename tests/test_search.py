@@ -0,0 +1,87 @@
+"""Tests for the full-text search index."""
+from search import TextIndex, tokenize
+
+
+class TestTokenize:
+    """Tests for tokenize."""
+
+    def test_lowercases_and_splits_on_punctuation(self):
+        """Test that text is split into lowercase alphanumeric terms."""
+        assert tokenize("Wireless Head-phones, 2nd GEN!") == ["wireless", "head", "phones", "2nd", "gen"]
+
+    def test_empty(self):
+        """Test tokenizing text without terms."""
+        assert tokenize("  --  ") == []
+
+
+class TestTextIndex:
+    """Tests for TextIndex."""
+
+    def test_ranks_more_relevant_documents_first(self):
+        """Test that repeated and rarer terms score higher."""
+        index = TextIndex()
+        index.add(1, "coffee maker")
+        index.add(2, "coffee coffee grinder")
+        index.add(3, "laptop stand")
+        ranked = [doc_id for doc_id, _ in index.search("coffee", 10)]
+        assert ranked == [2, 1]
+
+    def test_multiple_terms_accumulate(self):
+        """Test that documents matching more query terms rank higher."""
+        index = TextIndex()
+        index.add(1, "wireless mouse")
+        index.add(2, "wireless headphones with noise cancellation")
+        index.add(3, "wired headphones")
+        ranked = [doc_id for doc_id, _ in index.search("wireless headphones", 10)]
+        assert ranked[0] == 2
+        assert set(ranked) == {1, 2, 3}
+
+    def test_limit_keeps_top_results(self):
+        """Test that only the best ``limit`` results are returned."""
+        index = TextIndex()
+        for doc_id in range(1, 11):
+            index.add(doc_id, "lamp " * doc_id)
+        assert [doc_id for doc_id, _ in index.search("lamp", 3)] == [10, 9, 8]
+
+    def test_ties_break_on_lower_id(self):
+        """Test deterministic ordering for equal scores."""
+        index = TextIndex()
+        for doc_id in (3, 1, 2):
+            index.add(doc_id, "same text")
+        assert [doc_id for doc_id, _ in index.search("same", 10)] == [1, 2, 3]
+
+    def test_pruning_matches_an_unpruned_scan(self):
+        """Test that common terms still match documents rare terms do not, with pruned scoring."""
+        index = TextIndex()
+        for doc_id in range(1, 51):
+            index.add(doc_id, "coffee " * (doc_id % 3 + 1) + "mug" * (doc_id % 2))
+        index.add(51, "xyzzy coffee")
+        for doc_id in range(52, 5001):
+            index.add(doc_id, f"filler text {doc_id % 7}")
+        # A limit above the document count never prunes
+        unpruned = len(index) + 1
+        ranked = index.search("coffee xyzzy", 10)
+        assert ranked[0][0] == 51 and len(ranked) == 10
+        assert ranked == index.search("coffee xyzzy", unpruned)[:10]
+        for query in ("coffee mug", "mug", "text 3 coffee", "filler xyzzy mug", "text filler 5"):
+            for limit in (1, 3, 10, 100):
+                assert index.search(query, limit) == index.search(query, unpruned)[:limit]
+
+    def test_remove(self):
+        """Test that removed documents no longer match."""
+        index = TextIndex()
+        index.add(1, "blue chair")
+        index.add(2, "red chair")
+        index.remove(1, "blue chair")
+        index.remove(1, "blue chair")
+        assert index.search("blue", 10) == []
+        assert [doc_id for doc_id, _ in index.search("chair", 10)] == [2]
+        assert len(index) == 1
+
+    def test_no_matches(self):
+        """Test queries without matching or indexable terms."""
+        index = TextIndex()
+        assert index.search("anything", 10) == []
+        index.add(1, "desk")
+        assert index.search("chair", 10) == []
+        assert index.search("!!!", 10) == []
@@ -0,0 +1,98 @@
+"""Tests specific to the sharded in-memory backend."""
+import pytest
+
+from config import Settings
+from database import InMemoryDatabase, ShardedDatabase, create_database
+from models import ProductCreate, ProductUpdate, UserCreate
+from persistence import Persistence
+
+
+def product(i: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {i}", description="Desc", price=float(i % 5),
+        category="Even" if i % 2 == 0 else "Odd", tags=["tag"]
+    )
+
+
+class TestShardedDatabase:
+    """Tests for ShardedDatabase."""
+
+    @pytest.fixture
+    def db(self):
+        db = ShardedDatabase(shards=4)
+        db.clear()
+        return db
+
+    def test_sample_data_seeded_once(self):
+        """Test that a new sharded store holds the sample catalog once, spread over shards."""
+        db = ShardedDatabase(shards=2)
+        assert [p.id for p in db.get_all_products()] == [1, 2, 3]
+        assert [len(shard.products) for shard in db.shards] == [1, 2]
+
+    def test_records_live_on_their_id_shard(self, db):
+        """Test that products and users are placed by id."""
+        products = [db.create_product(product(i)) for i in range(10)]
+        user = db.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+        for created in products:
+            assert created.id in db.shards[created.id % 4].products
+        assert user.id in db.shards[user.id % 4].users
+        assert len(db.products) == 10
+        assert list(db.products) == list(range(1, 11))
+
+    def test_pages_merge_across_shards(self, db):
+        """Test that paging a filtered, sorted query visits every match once, in order."""
+        for i in range(40):
+            db.create_product(product(i))
+        expected = sorted(
+            (p for p in db.get_all_products() if p.category == "Even"),
+            key=lambda p: (p.price, p.id), reverse=True,
+        )
+        seen, after = [], None
+        while True:
+            page, after = db.query_products(category="Even", sort="-price", limit=3, after=after)
+            seen.extend(page)
+            if after is None:
+                break
+        assert seen == expected
+
+    def test_bulk_results_keep_request_order(self, db):
+        """Test that a batch split over shards reports results in request order."""
+        db.create_product(product(0))
+        results = db.bulk_products([
+            ("create", None, product(1)),
+            ("update", 1, ProductUpdate(price=9.0)),
+            ("delete", 99, None),
+            ("create", None, product(2)),
+        ])
+        assert [(r.op, r.id, r.status) for r in results] == [
+            ("create", 2, 200), ("update", 1, 200), ("delete", 99, 404), ("create", 3, 200)
+        ]
+        assert db.get_product(1).price == 9.0
+        assert db.create_product(product(3)).id == 4
+
+    def test_recovers_every_shard(self, tmp_path):
+        """Test that a persisted sharded store reopens with its records and id counters."""
+        def open_db():
+            return ShardedDatabase(shards=3, persistence=[
+                Persistence(str(tmp_path / f"shard-{i}"), commit_interval=0) for i in range(3)
+            ])
+
+        db = open_db()
+        db.clear()
+        for i in range(7):
+            db.create_product(product(i))
+        db.delete_product(7)
+        db.close()
+
+        db = open_db()
+        assert [p.id for p in db.get_all_products()] == [1, 2, 3, 4, 5, 6]
+        assert db.create_product(product(8)).id == 8
+        db.close()
+
+    def test_create_database_shards(self, tmp_path):
+        """Test that the shards setting selects the sharded backend."""
+        assert isinstance(create_database(Settings(shards=1)), InMemoryDatabase)
+        db = create_database(Settings(shards=2, data_dir=str(tmp_path)))
+        assert isinstance(db, ShardedDatabase)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["shard-0", "shard-1"]
+        db.close()
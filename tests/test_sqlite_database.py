@@ -0,0 +1,99 @@
+"""Tests specific to the SQLite storage backend."""
+import sqlite3
+import threading
+
+import pytest
+
+from models import ProductCreate, ProductUpdate, UserCreate, UserUpdate
+from sqlite_database import SQLiteDatabase
+from storage import DuplicateEmail
+
+
+def product(name="Product", tags=("tag",)):
+    return ProductCreate(name=name, description="Desc", price=10.0, category="Cat", tags=list(tags))
+
+
+class TestSQLiteDatabase:
+    """Tests for SQLiteDatabase durability and connection pooling."""
+
+    def test_new_file_seeds_sample_data_once(self, tmp_path):
+        """Test that sample products are only created with the schema."""
+        path = str(tmp_path / "products.db")
+        db = SQLiteDatabase(path)
+        assert len(db.products) == 3
+        db.delete_product(1)
+        db.close()
+
+        db = SQLiteDatabase(path)
+        assert [p.id for p in db.get_all_products()] == [2, 3]
+        db.close()
+
+    def test_data_survives_reopen(self, tmp_path):
+        """Test that writes are durable and deleted ids are not reused."""
+        path = str(tmp_path / "products.db")
+        db = SQLiteDatabase(path)
+        db.clear()
+        first = db.create_product(product("First", tags=["b", "a", "b"]))
+        second = db.create_product(product("Second"))
+        db.update_product(first.id, ProductUpdate(price=20.0))
+        db.delete_product(second.id)
+        db.close()
+
+        db = SQLiteDatabase(path)
+        recovered = db.get_product(first.id)
+        assert recovered == first.model_copy(update={"price": 20.0})
+        assert [p.id for p in db.query_products(tags=["a"])[0]] == [first.id]
+        assert db.create_product(product()).id == 3
+        db.close()
+
+    def test_failed_bulk_batch_rolls_back(self, tmp_path):
+        """Test that a batch raising midway leaves no partial writes."""
+        db = SQLiteDatabase(str(tmp_path / "products.db"))
+        db.clear()
+        with pytest.raises(AttributeError):
+            db.bulk_products([("create", None, product("Discarded")), ("create", None, None)])
+        assert db.get_all_products() == []
+        db.close()
+
+    def test_upgrades_version_1_file_with_email_index(self, tmp_path):
+        """Test that a file from before the email index gains it, keeping the first of duplicate emails."""
+        path = str(tmp_path / "products.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT NOT NULL,"
+            " password TEXT NOT NULL, created_at TEXT NOT NULL);"
+            "INSERT INTO users (name, email, password, created_at) VALUES"
+            " ('First', 'user@example.com', 'pass', '2024-01-01T00:00:00'),"
+            " ('Second', 'USER@example.com', 'pass', '2024-01-01T00:00:00');"
+            "PRAGMA user_version = 1;"
+        )
+        conn.close()
+
+        db = SQLiteDatabase(path)
+        assert db.get_user_by_email("user@example.com").id == 1
+        assert db.update_user(2, UserUpdate(name="Renamed")).name == "Renamed"
+        with pytest.raises(DuplicateEmail):
+            db.create_user(UserCreate(name="Third", email="user@example.com", password="pass"))
+        db.update_user(2, UserUpdate(email="second@example.com"))
+        assert db.get_user_by_email("second@example.com").id == 2
+        db.close()
+
+    def test_concurrent_writers_share_the_pool(self, tmp_path):
+        """Test that more threads than connections can write without errors."""
+        db = SQLiteDatabase(str(tmp_path / "products.db"), pool_size=2)
+        db.clear()
+
+        def write(n):
+            for i in range(20):
+                db.create_product(product(f"T{n}-{i}"))
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(db.products) == 120
+        assert [p.id for p in db.get_all_products()] == list(range(1, 121))
+        assert len(db._pool._opened) <= 2
+        db.close()
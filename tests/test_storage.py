@@ -0,0 +1,105 @@
+"""Tests for the async storage interface."""
+import threading
+
+import pytest
+
+from database import InMemoryDatabase
+from models import ProductCreate, UserCreate
+from persistence import Persistence
+from sqlite_database import SQLiteDatabase
+
+
+def product(name="Product"):
+    return ProductCreate(name=name, description="Desc", price=10.0, category="Cat")
+
+
+def record_threads(db, *names):
+    """Wrap storage methods so each call records the thread it ran on."""
+    threads = []
+    for name in names:
+        method = getattr(db, name)
+
+        def wrapper(*args, _method=method, **kwargs):
+            threads.append(threading.get_ident())
+            return _method(*args, **kwargs)
+
+        setattr(db, name, wrapper)
+    return threads
+
+
+@pytest.mark.anyio
+class TestAsyncStorage:
+    """Tests for where AsyncStorage runs each call."""
+
+    @pytest.fixture
+    def anyio_backend(self):
+        return "asyncio"
+
+    async def test_in_memory_calls_run_inline(self):
+        """Test that in-memory reads and writes stay on the event loop thread."""
+        db = InMemoryDatabase()
+        threads = record_threads(db, "create_product", "get_product", "query_products")
+
+        created = await db.aio.create_product(product())
+        assert await db.aio.get_product(created.id) == created
+        page, _ = await db.aio.query_products(limit=1)
+        assert len(page) == 1
+        assert threads == [threading.get_ident()] * 3
+
+    async def test_calls_waiting_for_the_lock_leave_the_loop(self):
+        """Test that a call finding the lock taken runs in the threadpool once it is free."""
+        db = InMemoryDatabase()
+        threads = record_threads(db, "query_products", "create_product")
+        db._lock.acquire_write()
+        threading.Timer(0.1, db._lock.release_write).start()
+
+        page, _ = await db.aio.query_products(limit=1)
+        created = await db.aio.create_product(product())
+        assert len(page) == 1
+        # The query tried inline, then again in a worker; the write found the lock free
+        loop = threading.get_ident()
+        assert threads[0] == loop and threads[1] != loop and threads[2] == loop
+        assert await db.aio.get_product(created.id) == created
+
+    async def test_bulk_runs_in_threadpool(self):
+        """Test that bulk batches leave the event loop."""
+        db = InMemoryDatabase()
+        threads = record_threads(db, "bulk_products")
+
+        results = await db.aio.bulk_products([("create", None, product())])
+        assert [r.status for r in results] == [200]
+        assert threads != [threading.get_ident()]
+
+    async def test_full_listings_run_in_threadpool(self):
+        """Test that calls reading every record leave the event loop, paged ones do not."""
+        db = InMemoryDatabase()
+        threads = record_threads(db, "get_all_products", "get_all_users", "query_products")
+
+        assert len(await db.aio.get_all_products()) == 3
+        await db.aio.get_all_users()
+        assert len((await db.aio.query_products(category="Electronics"))[0]) == 1
+        await db.aio.query_products(category="Electronics", limit=10)
+        assert threading.get_ident() not in threads[:3]
+        assert threads[3] == threading.get_ident()
+
+    async def test_synced_writes_run_in_threadpool(self, tmp_path):
+        """Test that writes waiting on an fsync per write are offloaded, reads are not."""
+        db = InMemoryDatabase(persistence=Persistence(str(tmp_path), commit_interval=0))
+        threads = record_threads(db, "create_product", "get_product")
+
+        created = await db.aio.create_product(product())
+        await db.aio.get_product(created.id)
+        assert threads[0] != threading.get_ident()
+        assert threads[1] == threading.get_ident()
+        db.close()
+
+    async def test_sqlite_calls_run_in_threadpool(self, tmp_path):
+        """Test that every SQLite call is offloaded."""
+        db = SQLiteDatabase(str(tmp_path / "products.db"))
+        threads = record_threads(db, "get_all_products", "create_user")
+
+        assert len(await db.aio.get_all_products()) == 3
+        await db.aio.create_user(UserCreate(name="User", email="user@example.com", password="pass"))
+        assert threading.get_ident() not in threads
+        db.close()
+
@@ -0,0 +1,237 @@
+"""Tests for multi-version reads."""
+import pytest
+
+import database
+from columnar import ProductTable
+from database import InMemoryDatabase, ShardedDatabase
+from models import ProductCreate, ProductUpdate, UserCreate, UserUpdate
+from persistence import Persistence
+from versions import VersionLog
+
+
+def product(name="Product"):
+    return ProductCreate(name=name, description="Desc", price=10.0, category="Cat", tags=["tag"])
+
+
+class TestVersionLog:
+    """Tests for VersionLog."""
+
+    def test_changes_since_returns_value_at_version(self):
+        """Test that the earliest write after the pinned version supplies the old value."""
+        log, table = VersionLog(), {}
+        with log.pin() as version:
+            log.record(table, 1, None)
+            log.commit()
+            log.record(table, 1, "first")
+            log.record(table, 2, "other")
+            log.commit()
+            assert log.changes_since(version, table) == {1: None, 2: "other"}
+            assert log.changes_since(version + 1, table) == {1: "first", 2: "other"}
+            assert log.changes_since(version, {}) == {}
+
+    def test_entries_dropped_when_unpinned(self):
+        """Test that undo entries live only as long as a reader needs them."""
+        log, table = VersionLog(), {}
+        log.record(table, 1, None)
+        log.commit()
+        assert not log._entries
+        with log.pin():
+            log.record(table, 1, "old")
+            log.commit()
+            assert len(log._entries) == 1
+        assert not log._entries
+        assert log.version == 2
+
+    def test_uncommitted_lists_pending_writes_newest_first(self):
+        """Test that only writes to the version not yet committed are listed, and kept."""
+        log, table = VersionLog(), {}
+        with log.pin():
+            log.record(table, 1, None)
+            log.commit()
+            log.record(table, 1, "old")
+            log.record(table, 2, None)
+            assert log.uncommitted() == [(table, 2, None), (table, 1, "old")]
+            assert len(log._entries) == 3
+
+
+class TestSnapshotReads:
+    """Tests for listings that run while writes keep landing."""
+
+    @pytest.fixture
+    def db(self):
+        db = InMemoryDatabase()
+        db.clear()
+        for i in range(5):
+            db.create_product(product(f"P{i}"))
+        return db
+
+    def write_during_scan(self, monkeypatch, write):
+        """Run ``write`` after the first product of the next full scan is read."""
+        values = ProductTable.values
+
+        def interrupted(table):
+            for i, record in enumerate(values(table)):
+                if i == 1:
+                    write()
+                yield record
+
+        monkeypatch.setattr(ProductTable, "values", interrupted)
+
+    def test_listing_ignores_writes_made_during_the_scan(self, db, monkeypatch):
+        """Test that updates, deletes and creates during a scan are rolled back."""
+        before = db.get_all_products()
+
+        def write():
+            db.update_product(4, ProductUpdate(name="renamed"))
+            db.delete_product(3)
+            db.delete_product(1)
+            db.create_product(product("new"))
+
+        self.write_during_scan(monkeypatch, write)
+        assert db.get_all_products() == before
+        monkeypatch.undo()
+        assert [p.id for p in db.get_all_products()] == [2, 4, 5, 6]
+        assert db.get_product(4).name == "renamed"
+
+    def test_lazy_listing_undoes_writes_chunk_by_chunk(self, db, monkeypatch):
+        """Test that writes between chunks of a lazy scan are rolled back, before and after its position."""
+        monkeypatch.setattr(database, "SCAN_CHUNK", 2)
+        before = db.get_all_products()
+        products = db.iter_all_products()
+        read = [next(products), next(products), next(products)]
+        db.update_product(1, ProductUpdate(name="renamed"))
+        db.update_product(4, ProductUpdate(name="renamed"))
+        db.delete_product(5)
+        db.create_product(product("new"))
+        assert read + list(products) == before
+        assert not db._versions._entries
+
+    @pytest.mark.parametrize("shards", [1, 3])
+    def test_lazy_listing_reads_nothing_until_iterated(self, shards):
+        """Test that the version is pinned when iteration starts, not when the iterator is made."""
+        db = InMemoryDatabase() if shards == 1 else ShardedDatabase(shards)
+        users = db.iter_all_users()
+        created = db.create_user(UserCreate(name="Late", email="late@example.com", password="secret"))
+        assert list(users) == [created]
+
+    def test_listing_ignores_clear_during_the_scan(self, db, monkeypatch):
+        """Test that a scan keeps reading the tables it started on."""
+        before = db.get_all_products()
+        self.write_during_scan(monkeypatch, lambda: (db.clear(), db.create_product(product("after"))))
+        assert db.get_all_products() == before
+        monkeypatch.undo()
+        assert [p.name for p in db.get_all_products()] == ["after"]
+
+    def test_writes_do_not_wait_for_listings(self, db, monkeypatch):
+        """Test that a write issued mid-scan completes while the scan is paused."""
+        self.write_during_scan(monkeypatch, lambda: db.create_product(product("mid-scan")))
+        db.get_all_products()
+        assert not db._versions._entries
+        assert len(db.products) == 6
+
+
+class TestRecordVersions:
+    """Tests for the version counters behind ETags."""
+
+    @pytest.mark.parametrize("shards", [1, 3])
+    def test_versions_only_grow(self, shards):
+        """Test that writes raise record and collection versions, and clear never lowers them."""
+        db = InMemoryDatabase() if shards == 1 else ShardedDatabase(shards)
+        db.clear()
+        created = db.create_product(product())
+        record, collection = db.record_version("products", created.id), db.collection_version("products")
+        users = db.collection_version("users")
+
+        db.update_product(created.id, ProductUpdate(price=1.0))
+        assert db.record_version("products", created.id) > record
+        assert db.collection_version("products") > collection
+        assert db.collection_version("users") == users
+
+        collection = db.collection_version("products")
+        db.clear()
+        assert db.collection_version("products") > collection
+        assert db.record_version("products", created.id) is None
+        assert db.create_product(product()).id == created.id
+        assert db.record_version("products", created.id) > record
+
+    def test_deletes_drop_record_versions(self):
+        """Test that created and deleted records leave no version entries behind."""
+        db = InMemoryDatabase()
+        db.clear()
+        kept = db.create_product(product())
+        for _ in range(20):
+            db.delete_product(db.create_product(product()).id)
+        user = db.create_user(UserCreate(name="Gone", email="gone@example.com", password="secret"))
+        db.delete_user(user.id)
+        assert set(db._record_versions["products"]) == {kept.id}
+        assert db._record_versions["users"] == {}
+        assert db.record_version("products", kept.id) > 0
+
+
+class TestFailedWrites:
+    """Tests for writes that raise after changing the tables."""
+
+    @pytest.fixture
+    def db(self, tmp_path):
+        db = InMemoryDatabase(persistence=Persistence(str(tmp_path)))
+        db.clear()
+        db.create_product(product("Kept"))
+        db.create_user(UserCreate(name="Kept", email="kept@example.com", password="secret"))
+        yield db
+        db.close()
+
+    @pytest.fixture(params=["log", "index"])
+    def failing(self, request, db, monkeypatch):
+        """Arm the next write to raise: in its last step, or half way through its index changes."""
+        def fail(*args):
+            raise OSError("disk full")
+
+        def arm():
+            if request.param == "log":
+                monkeypatch.setattr(db._persistence, "append", fail)
+            else:
+                # A rebuild swaps in new index objects, which do not fail
+                db._ensure_indexed()
+                monkeypatch.setattr(db._by_price, "add", fail)
+                monkeypatch.setattr(db._by_price, "discard", fail)
+
+        arm.mode = request.param
+        return arm
+
+    def test_failed_writes_are_undone(self, db, failing):
+        """Test that records, indexes and versions are as before each failed write."""
+        kept = db.get_product(1)
+        version = db.collection_version("products"), db.record_version("products", 1)
+        start, generation = db.changes.last_seq, db._index_generation
+        for write in (
+            lambda: db.create_product(product("Lost")),
+            lambda: db.update_product(1, ProductUpdate(price=99.0, tags=["new"])),
+            lambda: db.delete_product(1),
+        ):
+            failing()
+            with pytest.raises(OSError):
+                write()
+            assert db.get_all_products() == [kept]
+            assert (db.collection_version("products"), db.record_version("products", 1)) == version
+        # Only a write that failed part way through its index changes costs a rebuild
+        assert (db._index_generation > generation) == (failing.mode == "index")
+        assert db.query_products(max_price=20.0)[0] == [kept]
+        assert db.query_products(tags=["new"])[0] == []
+        assert db.search_products("kept", 10) == [kept]
+        assert db.changes.last_seq == start
+
+    def test_failed_user_writes_are_undone(self, db, monkeypatch):
+        """Test that the email index forgets a user whose write failed."""
+        def fail(records):
+            raise OSError("disk full")
+        monkeypatch.setattr(db._persistence, "append", fail)
+        version = db.collection_version("users")
+        with pytest.raises(OSError):
+            db.create_user(UserCreate(name="Lost", email="lost@example.com", password="secret"))
+        with pytest.raises(OSError):
+            db.update_user(1, UserUpdate(email="moved@example.com"))
+        assert db.get_user_by_email("lost@example.com") is None
+        assert db.get_user_by_email("moved@example.com") is None
+        assert db.get_user_by_email("kept@example.com").id == 1
+        assert db.get_users_page(10)[0] == db.get_all_users()
+        assert db.collection_version("users") == version
@@ -0,0 +1,92 @@
+"""Multi-version reads over tables that are updated in place."""
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Hashable, Iterator, List, Tuple
+
+
+class VersionLog:
+    """Undo log that lets readers see tables as of a pinned version.
+
+    Every write to the store is one version. Before a writer changes a key
+    it records the value it is about to replace (None for a new key), so
+    a reader that pinned an earlier version can scan the live table
+    without a lock and then undo whatever was written since its pin.
+    Entries are dropped once no reader pins a version older than them.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._version = 0
+        # (version, table, key, previous value), oldest first
+        self._entries: Deque[Tuple[int, Any, Hashable, Any]] = deque()
+        self._pins: Counter = Counter()
+
+    @property
+    def version(self) -> int:
+        """The latest committed version."""
+        return self._version
+
+    def record(self, table: Any, key: Hashable, previous: Any):
+        """Note that the version being written replaces ``previous`` at ``table[key]``.
+
+        Must be called by the single writer before the table is changed.
+        """
+        with self._mutex:
+            self._entries.append((self._version + 1, table, key, previous))
+
+    def commit(self):
+        """Publish the version being written and drop entries no reader needs."""
+        with self._mutex:
+            self._version += 1
+            self._prune()
+
+    def uncommitted(self) -> List[Tuple[Any, Hashable, Any]]:
+        """``(table, key, previous value)`` of each write to the version not yet committed, newest first.
+
+        For undoing a write that failed. The entries stay in the log: they
+        still hold the values as of the last committed version.
+        """
+        pending = []
+        with self._mutex:
+            for entry_version, table, key, value in reversed(self._entries):
+                if entry_version <= self._version:
+                    break
+                pending.append((table, key, value))
+        return pending
+
+    @contextmanager
+    def pin(self) -> Iterator[int]:
+        """Hold the latest committed version so its undo entries are kept."""
+        with self._mutex:
+            version = self._version
+            self._pins[version] += 1
+        try:
+            yield version
+        finally:
+            with self._mutex:
+                self._pins[version] -= 1
+                if not self._pins[version]:
+                    del self._pins[version]
+                self._prune()
+
+    def changes_since(self, version: int, table: Any) -> Dict[Hashable, Any]:
+        """Return ``{key: value at version}`` for keys of ``table`` written after ``version``.
+
+        The value is None for keys that did not exist at ``version``.
+        """
+        previous: Dict[Hashable, Any] = {}
+        with self._mutex:
+            for entry_version, entry_table, key, value in reversed(self._entries):
+                if entry_version <= version:
+                    break
+                if entry_table is table:
+                    # Walking newest first, so the earliest write's value wins
+                    previous[key] = value
+        return previous
+
+    def _prune(self):
+        oldest = min(self._pins) if self._pins else self._version
+        entries = self._entries
+        while entries and entries[0][0] <= oldest:
+            entries.popleft()